@@ -0,0 +1,62 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import pytz
+from async_database import AsyncDatabase
+
+# Paid debts and spent reminders older than this many days leave the working tables
+ARCHIVE_AFTER_DAYS = 90
+# Seconds between archiving runs
+ARCHIVE_INTERVAL = 6 * 60 * 60
+# Rows moved per transaction; the write lock is released between batches
+ARCHIVE_BATCH_SIZE = 500
+# Free pages handed back to the filesystem after each run (4 KiB each)
+VACUUM_PAGES = 2048
+
+def archive_config() -> Dict[str, Any]:
+    """Archiver settings from ARCHIVE_AFTER_DAYS (0 disables) and ARCHIVE_INTERVAL"""
+    return {
+        'after_days': int(os.getenv('ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)),
+        'interval': float(os.getenv('ARCHIVE_INTERVAL', ARCHIVE_INTERVAL)),
+    }
+
+class Archiver:
+    """Moves paid debts and inactive reminders into the history tables in batches.
+
+    Listing and reminder queries only care about unpaid debts and active
+    reminders, so the rows they skip are moved out of their tables once
+    they are `after_days` old. History stays available to /export and
+    /summary. Each run ends with an incremental vacuum so the freed pages
+    shrink the file.
+    """
+
+    def __init__(self, async_db: AsyncDatabase, after_days: int = ARCHIVE_AFTER_DAYS,
+                 batch_size: int = ARCHIVE_BATCH_SIZE, vacuum_pages: int = VACUUM_PAGES):
+        self.async_db = async_db
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.tehran_tz = pytz.timezone('Asia/Tehran')
+
+    async def run(self, today: Optional[str] = None) -> Dict[str, int]:
+        """Archive everything older than the cutoff and return the rows moved and pages freed"""
+        today = today or datetime.now(self.tehran_tz).date().isoformat()
+        before_day = (datetime.fromisoformat(today) - timedelta(days=self.after_days)).date().isoformat()
+        db = self.async_db.db
+        result = {
+            'debts': await self._drain(db.archive_debts, before_day),
+            'reminders': await self._drain(db.archive_reminders, before_day),
+        }
+        result['pages'] = await self.async_db.run(db.incremental_vacuum, self.vacuum_pages)
+        return result
+
+    async def _drain(self, archive, before_day: str) -> int:
+        moved = 0
+        while True:
+            batch = await self.async_db.run(archive, before_day, self.batch_size)
+            moved += batch
+            if batch < self.batch_size:
+                return moved
+            # Let queued handler queries run between batches
+            await asyncio.sleep(0)
@@ -0,0 +1,85 @@
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from database import Database, DeliveryKey
+import metrics
+
+class AsyncDatabase:
+    """Awaitable facade over Database that keeps queries off the event loop.
+
+    Every call is executed on a single dedicated thread, which matches the
+    one shared connection inside Database and keeps writes ordered.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run any blocking callable (e.g. a DebtManager method) on the DB thread"""
+        metrics.count_db_call()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, iterator: Iterator[Any], chunk_size: int = 100) -> AsyncIterator[List[Any]]:
+        """Drive a blocking iterator on the DB thread, yielding its items in chunks"""
+        while True:
+            chunk = await self.run(lambda: list(itertools.islice(iterator, chunk_size)))
+            if not chunk:
+                return
+            yield chunk
+
+    async def add_debt(self, user_id: int, category: str, amount: int, due_date: str,
+                       description: str = "", recurrence: str = "one-time") -> int:
+        return await self.run(self.db.add_debt, user_id, category, amount, due_date,
+                              description, recurrence)
+
+    async def get_active_debts(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_active_debts, user_id)
+
+    async def mark_debt_paid(self, debt_id: int, user_id: int) -> bool:
+        return await self.run(self.db.mark_debt_paid, debt_id, user_id)
+
+    async def pay_debt(self, debt_id: int, user_id: int) -> Tuple[str, Optional[str]]:
+        return await self.run(self.db.pay_debt, debt_id, user_id)
+
+    async def delete_debt(self, debt_id: int, user_id: int) -> bool:
+        return await self.run(self.db.delete_debt, debt_id, user_id)
+
+    async def get_debt_by_id(self, debt_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self.run(self.db.get_debt_by_id, debt_id, user_id)
+
+    async def get_upcoming_debts(self, days_ahead: int = 7, today: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_upcoming_debts, days_ahead, today)
+
+    async def add_reminder(self, user_id: int, title: str, reminder_date: str,
+                           description: str = "") -> int:
+        return await self.run(self.db.add_reminder, user_id, title, reminder_date, description)
+
+    async def get_active_reminders(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_active_reminders, user_id)
+
+    async def get_upcoming_reminders(self, days_ahead: int = 7, today: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_upcoming_reminders, days_ahead, today)
+
+    async def get_next_reminder_day(self) -> Optional[str]:
+        return await self.run(self.db.get_next_reminder_day)
+
+    async def deactivate_reminder(self, reminder_id: int, user_id: int) -> bool:
+        return await self.run(self.db.deactivate_reminder, reminder_id, user_id)
+
+    async def claim_deliveries(self, items: Iterable[Tuple[str, str, str, int]],
+                               lease_seconds: float) -> Set[DeliveryKey]:
+        return await self.run(self.db.claim_deliveries, list(items), lease_seconds)
+
+    async def complete_deliveries(self, sent: Iterable[DeliveryKey],
+                                  failed: Iterable[DeliveryKey] = (),
+                                  reminders: Iterable[Tuple[int, int]] = ()):
+        return await self.run(self.db.complete_deliveries, list(sent), list(failed), list(reminders))
+
+    def close(self):
+        """Wait for queued queries, then close the underlying connection"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
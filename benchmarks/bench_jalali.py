@@ -0,0 +1,54 @@
+"""
+Per-row date formatting cost: the old parse-and-localize path against the
+cached Jalali formatter.
+
+    python -m benchmarks.bench_jalali
+"""
+
+import random
+import time
+from datetime import date, datetime, timedelta
+import pytz
+import jalali
+
+TEHRAN_TZ = pytz.timezone('Asia/Tehran')
+ROWS = 200_000
+DISTINCT_DAYS = 730
+
+def legacy_format_date(date_str: str) -> str:
+    """DebtManager.format_date before the Jalali formatter"""
+    try:
+        date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        if date_obj.tzinfo is None:
+            date_obj = TEHRAN_TZ.localize(date_obj)
+        else:
+            date_obj = date_obj.astimezone(TEHRAN_TZ)
+        return date_obj.strftime('%Y/%m/%d')
+    except:
+        return date_str
+
+def per_row_ns(func, rows) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        func(row)
+    return (time.perf_counter() - start) / len(rows) * 1e9
+
+def main():
+    first = date.today()
+    days = [(first + timedelta(days=i)).isoformat() for i in range(DISTINCT_DAYS)]
+    rows = [random.choice(days) for _ in range(ROWS)]
+
+    jalali.format_date.cache_clear()
+    jalali.parse_day.cache_clear()
+    uncached = per_row_ns(lambda s: '%04d/%02d/%02d' % jalali.to_jalali(date.fromisoformat(s)), rows)
+    results = {
+        'legacy parse+localize': per_row_ns(legacy_format_date, rows),
+        'jalali table, no cache': uncached,
+        'jalali cached': per_row_ns(jalali.format_date, rows),
+    }
+    for name, ns in results.items():
+        print(f"{name:<24} {ns:8.0f} ns/row")
+    print(f"cache: {jalali.format_date.cache_info()}")
+
+if __name__ == '__main__':
+    main()
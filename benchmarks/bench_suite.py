@@ -0,0 +1,352 @@
+"""
+Repeatable benchmark suite for database.py, DebtManager and the daily
+reminder run, reported as JSON.
+
+Every public Database method is timed over a fixed, seeded sample of
+users and debts from a synthetic dataset (see benchmarks.dataset). Methods
+that write run against a scratch copy so the dataset itself never changes.
+DebtManager.get_debts_text is timed for sampled users and for the heaviest
+user, and ReminderService.send_daily_reminders does a full pass against a
+fake bot on a fresh copy per repeat.
+
+    python -m benchmarks.bench_suite --output before.json
+    python -m benchmarks.bench_suite --output after.json --compare before.json
+    python -m benchmarks.bench_suite --users 100000 --debts 2000000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import pytz
+from archive import ARCHIVE_BATCH_SIZE, VACUUM_PAGES
+from async_database import AsyncDatabase
+from database import Database
+from debt_manager import DebtManager
+from delivery import DeliveryQueue
+from reminder_service import DAILY_REMINDER_HOUR, DELIVERY_PURGE_BATCH_SIZE, ReminderService
+from scheduler import FakeClock
+from benchmarks import dataset
+
+# Calls timed per benchmark; full-table scans use SCAN_CALLS
+DEFAULT_CALLS = 200
+SCAN_CALLS = 5
+# Full send_daily_reminders passes, each on a fresh copy of the dataset
+DEFAULT_DAILY_REPEAT = 3
+# Changes smaller than this are reported as noise by --compare
+NOISE_THRESHOLD = 0.10
+# Send rate that never throttles the fake bot
+UNLIMITED_RATE = 1e9
+SEED = 7
+
+class FakeBot:
+    """Accepts every message instantly and counts them"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent += 1
+
+def summarize(samples: Sequence[float]) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    return {
+        'calls': len(ordered),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 4),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 4),
+        'p95_ms': round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 4),
+        'min_ms': round(ordered[0] * 1000, 4),
+        'total_s': round(sum(ordered), 4),
+    }
+
+class Suite:
+    def __init__(self, path: str, spec: Dict[str, Any], calls: int = DEFAULT_CALLS,
+                 daily_repeat: int = DEFAULT_DAILY_REPEAT, only: Optional[str] = None):
+        self.path = path
+        self.spec = spec
+        self.today = spec['today']
+        self.calls = calls
+        self.daily_repeat = daily_repeat
+        self.only = re.compile(only) if only else None
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.rng = random.Random(SEED)
+        self.scratch = tempfile.mkdtemp(prefix='debt-bench-')
+
+    def wanted(self, name: str) -> bool:
+        return self.only is None or bool(self.only.search(name))
+
+    def time_calls(self, name: str, func: Callable, args: Sequence[tuple], consume: bool = False):
+        """Time func(*a) for every a in args; iterators are drained inside the timing"""
+        if not self.wanted(name):
+            return
+        samples = []
+        for call_args in args:
+            start = time.perf_counter()
+            result = func(*call_args)
+            if consume:
+                for _ in result:
+                    pass
+            samples.append(time.perf_counter() - start)
+        self.results[name] = summarize(samples)
+        print(f"  {name:<40} {self.results[name]['mean_ms']:>10.3f} ms", file=sys.stderr)
+
+    def copy(self) -> str:
+        """Fresh scratch copy of the dataset"""
+        path = os.path.join(self.scratch, f'copy-{len(os.listdir(self.scratch))}.db')
+        shutil.copyfile(self.path, path)
+        return path
+
+    def sample(self, db: Database, query: str, count: int, params: tuple = ()) -> List[tuple]:
+        rows = db.conn.execute(query, params).fetchall()
+        return self.rng.sample(rows, min(count, len(rows)))
+
+    def run(self):
+        print(f"dataset: {self.path}", file=sys.stderr)
+        db = Database(self.path)
+        try:
+            self.read_benchmarks(db)
+            self.debt_manager_benchmarks(db)
+        finally:
+            db.close()
+
+        db = Database(self.copy())
+        try:
+            self.write_benchmarks(db)
+        finally:
+            db.close()
+        self.daily_reminders()
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def read_benchmarks(self, db: Database):
+        users = [(user_id,) for user_id in self.rng.sample(dataset.user_ids(self.spec),
+                                                           min(self.calls, self.spec['users']))]
+        debts = self.sample(db, 'SELECT id, user_id FROM debts', self.calls)
+        scans = [(7, self.today)] * SCAN_CALLS
+        cursors = [(user_id, 11, (due_day, debt_id)) for debt_id, user_id, due_day in
+                   self.sample(db, 'SELECT id, user_id, due_day FROM debts WHERE is_paid = FALSE',
+                               self.calls)]
+
+        self.time_calls('db.open', lambda: Database(self.path).close(), [()] * SCAN_CALLS)
+        self.time_calls('db.init_db', db.init_db, [()] * self.calls)
+        self.time_calls('db.get_active_debts', db.get_active_debts, users)
+        self.time_calls('db.get_debts_page', db.get_debts_page, [(user_id, 11) for user_id, in users])
+        self.time_calls('db.get_debts_page[cursor]', db.get_debts_page, cursors)
+        self.time_calls('db.iter_user_debts', db.iter_user_debts, users, consume=True)
+        self.time_calls('db.get_debt_by_id', db.get_debt_by_id, debts)
+        self.time_calls('db.get_upcoming_debts', db.get_upcoming_debts, scans)
+        self.time_calls('db.iter_upcoming_debts_by_user', db.iter_upcoming_debts_by_user, scans,
+                        consume=True)
+        self.time_calls('db.iter_due_keys', db.iter_due_keys, [()] * SCAN_CALLS, consume=True)
+        self.time_calls('db.get_due_keys_after', db.get_due_keys_after,
+                        [(debt_id,) for debt_id, _ in debts[:SCAN_CALLS]])
+        self.time_calls('db.get_due_days', db.get_due_days,
+                        [(user_id, [debt_id]) for debt_id, user_id in debts])
+        self.time_calls('db.get_max_debt_id', db.get_max_debt_id, [()] * self.calls)
+        self.time_calls('db.get_unpaid_debts[1000]', db.get_unpaid_debts,
+                        [([debt_id for debt_id, _ in self.sample(db, 'SELECT id, user_id FROM debts', 1000)],
+                          self.today)] * SCAN_CALLS)
+        self.time_calls('db.get_active_reminders', db.get_active_reminders, users)
+        self.time_calls('db.iter_user_reminders', db.iter_user_reminders, users, consume=True)
+        self.time_calls('db.get_upcoming_reminders', db.get_upcoming_reminders, scans)
+        self.time_calls('db.iter_upcoming_reminders_by_user', db.iter_upcoming_reminders_by_user,
+                        [(1, self.today)] * SCAN_CALLS, consume=True)
+        self.time_calls('db.get_debt_totals', db.get_debt_totals, users)
+        self.time_calls('db.get_unpaid_totals', db.get_unpaid_totals,
+                        [(user_id, self.today[:8] + '01', self.today) for user_id, in users])
+        self.time_calls('db.rebuild_debt_totals', db.rebuild_debt_totals, [(True,)] * SCAN_CALLS)
+        self.time_calls('db.get_next_reminder_day', db.get_next_reminder_day, [()] * self.calls)
+        self.time_calls('db.load_user_data', db.load_user_data, [(0, 10_000)] * self.calls)
+        self.time_calls('db.load_conversations', db.load_conversations, [('add_debt', 0)] * self.calls)
+
+    def debt_manager_benchmarks(self, db: Database):
+        users = [(user_id,) for user_id in self.rng.sample(dataset.user_ids(self.spec),
+                                                           min(self.calls, self.spec['users']))]
+        heaviest = db.conn.execute('''
+            SELECT user_id FROM debts WHERE is_paid = FALSE
+            GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()
+        debt_manager = DebtManager(db)
+        self.time_calls('debt_manager.get_debts_text', debt_manager.get_debts_text, users)
+        self.time_calls('debt_manager.get_summary_text', debt_manager.get_summary_text, users)
+        if heaviest:
+            self.time_calls('debt_manager.get_debts_text[heaviest]', debt_manager.get_debts_text,
+                            [heaviest] * SCAN_CALLS)
+            self.time_calls('debt_manager.get_summary_text[heaviest]', debt_manager.get_summary_text,
+                            [heaviest] * SCAN_CALLS)
+
+    def write_benchmarks(self, db: Database):
+        calls = self.calls
+        users = self.rng.sample(dataset.user_ids(self.spec), min(calls, self.spec['users']))
+        unpaid = 'SELECT id, user_id FROM debts WHERE is_paid = FALSE'
+        recurring = unpaid + " AND rolled_over = FALSE AND recurrence != 'one-time'"
+        # Disjoint targets so every call does real work
+        targets = self.sample(db, unpaid, calls * 4)
+        pay, mark, delete, spare = (targets[i::4] for i in range(4))
+        by_user: Dict[int, List[int]] = {}
+        for debt_id, user_id in spare:
+            by_user.setdefault(user_id, []).append(debt_id)
+        groups = list(by_user.items())
+        reminders = self.sample(db, 'SELECT id, user_id FROM reminders WHERE is_active = TRUE', calls)
+        due = self.today
+        new_rows = [('اجاره', 5_000_000, due, '', 'monthly', False)] * 100
+
+        self.time_calls('db.add_debt', db.add_debt,
+                        [(user_id, 'اجاره', 5_000_000, due, '', 'monthly') for user_id in users])
+        self.time_calls('db.add_debts[100]', db.add_debts, [(user_id, new_rows) for user_id in users])
+        self.time_calls('db.add_reminder', db.add_reminder, [(user_id, 'تولد', due) for user_id in users])
+        self.time_calls('db.add_reminders[100]', db.add_reminders,
+                        [(user_id, [('تولد', due, '', True)] * 100) for user_id in users])
+        self.time_calls('db.pay_debt', db.pay_debt, pay)
+        self.time_calls('db.mark_debt_paid', db.mark_debt_paid, mark)
+        self.time_calls('db.create_next_occurrence', db.create_next_occurrence,
+                        self.sample(db, recurring, calls))
+        self.time_calls('db.delete_debt', db.delete_debt, delete)
+        self.time_calls('db.pay_debts', db.pay_debts, [(user_id, ids) for user_id, ids in groups[::2]])
+        self.time_calls('db.delete_debts', db.delete_debts, [(user_id, ids) for user_id, ids in groups[1::2]])
+        self.time_calls('db.pay_debts_due_by', db.pay_debts_due_by, [(user_id, due) for user_id in users])
+        self.time_calls('db.deactivate_reminder', db.deactivate_reminder, reminders)
+
+        deliveries = [[(f'debt:{debt_id}', due, 'daily', user_id) for debt_id, user_id in
+                       self.sample(db, 'SELECT id, user_id FROM debts', 500)] for _ in range(SCAN_CALLS)]
+        self.time_calls('db.claim_deliveries[500]', db.claim_deliveries,
+                        [(items, 600) for items in deliveries])
+        self.time_calls('db.complete_deliveries[500]', db.complete_deliveries,
+                        [([item[:3] for item in items],) for items in deliveries])
+        # The first call removes the ledger rows written above
+        self.time_calls('db.purge_deliveries', db.purge_deliveries,
+                        [('9999-12-31', DELIVERY_PURGE_BATCH_SIZE)] * SCAN_CALLS)
+        self.time_calls('db.acquire_shards', db.acquire_shards,
+                        [(f'bench-{i % 4}', 16, 60) for i in range(calls)])
+        self.time_calls('db.release_shards', db.release_shards, [(f'bench-{i}',) for i in range(4)])
+
+        states = [[(user_id, '{"debt_category": "اجاره"}') for user_id in users[:100]]] * SCAN_CALLS
+        self.time_calls('db.save_persisted_state[100]', db.save_persisted_state,
+                        [(rows, [], time.time()) for rows in states])
+        self.time_calls('db.purge_persisted_state', db.purge_persisted_state, [(time.time() + 1,)])
+        # Only the first call has lapsed debts to roll over
+        self.time_calls('db.roll_over_debts', db.roll_over_debts, [(due,)])
+        self.time_calls('db.archive_debts', db.archive_debts, [(due, ARCHIVE_BATCH_SIZE)] * SCAN_CALLS)
+        self.time_calls('db.archive_reminders', db.archive_reminders,
+                        [(due, ARCHIVE_BATCH_SIZE)] * SCAN_CALLS)
+        self.time_calls('db.incremental_vacuum', db.incremental_vacuum, [(VACUUM_PAGES,)])
+        self.time_calls('db.enable_incremental_vacuum', db.enable_incremental_vacuum, [()])
+
+    def daily_reminders(self):
+        for name, due_index in (('reminders.send_daily_reminders', False),
+                                ('reminders.send_daily_reminders[due_index]', True)):
+            if self.wanted(name):
+                self._daily_reminders(name, due_index)
+
+    def _daily_reminders(self, name: str, due_index: bool):
+        """Time full daily runs; with due_index the index is loaded before the clock starts"""
+        tehran = pytz.timezone('Asia/Tehran')
+        start = tehran.localize(datetime.combine(date.fromisoformat(self.today),
+                                                 datetime.min.time()) + timedelta(hours=DAILY_REMINDER_HOUR))
+        samples, sent = [], 0
+        for _ in range(self.daily_repeat):
+            async_db = AsyncDatabase(Database(self.copy()))
+            bot = FakeBot()
+            service = ReminderService(bot, async_db, DebtManager(async_db.db), clock=FakeClock(start),
+                                      due_index=due_index)
+            service.delivery = DeliveryQueue(bot, global_rate=UNLIMITED_RATE, per_chat_rate=UNLIMITED_RATE)
+
+            async def run():
+                if due_index:
+                    await service.sync_due_index()
+                began = time.perf_counter()
+                await service.send_daily_reminders()
+                elapsed = time.perf_counter() - began
+                service.delivery.stop()
+                return elapsed
+
+            samples.append(asyncio.run(run()))
+            sent = bot.sent
+            async_db.close()
+        self.results[name] = dict(summarize(samples), messages=sent)
+        print(f"  {name:<40} {self.results[name]['mean_ms']:>10.1f} ms ({sent:,} messages)",
+              file=sys.stderr)
+
+    def missing_methods(self) -> List[str]:
+        """Public Database methods without a benchmark"""
+        covered = {name.split('.')[1].split('[')[0] for name in self.results if name.startswith('db.')}
+        public = {name for name in vars(Database) if not name.startswith('_')
+                  and callable(getattr(Database, name))} - {'close'}
+        return sorted(public - covered)
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """Side-by-side median times of two result files"""
+    lines = [f"{'benchmark':<42} {'before p50':>12} {'after p50':>12} {'change':>8}"]
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        flag = '' if abs(change) < NOISE_THRESHOLD else (' slower' if change > 0 else ' faster')
+        lines.append(f"{name:<42} {before['p50_ms']:>12.3f} {result['p50_ms']:>12.3f} "
+                     f"{change:>+8.1%}{flag}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    dataset.add_arguments(parser)
+    parser.add_argument('--dataset', help='SQLite file to use or create (default: under data/bench/)')
+    parser.add_argument('--calls', type=int, default=DEFAULT_CALLS, help='calls timed per benchmark')
+    parser.add_argument('--daily-repeat', type=int, default=DEFAULT_DAILY_REPEAT,
+                        help='full send_daily_reminders passes')
+    parser.add_argument('--only', help='regular expression selecting benchmarks by name')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    spec = dataset.spec_from_args(args)
+    with contextlib.redirect_stdout(sys.stderr):
+        path = dataset.ensure(spec, args.dataset, progress=True)
+    suite = Suite(path, spec, args.calls, args.daily_repeat, args.only)
+    # Keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        suite.run()
+
+    report = {'environment': environment(), 'dataset': dict(spec, path=path), 'results': suite.results}
+    if not args.only and suite.missing_methods():
+        report['missing'] = suite.missing_methods()
+        print(f"⚠️ Database methods without a benchmark: {', '.join(report['missing'])}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Update-to-reply latency of long-polling against webhook mode.
+
+A local fake Bot API server stands in for Telegram: it answers getUpdates
+(long-polling), records sendMessage calls and can push updates to a
+webhook. Each sample injects one /ping update and measures the time until
+the bot's reply reaches the fake server.
+
+    python -m benchmarks.bench_webhook_latency [samples]
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+import time
+from urllib.parse import parse_qs
+import httpx
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication, RequestHandler
+from telegram.ext import Application, CommandHandler
+
+TOKEN = '123456:FAKE-TOKEN'
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+WEBHOOK_PATH = 'telegram'
+SECRET = 'bench-secret'
+CHAT_ID = 42
+
+class FakeTelegram:
+    """Minimal Bot API: getMe, getUpdates, set/deleteWebhook and sendMessage"""
+
+    def __init__(self):
+        self.updates = []
+        self.new_update = asyncio.Event()
+        self.replies = asyncio.Queue()
+        self.next_id = 1
+
+    def make_update(self) -> dict:
+        update_id = self.next_id
+        self.next_id += 1
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id, 'date': int(time.time()), 'text': '/ping',
+                'chat': {'id': CHAT_ID, 'type': 'private'},
+                'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Bench'},
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+            },
+        }
+
+    async def call(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method in ('setWebhook', 'deleteWebhook'):
+            return True
+        if method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            if not self.updates:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), float(params.get('timeout') or 0))
+                except asyncio.TimeoutError:
+                    pass
+            return self.updates
+        if method == 'sendMessage':
+            self.replies.put_nowait(time.perf_counter())
+            return {'message_id': 1, 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        return True
+
+    def web_app(self) -> WebApplication:
+        api = self
+
+        class Handler(RequestHandler):
+            async def post(self, method):
+                if self.request.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(self.request.body or b'{}')
+                else:
+                    params = {k: v[0].decode() for k, v in self.request.body_arguments.items()}
+                    params.update({k: v[0] for k, v in parse_qs(self.request.query).items()})
+                self.write({'ok': True, 'result': await api.call(method, params)})
+
+        return WebApplication([(rf'/bot{TOKEN}/(\w+)', Handler)])
+
+async def measure(fake: FakeTelegram, samples: int, webhook: bool) -> list:
+    application = (Application.builder().token(TOKEN)
+                   .base_url(f'http://127.0.0.1:{API_PORT}/bot').build())
+
+    async def ping(update, context):
+        await update.message.reply_text('pong')
+
+    application.add_handler(CommandHandler('ping', ping))
+    await application.initialize()
+    await application.start()
+    if webhook:
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=WEBHOOK_PORT, url_path=WEBHOOK_PATH,
+            webhook_url=f'http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}', secret_token=SECRET)
+    else:
+        await application.updater.start_polling(timeout=10)
+
+    latencies = []
+    async with httpx.AsyncClient() as client:
+        if webhook:
+            # Requests without the secret token must be rejected
+            bad = await client.post(f'http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}',
+                                    json=fake.make_update())
+            assert bad.status_code == 403, bad.status_code
+        for _ in range(samples):
+            update = fake.make_update()
+            start = time.perf_counter()
+            if webhook:
+                await client.post(f'http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}', json=update,
+                                  headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+            else:
+                fake.updates.append(update)
+                fake.new_update.set()
+            replied = await asyncio.wait_for(fake.replies.get(), 10)
+            latencies.append((replied - start) * 1000)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return latencies
+
+def summary(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'samples': len(latencies),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'p50_ms': round(latencies[len(latencies) // 2], 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+async def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fake = FakeTelegram()
+    server = HTTPServer(fake.web_app())
+    server.listen(API_PORT, '127.0.0.1')
+    try:
+        results = {
+            'polling': summary(await measure(fake, samples, webhook=False)),
+            'webhook': summary(await measure(fake, samples, webhook=True)),
+        }
+    finally:
+        # Release a getUpdates call still parked on the fake server
+        fake.new_update.set()
+        await asyncio.sleep(0.1)
+        server.stop()
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    asyncio.run(main())
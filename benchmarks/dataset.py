@@ -0,0 +1,189 @@
+"""
+Synthetic dataset generator for the benchmarks.
+
+Fills a SQLite file through the regular Database API with a configurable
+number of users, debts and custom reminders. Debts are spread over users
+with a skew (a few heavy users, many light ones), recurrences follow a
+weighted mix and due dates one of several distributions around `today`.
+The same spec and seed always produce the same rows, and the spec is kept
+next to the file so an existing dataset is reused instead of rebuilt.
+
+    python -m benchmarks.dataset --users 100000 --debts 2000000 --out data/bench/large.db
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from database import Database
+
+DEFAULT_SPEC: Dict[str, Any] = {
+    'users': 10_000,
+    'debts': 200_000,
+    'reminders': 5_000,
+    # Share of each recurrence among generated debts
+    'recurrence_mix': {'one-time': 0.55, 'monthly': 0.35, 'weekly': 0.05, 'yearly': 0.05},
+    # uniform | month-start | near (peaked around today)
+    'due_distribution': 'uniform',
+    'days_before': 60,
+    'days_after': 60,
+    'paid_ratio': 0.3,
+    'active_reminder_ratio': 0.8,
+    # Zipf exponent of debts per user; 0 spreads debts evenly
+    'skew': 0.8,
+    'today': None,
+    'seed': 1,
+}
+DUE_DISTRIBUTIONS = ('uniform', 'month-start', 'near')
+DATA_DIR = os.path.join('data', 'bench')
+# Users whose rows are generated and inserted per step
+USER_BATCH = 1000
+FIRST_USER_ID = 100_000_000
+
+CATEGORIES = ['اجاره', 'قسط وام', 'برق', 'گاز', 'آب', 'اینترنت', 'موبایل', 'شهریه', 'بیمه', 'خرید']
+DESCRIPTIONS = ['', '', '', 'پرداخت اینترنتی', 'قسط ماهانه', 'قبض دوره‌ای', 'بدهی به علی']
+REMINDER_TITLES = ['تمدید بیمه', 'تولد', 'معاینه فنی', 'تمدید اشتراک', 'جلسه بانک']
+
+def make_spec(**overrides: Any) -> Dict[str, Any]:
+    """DEFAULT_SPEC with `overrides` applied and `today` resolved to a date string"""
+    spec = dict(DEFAULT_SPEC)
+    spec.update({key: value for key, value in overrides.items() if value is not None})
+    if spec['due_distribution'] not in DUE_DISTRIBUTIONS:
+        raise ValueError(f"unknown due distribution: {spec['due_distribution']}")
+    spec['today'] = spec['today'] or date.today().isoformat()
+    return spec
+
+def default_path(spec: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:10]
+    return os.path.join(DATA_DIR, f"u{spec['users']}-d{spec['debts']}-{digest}.db")
+
+def user_ids(spec: Dict[str, Any]) -> List[int]:
+    return [FIRST_USER_ID + i for i in range(spec['users'])]
+
+def _debts_per_user(spec: Dict[str, Any], rng: random.Random) -> Counter:
+    weights = [1 / (rank + 1) ** spec['skew'] for rank in range(spec['users'])]
+    # Heavy users are scattered over the id range rather than the lowest ids
+    rng.shuffle(weights)
+    return Counter(rng.choices(range(spec['users']), weights, k=spec['debts']))
+
+def _due_day(spec: Dict[str, Any], today: date, rng: random.Random) -> date:
+    before, after = spec['days_before'], spec['days_after']
+    if spec['due_distribution'] == 'near':
+        offset = round(rng.triangular(-before, after, 0))
+    elif spec['due_distribution'] == 'month-start':
+        # Bills cluster on a few days of the month
+        day = today + timedelta(days=rng.randint(-before, after))
+        try:
+            return day.replace(day=rng.choice((1, 1, 1, 5, 10, 15, 25)))
+        except ValueError:
+            return day
+    else:
+        offset = rng.randint(-before, after)
+    return today + timedelta(days=offset)
+
+def _debt_rows(spec: Dict[str, Any], count: int, today: date,
+               rng: random.Random) -> List[Tuple[str, int, str, str, str, bool]]:
+    recurrences = list(spec['recurrence_mix'])
+    weights = list(spec['recurrence_mix'].values())
+    rows = []
+    for recurrence in rng.choices(recurrences, weights, k=count):
+        rows.append((
+            rng.choice(CATEGORIES),
+            rng.randint(10, 50_000) * 1000,
+            _due_day(spec, today, rng).isoformat(),
+            rng.choice(DESCRIPTIONS),
+            recurrence,
+            rng.random() < spec['paid_ratio'],
+        ))
+    return rows
+
+def _reminder_rows(spec: Dict[str, Any], count: int, today: date,
+                   rng: random.Random) -> List[Tuple[str, str, str, bool]]:
+    return [(rng.choice(REMINDER_TITLES), _due_day(spec, today, rng).isoformat(), '',
+             rng.random() < spec['active_reminder_ratio'])
+            for _ in range(count)]
+
+def _batches(items: List[int], size: int) -> Iterator[List[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def generate(path: str, spec: Dict[str, Any], progress: bool = False) -> Dict[str, Any]:
+    """Create a fresh dataset at `path` and return its spec with row counts"""
+    for suffix in ('', '-wal', '-shm', '.json'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(spec['seed'])
+    today = date.fromisoformat(spec['today'])
+    ids = user_ids(spec)
+    debt_counts = _debts_per_user(spec, rng)
+    reminder_counts = Counter(rng.choices(range(spec['users']), k=spec['reminders']))
+
+    db = Database(path)
+    debts = reminders = 0
+    try:
+        for batch in _batches(list(range(spec['users'])), USER_BATCH):
+            for index in batch:
+                if debt_counts[index]:
+                    debts += db.add_debts(ids[index], _debt_rows(spec, debt_counts[index], today, rng))
+                if reminder_counts[index]:
+                    reminders += db.add_reminders(ids[index],
+                                                  _reminder_rows(spec, reminder_counts[index], today, rng))
+            if progress:
+                print(f"  {batch[-1] + 1:,}/{spec['users']:,} users, {debts:,} debts", flush=True)
+        db.conn.execute('ANALYZE')
+    finally:
+        db.close()
+
+    with open(path + '.json', 'w') as f:
+        json.dump(spec, f, sort_keys=True, indent=2)
+    return dict(spec, rows={'debts': debts, 'reminders': reminders})
+
+def ensure(spec: Dict[str, Any], path: Optional[str] = None, progress: bool = False) -> str:
+    """Path of a dataset matching `spec`, generating it unless an identical one exists"""
+    path = path or default_path(spec)
+    try:
+        with open(path + '.json') as f:
+            if json.load(f) == spec and os.path.exists(path):
+                return path
+    except (OSError, ValueError):
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    generate(path, spec, progress)
+    return path
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Dataset options shared by the generator and the benchmark suite"""
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--debts', type=int)
+    parser.add_argument('--reminders', type=int)
+    parser.add_argument('--recurrence-mix', type=json.loads, dest='recurrence_mix',
+                        help='JSON object, e.g. \'{"one-time": 0.7, "monthly": 0.3}\'')
+    parser.add_argument('--due-distribution', choices=DUE_DISTRIBUTIONS, dest='due_distribution')
+    parser.add_argument('--days-before', type=int, dest='days_before')
+    parser.add_argument('--days-after', type=int, dest='days_after')
+    parser.add_argument('--paid-ratio', type=float, dest='paid_ratio')
+    parser.add_argument('--skew', type=float)
+    parser.add_argument('--today', help='YYYY-MM-DD the due dates are centred on (default: today)')
+    parser.add_argument('--seed', type=int)
+
+def spec_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    return make_spec(**{key: getattr(args, key, None) for key in DEFAULT_SPEC})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--out', help='SQLite file to create (default: under data/bench/)')
+    args = parser.parse_args()
+    spec = spec_from_args(args)
+    path = args.out or default_path(spec)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    result = generate(path, spec, progress=True)
+    print(json.dumps({'path': path, **result}, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
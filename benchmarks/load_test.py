@@ -0,0 +1,361 @@
+"""
+Load test: synthetic Telegram updates replayed through the real BotHandler.
+
+The bot is built with BotHandler.build_application, so every update goes
+through the production handlers, conversations, persistence and database
+layer. Only the Bot API is replaced, by an in-process fake transport that
+answers every call (after an optional simulated network delay).
+
+Virtual users run sessions picked from a weighted mix: /list_debts, the
+six-step /add_debt conversation, inline pay_/delete_ callbacks and the
+two-step /add_reminder conversation. Updates are sent open-loop at a
+target rate; a user waits for its previous update to finish before
+sending the next step of its session. Latency runs from an update's
+scheduled send time until the bot has finished handling it, so a backlog
+shows up as latency instead of being hidden.
+
+Without --rate the rate is stepped up until the bot falls behind, which
+gives the highest sustainable throughput.
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --rate 100 --duration 10 --api-latency 20
+    python -m benchmarks.load_test --mix '{"list": 1, "pay": 1}'
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest, RequestData
+from bot_handler import BotHandler
+from database import Database
+from benchmarks import dataset
+
+TOKEN = '123456:LOAD-TEST'
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Load', 'username': 'load_test_bot'}
+DEFAULT_MIX = {'list': 0.4, 'add_debt': 0.15, 'pay': 0.2, 'delete': 0.1, 'add_reminder': 0.15}
+DEFAULT_DATASET = {'users': 1000, 'debts': 20_000, 'reminders': 500, 'seed': 3}
+DEFAULT_DURATION = 5.0          # seconds per rate step
+DEFAULT_START_RATE = 25.0       # updates per second
+# A step is sustainable if it keeps up with the target rate and stays under the latency goal
+MIN_RATE_RATIO = 0.95
+DEFAULT_P95_GOAL_MS = 500.0
+# Extra refinement steps between the last sustainable and the first failing rate
+REFINE_STEPS = 3
+# Seconds to wait for in-flight updates after a step's last send
+DRAIN_TIMEOUT = 10.0
+SEED = 11
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+
+class FakeBotAPI(BaseRequest):
+    """In-process Bot API: answers every method with a plausible result"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result: Any = BOT_USER
+        elif endpoint in ('sendMessage', 'editMessageText', 'sendDocument'):
+            self._message_id += 1
+            chat_id = int(params.get('chat_id') or 0)
+            result = {'message_id': self._message_id, 'date': int(time.time()), 'from': BOT_USER,
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        elif endpoint == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+class VirtualUser:
+    def __init__(self, user_id: int, debt_ids: List[int]):
+        self.user_id = user_id
+        self.debt_ids = debt_ids
+        self.steps: deque = deque()
+        self.kind = None
+
+class LoadTest:
+    def __init__(self, db_path: str, mix: Dict[str, float], api_latency: float = 0.0,
+                 p95_goal_ms: float = DEFAULT_P95_GOAL_MS):
+        self.mix = mix
+        self.p95_goal_ms = p95_goal_ms
+        self.rng = random.Random(SEED)
+        self.api = FakeBotAPI(api_latency)
+        self.bot_handler = BotHandler(Database(db_path))
+        self.application: Optional[Application] = None
+        self.users: List[VirtualUser] = []
+        self.ready: deque = deque()
+        self.idle: List[VirtualUser] = []
+        self.pending: Dict[int, Tuple[float, str, VirtualUser]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.next_update_id = 1
+        self.errors = 0
+        self.due_date = (date.today() + timedelta(days=10)).isoformat()
+        self._drained = asyncio.Event()
+
+    async def start(self):
+        self.application = self.bot_handler.build_application(TOKEN, request=self.api)
+        # Runs after every other handler group, i.e. once an update is fully handled
+        self.application.add_handler(TypeHandler(Update, self._finished), group=99)
+        self.application.add_error_handler(self._error)
+        await self.application.initialize()
+        await self.application.start()
+
+        rows = self.bot_handler.db.conn.execute(
+            'SELECT user_id, id FROM debts WHERE is_paid = FALSE ORDER BY user_id, id').fetchall()
+        debts: Dict[int, List[int]] = {}
+        for user_id, debt_id in rows:
+            debts.setdefault(user_id, []).append(debt_id)
+        user_ids = self.bot_handler.db.conn.execute(
+            'SELECT DISTINCT user_id FROM debts ORDER BY user_id').fetchall()
+        self.users = [VirtualUser(user_id, debts.get(user_id, [])) for user_id, in user_ids]
+        self.idle = list(self.users)
+
+    async def stop(self):
+        await self.application.stop()
+        await self.application.shutdown()
+        self.bot_handler.async_db.close()
+
+    # Updates
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Load'}
+
+    def _message(self, user_id: int, text: str) -> Dict[str, Any]:
+        message = {'message_id': self.next_update_id, 'date': int(time.time()), 'text': text,
+                   'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id)}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                    'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def _callback(self, user_id: int, data: str) -> Dict[str, Any]:
+        return {'callback_query': {
+            'id': str(self.next_update_id), 'from': self._user(user_id), 'chat_instance': '1',
+            'data': data,
+            'message': {'message_id': self.next_update_id, 'date': int(time.time()), 'text': '📋',
+                        'chat': {'id': user_id, 'type': 'private'}, 'from': BOT_USER},
+        }}
+
+    def _session(self, user: VirtualUser) -> Tuple[str, List[Tuple[str, str]]]:
+        """Pick a session kind from the mix and return its steps as (type, payload)"""
+        kind = self.rng.choices(list(self.mix), list(self.mix.values()))[0]
+        if kind in ('pay', 'delete') and not user.debt_ids:
+            kind = 'list'
+        if kind == 'add_debt':
+            return kind, [('message', '/add_debt'), ('message', 'اجاره'),
+                          ('message', str(self.rng.randint(10, 5000) * 1000)),
+                          ('message', self.due_date), ('message', '-'),
+                          ('callback', self.rng.choice(['recur_one-time', 'recur_monthly']))]
+        if kind == 'add_reminder':
+            return kind, [('message', '/add_reminder'),
+                          ('message', f'تمدید بیمه,{self.due_date},بار آزمون')]
+        if kind in ('pay', 'delete'):
+            debt_id = user.debt_ids.pop(self.rng.randrange(len(user.debt_ids)))
+            return kind, [('callback', f'{kind}_{debt_id}')]
+        return 'list', [('message', '/list_debts')]
+
+    def _next_user(self) -> Optional[VirtualUser]:
+        if self.ready:
+            return self.ready.popleft()
+        if self.idle:
+            user = self.idle.pop(self.rng.randrange(len(self.idle)))
+            user.kind, steps = self._session(user)
+            user.steps.extend(steps)
+            return user
+        return None
+
+    async def _send(self, user: VirtualUser, scheduled: float):
+        step_type, payload = user.steps.popleft()
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        body = (self._message(user.user_id, payload) if step_type == 'message'
+                else self._callback(user.user_id, payload))
+        self.pending[update_id] = (scheduled, user.kind, user)
+        await self.application.update_queue.put(
+            Update.de_json({'update_id': update_id, **body}, self.application.bot))
+
+    async def _finished(self, update: Update, context):
+        scheduled, kind, user = self.pending.pop(update.update_id)
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - scheduled)
+        (self.ready if user.steps else self.idle).append(user)
+        if not self.pending:
+            self._drained.set()
+
+    async def _error(self, update: object, context):
+        self.errors += 1
+        print(f"Error handling update: {context.error}", file=sys.stderr)
+
+    # Steps
+
+    async def run_step(self, rate: float, duration: float) -> Dict[str, Any]:
+        """Send updates at `rate` per second for `duration` seconds and measure them"""
+        self.latencies = {}
+        errors_before = self.errors
+        interval = 1 / rate
+        start = time.perf_counter()
+        sent = skipped = 0
+        next_send = start
+        while next_send < start + duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            user = self._next_user()
+            if user is None:
+                # Every virtual user is waiting on the bot
+                skipped += 1
+            else:
+                await self._send(user, next_send)
+                sent += 1
+            next_send += interval
+        sent_window = time.perf_counter() - start
+
+        self._drained.clear()
+        if self.pending:
+            try:
+                await asyncio.wait_for(self._drained.wait(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = time.perf_counter() - start
+        latencies = [value for values in self.latencies.values() for value in values]
+        completed = len(latencies)
+        result = {
+            'target_rate': round(rate, 1),
+            'sent': sent,
+            'completed': completed,
+            'skipped': skipped,
+            'unfinished': len(self.pending),
+            'errors': self.errors - errors_before,
+            'throughput': round(completed / elapsed, 1),
+            'send_rate': round(sent / sent_window, 1),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': percentile(latencies, 1.0),
+            'by_kind': {kind: {'count': len(values), 'p50_ms': percentile(values, 0.50),
+                               'p95_ms': percentile(values, 0.95), 'p99_ms': percentile(values, 0.99)}
+                        for kind, values in sorted(self.latencies.items())},
+        }
+        result['sustainable'] = (not skipped and not self.pending
+                                 and result['throughput'] >= MIN_RATE_RATIO * rate
+                                 and (result['p95_ms'] or 0) <= self.p95_goal_ms)
+        # Let a backlog from an overloaded step clear before the next one
+        while self.pending:
+            await asyncio.sleep(0.1)
+        print(f"  {rate:8.1f}/s -> {result['throughput']:8.1f}/s  p50 {result['p50_ms']} ms  "
+              f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms"
+              f"{'' if result['sustainable'] else '  (falling behind)'}", file=sys.stderr)
+        return result
+
+    async def find_max_rate(self, start_rate: float, duration: float) -> Dict[str, Any]:
+        """Double the rate until a step is not sustainable, then bisect between the last two"""
+        steps = []
+        good, bad = None, None
+        rate = start_rate
+        while bad is None:
+            step = await self.run_step(rate, duration)
+            steps.append(step)
+            if step['sustainable']:
+                good, rate = step, rate * 2
+            else:
+                bad = step
+        low = good['target_rate'] if good else 0.0
+        high = bad['target_rate']
+        for _ in range(REFINE_STEPS if good else 0):
+            rate = (low + high) / 2
+            step = await self.run_step(rate, duration)
+            steps.append(step)
+            if step['sustainable']:
+                good, low = step, rate
+            else:
+                high = rate
+        return {'max_sustainable_rate': good['target_rate'] if good else None,
+                'at_max': good, 'steps': steps}
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    overrides = {key: value for key, value in (('users', args.users), ('debts', args.debts))
+                 if value is not None}
+    spec = dataset.make_spec(**{**DEFAULT_DATASET, **overrides})
+    with contextlib.redirect_stdout(sys.stderr):
+        source = dataset.ensure(spec, progress=True)
+    scratch = tempfile.mkdtemp(prefix='debt-load-')
+    db_path = os.path.join(scratch, 'load.db')
+    shutil.copyfile(source, db_path)
+
+    test = LoadTest(db_path, args.mix, args.api_latency / 1000, args.p95_goal)
+    await test.start()
+    try:
+        if args.rate:
+            result = {'steps': [await test.run_step(args.rate, args.duration)]}
+        else:
+            result = await test.find_max_rate(args.start_rate, args.duration)
+    finally:
+        await test.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {'dataset': spec, 'mix': args.mix, 'api_latency_ms': args.api_latency,
+            'p95_goal_ms': args.p95_goal, **result}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, help='run a single step at this many updates/s')
+    parser.add_argument('--start-rate', type=float, default=DEFAULT_START_RATE)
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds per step')
+    parser.add_argument('--mix', type=json.loads, default=DEFAULT_MIX,
+                        help=f'JSON weights of session kinds (default: {json.dumps(DEFAULT_MIX)})')
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='simulated Bot API round trip in ms')
+    parser.add_argument('--p95-goal', type=float, default=DEFAULT_P95_GOAL_MS,
+                        help='p95 latency (ms) a sustainable step must stay under')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--debts', type=int)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+    unknown = set(args.mix) - set(DEFAULT_MIX)
+    if unknown:
+        parser.error(f"unknown session kinds: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,18 @@
 import os
 import asyncio
+import signal
+import tempfile
+from typing import Any, Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import BaseRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, ConversationHandler, MessageHandler, filters
 from database import Database
+from async_database import AsyncDatabase
 from debt_manager import DebtManager
-from reminder_service import ReminderService
+from import_export import DebtTransfer, FORMATS, MAX_IMPORT_BYTES, render_import_report
+from persistence import SQLitePersistence, CONVERSATION_TTL, EVICTION_INTERVAL
+from metrics import MetricsExporter, instrument_database, instrument_handlers
+from archive import Archiver
 
 # Conversation states
 ADDING_DEBT_CATEGORY = 1
@@ -14,13 +22,19 @@ ADDING_DEBT_DESCRIPTION = 4
 ADDING_DEBT_RECURRENCE = 5
 EDITING_DEBT = 6
 ADDING_REMINDER = 7
+IMPORTING_FILE = 8
 
 class BotHandler:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db: Optional[Database] = None):
+        self.db = instrument_database(db or Database())
+        self.async_db = AsyncDatabase(self.db)
         self.debt_manager = DebtManager(self.db)
+        self.transfer = DebtTransfer(self.debt_manager)
+        self.persistence = SQLitePersistence(self.async_db)
         self.application = None
         self.reminder_service = None
+        self.archiver: Optional[Archiver] = None
+        self._stop_event: Optional[asyncio.Event] = None
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -30,9 +44,12 @@ class BotHandler:
             "📋 دستورات موجود:\n"
             "/add_debt - اضافه کردن بدهی جدید\n"
             "/list_debts - نمایش لیست بدهی‌ها\n"
+            "/summary - خلاصه بدهی‌ها به تفکیک ماه و دسته‌بندی\n"
             "/pay_debt - پرداخت بدهی\n"
             "/delete_debt - حذف بدهی\n"
             "/add_reminder - اضافه کردن یادآور سفارشی\n"
+            "/export - خروجی CSV/JSON از بدهی‌ها و یادآورها\n"
+            "/import - وارد کردن بدهی‌ها از فایل CSV/JSON\n"
             "/help - راهنمای استفاده\n\n"
             "برای شروع، از دستور /add_debt استفاده کنید."
         )
@@ -51,12 +68,17 @@ class BotHandler:
             "   ۵. نوع تکرار (یک بار، ماهانه، هفتگی، سالانه)\n\n"
             "🔸 /list_debts - نمایش تمام بدهی‌های فعال\n"
             "   مرتب شده بر اساس تاریخ سررسید\n\n"
-            "🔸 /pay_debt <شناسه> - علامت‌گذاری بدهی به عنوان پرداخت شده\n"
-            "   مثال: /pay_debt 1\n\n"
-            "🔸 /delete_debt <شناسه> - حذف بدهی\n"
-            "   مثال: /delete_debt 1\n\n"
+            "🔸 /summary - جمع بدهی، پرداخت‌شده و معوق این ماه\n"
+            "   به تفکیک دسته‌بندی، همراه با ماه‌های قبل و بعد\n\n"
+            "🔸 /pay_debt <شناسه‌ها> - علامت‌گذاری بدهی به عنوان پرداخت شده\n"
+            "   مثال: /pay_debt 1 یا /pay_debt 3 5 8-12\n\n"
+            "🔸 /delete_debt <شناسه‌ها> - حذف بدهی\n"
+            "   مثال: /delete_debt 1 یا /delete_debt 3 5 8-12\n\n"
             "🔸 /add_reminder - اضافه کردن یادآور سفارشی\n"
             "   برای رویدادهای غیر بدهی\n\n"
+            "🔸 /export [csv|json] - دریافت فایل بدهی‌ها و یادآورها\n\n"
+            "🔸 /import - وارد کردن بدهی‌ها از فایل CSV یا JSON Lines\n"
+            "   مناسب برای انتقال از صفحه‌گسترده\n\n"
             "🔸 /cancel - لغو عملیات جاری\n\n"
             "📅 یادآورهای خودکار:\n"
             "• ۷ روز قبل از سررسید\n"
@@ -206,7 +228,11 @@ class BotHandler:
         description = context.user_data.get('debt_description', '')
         
         try:
-            result = self.debt_manager.add_debt(user_id, category, amount, due_date, description, recurrence)
+            result, debt_id = await self.async_db.run(
+                self.debt_manager.create_debt, user_id, category, amount, due_date, description, recurrence
+            )
+            if self.reminder_service and debt_id is not None:
+                self.reminder_service.notify_debt_added(user_id, debt_id, due_date)
             
             # Clear user data
             context.user_data.clear()
@@ -238,64 +264,81 @@ class BotHandler:
         return ConversationHandler.END
 
     async def list_debts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """List all active debts"""
+        """List the first page of active debts"""
         user_id = update.effective_user.id
-        text = self.debt_manager.get_debts_text(user_id)
+        page = await self.async_db.run(self.debt_manager.get_debts_page, user_id)
+        await update.message.reply_text(page['text'], reply_markup=self.debts_page_keyboard(page))
 
-        # Create inline keyboard for actions
-        keyboard = []
-        debts = self.db.get_active_debts(user_id)
+    async def summary(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show owed, paid and overdue totals per month and category"""
+        user_id = update.effective_user.id
+        text = await self.async_db.run(self.debt_manager.get_summary_text, user_id)
+        await update.message.reply_text(text)
 
+    def debts_page_keyboard(self, page: dict):
+        """Pay/delete buttons for a page of debts plus Prev/Next navigation"""
+        keyboard = []
+        debts = page['debts']
+
+        # Group debts in pairs for keyboard
+        for i in range(0, len(debts), 2):
+            row = []
+            for debt in debts[i:i + 2]:
+                row.append(InlineKeyboardButton(
+                    f"پرداخت {debt['id']}",
+                    callback_data=f"pay_{debt['id']}"
+                ))
+                row.append(InlineKeyboardButton(
+                    f"حذف {debt['id']}",
+                    callback_data=f"delete_{debt['id']}"
+                ))
+            keyboard.append(row)
+
+        navigation = []
+        if page['prev']:
+            due_day, debt_id = page['prev']
+            navigation.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"list_prev_{due_day}_{debt_id}"))
+        if page['next']:
+            due_day, debt_id = page['next']
+            navigation.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"list_next_{due_day}_{debt_id}"))
+        if navigation:
+            keyboard.append(navigation)
         if debts:
-            # Group debts in pairs for keyboard
-            for i in range(0, len(debts), 2):
-                row = []
-                for j in range(2):
-                    if i + j < len(debts):
-                        debt = debts[i + j]
-                        row.append(InlineKeyboardButton(
-                            f"پرداخت {debt['id']}",
-                            callback_data=f"pay_{debt['id']}"
-                        ))
-                        row.append(InlineKeyboardButton(
-                            f"حذف {debt['id']}",
-                            callback_data=f"delete_{debt['id']}"
-                        ))
-                if row:
-                    keyboard.append(row)
-
-        reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-        await update.message.reply_text(text, reply_markup=reply_markup)
+            keyboard.append([InlineKeyboardButton("💸 پرداخت همه بدهی‌های این ماه", callback_data="payall_month")])
+
+        return InlineKeyboardMarkup(keyboard) if keyboard else None
 
     async def pay_debt(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Mark a debt as paid"""
+        """Mark one or more debts as paid"""
         user_id = update.effective_user.id
 
         if not context.args:
-            await update.message.reply_text("❌ لطفاً شناسه بدهی را وارد کنید.\nمثال: /pay_debt 1")
+            await update.message.reply_text("❌ لطفاً شناسه بدهی را وارد کنید.\nمثال: /pay_debt 1 یا /pay_debt 3 5 8-12")
             return
 
-        try:
-            debt_id = int(context.args[0])
-            result = self.debt_manager.mark_paid(debt_id, user_id)
-            await update.message.reply_text(result)
-        except ValueError:
-            await update.message.reply_text("❌ شناسه بدهی باید عدد باشد.")
+        debt_ids, error = self.debt_manager.parse_debt_ids(context.args)
+        if error:
+            await update.message.reply_text(f"❌ {error}")
+            return
+
+        result = await self.async_db.run(self.debt_manager.mark_paid_many, debt_ids, user_id)
+        await update.message.reply_text(result)
 
     async def delete_debt(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Delete a debt"""
+        """Delete one or more debts"""
         user_id = update.effective_user.id
 
         if not context.args:
-            await update.message.reply_text("❌ لطفاً شناسه بدهی را وارد کنید.\nمثال: /delete_debt 1")
+            await update.message.reply_text("❌ لطفاً شناسه بدهی را وارد کنید.\nمثال: /delete_debt 1 یا /delete_debt 3 5 8-12")
             return
 
-        try:
-            debt_id = int(context.args[0])
-            result = self.debt_manager.delete_debt(debt_id, user_id)
-            await update.message.reply_text(result)
-        except ValueError:
-            await update.message.reply_text("❌ شناسه بدهی باید عدد باشد.")
+        debt_ids, error = self.debt_manager.parse_debt_ids(context.args)
+        if error:
+            await update.message.reply_text(f"❌ {error}")
+            return
+
+        result = await self.async_db.run(self.debt_manager.delete_many, debt_ids, user_id)
+        await update.message.reply_text(result)
 
     async def add_reminder_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start adding a custom reminder"""
@@ -331,7 +374,9 @@ class BotHandler:
             from datetime import datetime
             datetime.fromisoformat(reminder_date)
 
-            reminder_id = self.db.add_reminder(user_id, title, reminder_date, description)
+            reminder_id = await self.async_db.add_reminder(user_id, title, reminder_date, description)
+            if self.reminder_service:
+                self.reminder_service.notify_reminder_added(reminder_date)
             await update.message.reply_text(f"✅ یادآور سفارشی اضافه شد.\nشناسه: {reminder_id}")
 
         except ValueError:
@@ -341,6 +386,69 @@ class BotHandler:
 
         return ConversationHandler.END
 
+    async def export_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Send the user's debts and reminders as a CSV or JSON Lines file"""
+        user_id = update.effective_user.id
+        fmt = FORMATS.get(context.args[0].lower() if context.args else 'csv')
+        if fmt is None:
+            await update.message.reply_text("❌ فرمت نامعتبر است. از csv یا json استفاده کنید.\nمثال: /export json")
+            return
+
+        # Rows are streamed from the database into a temporary file
+        with tempfile.TemporaryFile() as out:
+            count = await self.async_db.run(self.transfer.export, user_id, out, fmt)
+            if not count:
+                await update.message.reply_text("📝 داده‌ای برای خروجی گرفتن ندارید.")
+                return
+            out.seek(0)
+            await update.message.reply_document(
+                document=out,
+                filename=f"debts.{fmt}",
+                caption=f"📤 خروجی {count:,} ردیف"
+            )
+
+    async def import_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask for a CSV or JSON Lines file to import"""
+        await update.message.reply_text(
+            "📥 وارد کردن بدهی‌ها و یادآورها\n\n"
+            "لطفاً یک فایل CSV یا JSON Lines (با پسوند .csv یا .json/.jsonl) ارسال کنید.\n\n"
+            "ستون‌های فایل CSV:\n"
+            "category,amount,due_date,description,recurrence\n\n"
+            "نکات:\n"
+            "• تاریخ: YYYY-MM-DD\n"
+            "• recurrence: one-time، monthly، weekly یا yearly (اختیاری)\n"
+            "• فایل خروجی /export را هم می‌توانید دوباره وارد کنید\n\n"
+            "برای لغو عملیات از /cancel استفاده کنید."
+        )
+        return IMPORTING_FILE
+
+    async def import_process(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Import the uploaded file and reply with a row-level report"""
+        user_id = update.effective_user.id
+        document = update.message.document
+        extension = os.path.splitext(document.file_name or '')[1].lstrip('.').lower()
+        fmt = FORMATS.get(extension)
+        if fmt is None:
+            await update.message.reply_text("❌ فقط فایل‌های .csv ،.json و .jsonl پشتیبانی می‌شوند. لطفاً دوباره ارسال کنید:")
+            return IMPORTING_FILE
+        if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+            await update.message.reply_text("❌ حجم فایل بیش از ۲۰ مگابایت است.")
+            return ConversationHandler.END
+
+        try:
+            with tempfile.TemporaryFile() as data:
+                telegram_file = await document.get_file()
+                await telegram_file.download_to_memory(out=data)
+                data.seek(0)
+                result = await self.async_db.run(self.transfer.import_file, user_id, data, fmt)
+            if self.reminder_service and result['next_reminder_date']:
+                self.reminder_service.notify_reminder_added(result['next_reminder_date'])
+            await update.message.reply_text(render_import_report(result))
+        except Exception as e:
+            await update.message.reply_text(f"❌ خطا در وارد کردن فایل: {str(e)}")
+
+        return ConversationHandler.END
+
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle inline keyboard button presses"""
         query = update.callback_query
@@ -349,14 +457,25 @@ class BotHandler:
         user_id = query.from_user.id
         data = query.data
 
-        if data.startswith("pay_"):
+        if data.startswith("list_"):
+            # list_<prev|next>_<due_day>_<id>: turn the page in place
+            _, direction, due_day, debt_id = data.split("_")
+            page = await self.async_db.run(self.debt_manager.get_debts_page, user_id,
+                                           (due_day, int(debt_id)), direction == "prev")
+            await query.edit_message_text(page['text'], reply_markup=self.debts_page_keyboard(page))
+
+        elif data == "payall_month":
+            result = await self.async_db.run(self.debt_manager.pay_this_month, user_id)
+            await query.edit_message_text(f"{query.message.text}\n\n{result}")
+
+        elif data.startswith("pay_"):
             debt_id = int(data.split("_")[1])
-            result = self.debt_manager.mark_paid(debt_id, user_id)
+            result = await self.async_db.run(self.debt_manager.mark_paid, debt_id, user_id)
             await query.edit_message_text(f"{query.message.text}\n\n{result}")
 
         elif data.startswith("delete_"):
             debt_id = int(data.split("_")[1])
-            result = self.debt_manager.delete_debt(debt_id, user_id)
+            result = await self.async_db.run(self.debt_manager.delete_debt, debt_id, user_id)
             await query.edit_message_text(f"{query.message.text}\n\n{result}")
 
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -364,14 +483,29 @@ class BotHandler:
         await update.message.reply_text("❌ عملیات لغو شد.")
         return ConversationHandler.END
 
+    async def evict_conversation_state(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodically drop abandoned conversation data from memory and the database"""
+        evicted = await self.persistence.evict(context.application)
+        if evicted:
+            print(f"Evicted conversation data of {evicted} users")
+
+    async def archive_history(self, context: ContextTypes.DEFAULT_TYPE):
+        """Periodically move old paid debts and spent reminders into the history tables"""
+        result = await self.archiver.run()
+        if result['debts'] or result['reminders']:
+            print(f"Archived {result['debts']} debts and {result['reminders']} reminders "
+                  f"({result['pages']} pages freed)")
+
     def setup_handlers(self):
         """Setup all command and conversation handlers"""
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("list_debts", self.list_debts))
+        self.application.add_handler(CommandHandler("summary", self.summary))
         self.application.add_handler(CommandHandler("pay_debt", self.pay_debt))
         self.application.add_handler(CommandHandler("delete_debt", self.delete_debt))
+        self.application.add_handler(CommandHandler("export", self.export_data))
 
         # Conversation handlers
         add_debt_conv = ConversationHandler(
@@ -384,6 +518,9 @@ class BotHandler:
                 ADDING_DEBT_RECURRENCE: [CallbackQueryHandler(self.add_debt_recurrence, pattern="^recur_")],
             },
             fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="add_debt",
+            persistent=True,
+            conversation_timeout=CONVERSATION_TTL,
         )
 
         add_reminder_conv = ConversationHandler(
@@ -392,41 +529,125 @@ class BotHandler:
                 ADDING_REMINDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.add_reminder_process)],
             },
             fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="add_reminder",
+            persistent=True,
+            conversation_timeout=CONVERSATION_TTL,
+        )
+
+        import_conv = ConversationHandler(
+            entry_points=[CommandHandler("import", self.import_start)],
+            states={
+                IMPORTING_FILE: [MessageHandler(filters.Document.ALL, self.import_process)],
+            },
+            fallbacks=[CommandHandler("cancel", self.cancel)],
+            name="import",
+            persistent=True,
+            conversation_timeout=CONVERSATION_TTL,
         )
 
         self.application.add_handler(add_debt_conv)
         self.application.add_handler(add_reminder_conv)
+        self.application.add_handler(import_conv)
 
         # Callback query handler for inline buttons
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
 
-    async def run_bot(self, token: str):
-        """Run the bot"""
-        self.application = Application.builder().token(token).build()
-        self.reminder_service = ReminderService(self.application.bot, self.db, self.debt_manager)
+    def build_application(self, token: str, request: Optional[BaseRequest] = None,
+                          archive: Optional[Dict[str, Any]] = None) -> Application:
+        """Create the Application with persistence, jobs and all handlers.
+
+        `request` replaces the HTTP transport to the Bot API (e.g. a fake
+        one for load tests). `archive` holds the Archiver settings
+        (after_days, interval); archiving is off without it or with
+        after_days = 0.
+        """
+        builder = Application.builder().token(token).persistence(self.persistence)
+        if request is not None:
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
+        self.application.job_queue.run_repeating(self.evict_conversation_state, EVICTION_INTERVAL,
+                                                 first=EVICTION_INTERVAL)
+        if archive and archive['after_days'] > 0:
+            self.archiver = Archiver(self.async_db, archive['after_days'])
+            self.application.job_queue.run_repeating(self.archive_history, archive['interval'],
+                                                     first=archive['interval'])
 
         self.setup_handlers()
-
-        # Start reminder service
+        instrument_handlers(self.application)
+        return self.application
+
+    def start_reminder_service(self, due_index: bool = False):
+        """Create the reminder service and start its scheduler"""
+        # Imported here so a bot that leaves reminders to worker.py never loads it
+        from reminder_service import ReminderService
+        self.reminder_service = ReminderService(self.application.bot, self.async_db, self.debt_manager,
+                                                due_index=due_index)
         self.reminder_service.start_scheduler()
 
+    async def run_bot(self, token: str, run_scheduler: bool = True,
+                      webhook: Optional[Dict[str, Any]] = None,
+                      metrics: Optional[Dict[str, Any]] = None,
+                      archive: Optional[Dict[str, Any]] = None, due_index: bool = False):
+        """Run the bot until stop() is called or SIGINT/SIGTERM arrives.
+
+        Updates are long-polled unless `webhook` is given, in which case they
+        are pushed by Telegram to a local HTTP listener; its keys (listen,
+        port, url_path, webhook_url, secret_token) are passed to
+        Updater.start_webhook. With run_scheduler=False reminders are left
+        to worker.py. `metrics` holds the MetricsExporter settings (host,
+        port, log_interval) and `archive` the Archiver settings. due_index
+        makes the reminder service find due debts in memory (see DueIndex).
+        """
+        self.build_application(token, archive=archive)
+        exporter = MetricsExporter(**(metrics or {}))
+
+        # The reminder service is only built when this process sends reminders
+        if run_scheduler:
+            self.start_reminder_service(due_index)
+
+        self._stop_event = asyncio.Event()
+        self._install_signal_handlers()
+
         print("🤖 ربات یادآور بدهی شروع به کار کرد...")
         try:
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling()
-            
+            await exporter.start()
+            if webhook:
+                await self.application.updater.start_webhook(**webhook)
+                print(f"🌐 دریافت به‌روزرسانی‌ها از طریق webhook روی پورت {webhook.get('port')}")
+            else:
+                await self.application.updater.start_polling()
+
             # Keep the bot running
-            while True:
-                await asyncio.sleep(1)
+            await self._stop_event.wait()
+            print("\n🛑 ربات متوقف شد.")
         except KeyboardInterrupt:
             print("\n🛑 ربات متوقف شد.")
         finally:
+            # Stop taking updates first, then let in-flight handlers finish
+            if self.application.updater.running:
+                await self.application.updater.stop()
+            if self.application.running:
+                await self.application.stop()
             # Stop reminder service
             if self.reminder_service:
                 self.reminder_service.stop_scheduler()
-            # Properly shutdown the application
-            if self.application:
-                await self.application.updater.stop()
-                await self.application.stop()
-                await self.application.shutdown()
+            await self.application.shutdown()
+            await exporter.stop()
+            # Drain pending queries, flush the WAL and release the connection
+            self.async_db.close()
+
+    def stop(self):
+        """Ask a running run_bot() to shut down gracefully"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def _install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not supported on this platform or outside the main thread
+                pass
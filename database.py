@@ -1,74 +1,172 @@
 import sqlite3
+import itertools
+import json
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Iterable, Sequence, Set, Tuple
 import pytz
+import jalali
+import migrations
+
+# Connection tuning applied once when the connection is opened
+CACHE_SIZE_KIB = 8192            # page cache (negative cache_size means KiB)
+MMAP_SIZE = 64 * 1024 * 1024     # memory-mapped I/O window
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 128       # prepared statements kept per connection
+
+# Rows fetched per keyset page when streaming reminder candidates
+STREAM_PAGE_SIZE = 1000
+
+# Next due day of a recurring debt row. Months and years are clamped to the
+# last day of the target month and otherwise land on recurrence_day.
+NEXT_DUE_DAY_SQL = '''
+    CASE recurrence
+        WHEN 'weekly' THEN date(due_day, '+7 days')
+        WHEN 'monthly' THEN date(due_day, 'start of month', '+1 month',
+            '+' || (MIN(recurrence_day, CAST(strftime('%d', date(due_day, 'start of month', '+2 months', '-1 day')) AS INTEGER)) - 1) || ' days')
+        WHEN 'yearly' THEN date(due_day, 'start of month', '+12 months',
+            '+' || (MIN(recurrence_day, CAST(strftime('%d', date(due_day, 'start of month', '+13 months', '-1 day')) AS INTEGER)) - 1) || ' days')
+    END
+'''
+# Upper bound on periods a lapsed series is advanced in one rollover
+MAX_ROLLOVER_STEPS = 400
+
+# (target, occurrence_day, stage) identifying one reminder delivery
+DeliveryKey = Tuple[str, str, str]
+# (shard_count, shards) restricting a query to users whose shard is listed
+ShardFilter = Tuple[int, Sequence[int]]
+# (due_day, id) position of a debt in a user's due-date ordered list
+DebtCursor = Tuple[str, int]
+
+def stored_day(value: str) -> str:
+    """YYYY-MM-DD (Tehran) day of a date or datetime string, as kept in due_day and reminder_day"""
+    day = jalali.parse_day(value)
+    if day is None:
+        raise ValueError(f"invalid date: {value!r}")
+    return day.isoformat()
+
+# Outcomes of pay_debt
+DEBT_PAID = 'paid'
+DEBT_ALREADY_PAID = 'already_paid'
+DEBT_NOT_FOUND = 'not_found'
+# Recurrences that roll forward to a next occurrence
+RECURRING = ('weekly', 'monthly', 'yearly')
+
+# Columns copied unchanged when rows move into the history tables
+DEBT_COLUMNS = ('id, user_id, category, amount, due_date, description, recurrence, is_paid, '
+                'created_at, paid_at, due_day, recurrence_day, rolled_over')
+REMINDER_COLUMNS = 'id, user_id, title, description, reminder_date, is_active, created_at, reminder_day'
+# PRAGMA auto_vacuum value of INCREMENTAL mode
+AUTO_VACUUM_INCREMENTAL = 2
 
 class Database:
     def __init__(self, db_path: str = 'data/debts.db'):
         self.db_path = db_path
         self.tehran_tz = pytz.timezone('Asia/Tehran')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
         # Ensure data directory exists
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
         self.init_db()
 
-    def init_db(self):
-        """Initialize database tables"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    def _connect(self) -> sqlite3.Connection:
+        """Open the shared connection and apply the tuning pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        # Only takes effect while the file is still empty; existing files
+        # need enable_incremental_vacuum()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        return conn
 
-            # Create debts table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS debts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    category TEXT NOT NULL,
-                    amount INTEGER NOT NULL,
-                    due_date TEXT NOT NULL,
-                    description TEXT,
-                    recurrence TEXT DEFAULT 'one-time',
-                    is_paid BOOLEAN DEFAULT FALSE,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    paid_at TEXT
-                )
-            ''')
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The long-lived connection, opened on first use"""
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._connect()
+        return self._conn
 
-            # Create reminders table for custom reminders
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    reminder_date TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    @contextmanager
+    def _cursor(self) -> Iterator[sqlite3.Cursor]:
+        """Yield a cursor inside a transaction on the shared connection.
+
+        Access is serialized with a lock so the connection can be used from
+        any thread; the transaction is committed on success and rolled back
+        on error.
+        """
+        with self._lock:
+            conn = self.conn
+            cursor = conn.cursor()
+            try:
+                with conn:
+                    yield cursor
+            finally:
+                cursor.close()
 
-            conn.commit()
+    def close(self):
+        """Checkpoint the WAL and close the shared connection"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.execute('PRAGMA optimize')
+                    self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                finally:
+                    self._conn.close()
+                    self._conn = None
+
+    def init_db(self):
+        """Bring the schema up to date by applying pending migrations"""
+        with self._lock:
+            migrations.migrate(self.conn)
 
     def add_debt(self, user_id: int, category: str, amount: int, due_date: str,
                  description: str = "", recurrence: str = "one-time") -> int:
         """Add a new debt to the database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        due_day = stored_day(due_date)
+        with self._cursor() as cursor:
             cursor.execute('''
-                INSERT INTO debts (user_id, category, amount, due_date, description, recurrence)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, category, amount, due_date, description, recurrence))
-            conn.commit()
+                INSERT INTO debts (user_id, category, amount, due_date, description, recurrence,
+                                   due_day, recurrence_day)
+                VALUES (?, ?, ?, ?, ?, ?, ?, CAST(strftime('%d', ?) AS INTEGER))
+            ''', (user_id, category, amount, due_date, description, recurrence, due_day, due_day))
             return cursor.lastrowid
 
+    def add_debts(self, user_id: int, debts: Iterable[Tuple[str, int, str, str, str, bool]]) -> int:
+        """Insert (category, amount, due_date, description, recurrence, is_paid) rows in one transaction"""
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO debts (user_id, category, amount, due_date, description, recurrence,
+                                   is_paid, rolled_over, due_day, recurrence_day)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CAST(strftime('%d', ?) AS INTEGER))
+            ''', [(user_id, category, amount, due_date, description, recurrence, is_paid, is_paid,
+                   due_day, due_day)
+                  for category, amount, due_date, description, recurrence, is_paid in debts
+                  for due_day in (stored_day(due_date),)])
+            return cursor.rowcount
+
     def get_active_debts(self, user_id: int) -> List[Dict[str, Any]]:
         """Get all active (unpaid) debts for a user, sorted by due date"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 SELECT id, category, amount, due_date, description, recurrence
                 FROM debts
                 WHERE user_id = ? AND is_paid = FALSE
-                ORDER BY due_date ASC
+                ORDER BY due_day ASC, id ASC
             ''', (user_id,))
             rows = cursor.fetchall()
 
@@ -84,33 +182,310 @@ class Database:
                 })
             return debts
 
+    def get_debts_page(self, user_id: int, limit: int, cursor: Optional[DebtCursor] = None,
+                       backward: bool = False) -> List[Dict[str, Any]]:
+        """Get up to `limit` active debts after (or, backward, before) a (due_day, id) cursor.
+
+        Rows are always returned in (due_day, id) order. Seeking on the
+        cursor instead of using OFFSET keeps every page as cheap as the first.
+        """
+        condition = ''
+        params: List[Any] = [user_id]
+        if cursor is not None:
+            condition = 'AND (due_day, id) < (?, ?)' if backward else 'AND (due_day, id) > (?, ?)'
+            params.extend(cursor)
+        order = 'DESC' if backward else 'ASC'
+        params.append(limit)
+        with self._cursor() as db_cursor:
+            db_cursor.execute(f'''
+                SELECT id, category, amount, due_date, description, recurrence, due_day
+                FROM debts
+                WHERE user_id = ? AND is_paid = FALSE {condition}
+                ORDER BY due_day {order}, id {order}
+                LIMIT ?
+            ''', params)
+            columns = [column[0] for column in db_cursor.description]
+            debts = [dict(zip(columns, row)) for row in db_cursor.fetchall()]
+        if backward:
+            debts.reverse()
+        return debts
+
+    def iter_user_debts(self, user_id: int, page_size: int = STREAM_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Stream all of a user's debts, unpaid first, each in due date order, then archived ones"""
+        query = '''
+            SELECT is_paid, due_day, id, category, amount, due_date, description, recurrence
+            FROM {table}
+            WHERE user_id = ? AND (is_paid, due_day, id) > (?, ?, ?)
+            ORDER BY is_paid, due_day, id
+            LIMIT ?
+        '''
+        return itertools.chain(*(self._iter_keyset(query.format(table=table), (user_id,), page_size)
+                                 for table in ('debts', 'debts_history')))
+
+    def _iter_keyset(self, query: str, params: Tuple, page_size: int) -> Iterator[Dict[str, Any]]:
+        """Stream `query` page by page as dicts.
+
+        Like _iter_user_groups, the first three selected columns are the
+        keyset and the last four parameters its row-value bound and LIMIT.
+        """
+        last = (-2 ** 63, '', -1)
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute(query, (*params, *last, page_size))
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchmany(page_size)
+            for row in rows:
+                yield dict(zip(columns, row))
+            if len(rows) < page_size:
+                break
+            last = rows[-1][:3]
+
+    def get_debt_totals(self, user_id: int) -> List[Dict[str, Any]]:
+        """Get a user's debt totals per Jalali month (YYYY/MM) and category.
+
+        Reads the trigger-maintained debt_totals table, so the cost depends
+        on the number of months and categories, not on the number of debts.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT month, category, unpaid_count, unpaid_amount, paid_count, paid_amount
+                FROM debt_totals
+                WHERE user_id = ?
+                ORDER BY month, category
+            ''', (user_id,))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_unpaid_totals(self, user_id: int, first_day: str, before_day: str) -> List[Dict[str, Any]]:
+        """Count and sum a user's unpaid debts due in [first_day, before_day) per category"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT category, COUNT(*) AS count, SUM(amount) AS amount
+                FROM debts
+                WHERE user_id = ? AND is_paid = FALSE AND due_day >= ? AND due_day < ?
+                GROUP BY category
+            ''', (user_id, first_day, before_day))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def rebuild_debt_totals(self, check_only: bool = False) -> int:
+        """Recompute debt_totals from live and archived debts and return how many rows differed.
+
+        With check_only the table is compared but left as it is. The
+        comparison and the rebuild run in one IMMEDIATE transaction, so no
+        write can slip in between.
+        """
+        fresh = f'''
+            SELECT user_id, {migrations.DEBT_MONTH_SQL.format(day='due_day')} AS month, category,
+                   SUM(CASE WHEN is_paid THEN 0 ELSE 1 END) AS unpaid_count,
+                   SUM(CASE WHEN is_paid THEN 0 ELSE amount END) AS unpaid_amount,
+                   SUM(CASE WHEN is_paid THEN 1 ELSE 0 END) AS paid_count,
+                   SUM(CASE WHEN is_paid THEN amount ELSE 0 END) AS paid_amount
+            FROM (SELECT user_id, due_day, category, amount, is_paid FROM debts
+                  UNION ALL
+                  SELECT user_id, due_day, category, amount, is_paid FROM debts_history)
+            GROUP BY user_id, month, category
+        '''
+        stored = '''
+            SELECT user_id, month, category, unpaid_count, unpaid_amount, paid_count, paid_amount
+            FROM debt_totals
+        '''
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                SELECT (SELECT COUNT(*) FROM ({fresh} EXCEPT {stored}))
+                     + (SELECT COUNT(*) FROM ({stored} EXCEPT {fresh}))
+            ''')
+            differences = cursor.fetchone()[0]
+            if differences and not check_only:
+                cursor.execute('DELETE FROM debt_totals')
+                cursor.execute(f'''
+                    INSERT INTO debt_totals (user_id, month, category, unpaid_count, unpaid_amount,
+                                             paid_count, paid_amount)
+                    {fresh}
+                ''')
+            return differences
+
     def mark_debt_paid(self, debt_id: int, user_id: int) -> bool:
         """Mark a debt as paid"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 UPDATE debts
                 SET is_paid = TRUE, paid_at = ?
                 WHERE id = ? AND user_id = ?
             ''', (datetime.now(self.tehran_tz).isoformat(), debt_id, user_id))
-            conn.commit()
             return cursor.rowcount > 0
 
     def delete_debt(self, debt_id: int, user_id: int) -> bool:
         """Delete a debt"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 DELETE FROM debts
                 WHERE id = ? AND user_id = ?
             ''', (debt_id, user_id))
-            conn.commit()
             return cursor.rowcount > 0
 
+    def pay_debt(self, debt_id: int, user_id: int) -> Tuple[str, Optional[str]]:
+        """Mark a debt paid and roll a recurring one forward, atomically.
+
+        Existence, the already-paid check and the update are a single
+        UPDATE ... RETURNING: paid_at is only overwritten for unpaid debts,
+        so it equals this call's timestamp exactly when this call paid it.
+        Returns (DEBT_PAID, next due day or None), (DEBT_ALREADY_PAID, None)
+        or (DEBT_NOT_FOUND, None).
+        """
+        now = datetime.now(self.tehran_tz).isoformat()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                UPDATE debts
+                SET is_paid = TRUE, paid_at = CASE WHEN is_paid THEN paid_at ELSE ? END
+                WHERE id = ? AND user_id = ?
+                RETURNING paid_at = ?, recurrence
+            ''', (now, debt_id, user_id, now))
+            row = cursor.fetchone()
+            if row is None:
+                return DEBT_NOT_FOUND, None
+            newly_paid, recurrence = row
+            if not newly_paid:
+                return DEBT_ALREADY_PAID, None
+            next_day = None
+            if recurrence in RECURRING:
+                next_day = self._insert_next_occurrence(cursor, debt_id, user_id)
+            return DEBT_PAID, next_day
+
+    def pay_debts(self, user_id: int, debt_ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Pay several debts in one transaction and return each id's pay_debt outcome"""
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            return self._pay_debts(cursor, user_id, debt_ids)
+
+    def pay_debts_due_by(self, user_id: int, last_day: str) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Pay every unpaid debt of a user due on or before `last_day` (overdue ones included)"""
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM debts
+                WHERE user_id = ? AND is_paid = FALSE AND due_day <= ?
+                ORDER BY due_day, id
+            ''', (user_id, last_day))
+            return self._pay_debts(cursor, user_id, [row[0] for row in cursor.fetchall()])
+
+    def _pay_debts(self, cursor: sqlite3.Cursor, user_id: int,
+                   debt_ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+        # Runs inside a BEGIN IMMEDIATE transaction, so the statuses read
+        # here cannot change before the update below
+        cursor.execute('''
+            SELECT id, is_paid, recurrence FROM debts
+            WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+        ''', (user_id, json.dumps(list(debt_ids))))
+        found = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+        outcomes: Dict[int, Tuple[str, Optional[str]]] = {}
+        unpaid = []
+        for debt_id in debt_ids:
+            if debt_id not in found:
+                outcomes[debt_id] = (DEBT_NOT_FOUND, None)
+            elif found[debt_id][0]:
+                outcomes[debt_id] = (DEBT_ALREADY_PAID, None)
+            elif debt_id not in outcomes:
+                outcomes[debt_id] = (DEBT_PAID, None)
+                unpaid.append(debt_id)
+
+        now = datetime.now(self.tehran_tz).isoformat()
+        cursor.executemany('''
+            UPDATE debts SET is_paid = TRUE, paid_at = ?
+            WHERE id = ? AND user_id = ?
+        ''', [(now, debt_id, user_id) for debt_id in unpaid])
+        for debt_id in unpaid:
+            if found[debt_id][1] in RECURRING:
+                outcomes[debt_id] = (DEBT_PAID, self._insert_next_occurrence(cursor, debt_id, user_id))
+        return outcomes
+
+    def delete_debts(self, user_id: int, debt_ids: Sequence[int]) -> Dict[int, bool]:
+        """Delete several debts in one transaction and return whether each id existed"""
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM debts
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(list(debt_ids))))
+            found = {row[0] for row in cursor.fetchall()}
+            cursor.executemany('''
+                DELETE FROM debts WHERE id = ? AND user_id = ?
+            ''', [(debt_id, user_id) for debt_id in found])
+            return {debt_id: debt_id in found for debt_id in debt_ids}
+
+    def create_next_occurrence(self, debt_id: int, user_id: int) -> Optional[str]:
+        """Create the next occurrence of a recurring debt and return its due day.
+
+        Returns None for one-time debts and for debts whose next occurrence
+        already exists.
+        """
+        with self._cursor() as cursor:
+            return self._insert_next_occurrence(cursor, debt_id, user_id)
+
+    @staticmethod
+    def _insert_next_occurrence(cursor: sqlite3.Cursor, debt_id: int, user_id: int) -> Optional[str]:
+        cursor.execute(f'''
+            INSERT INTO debts (user_id, category, amount, due_date, due_day, description,
+                               recurrence, recurrence_day)
+            SELECT user_id, category, amount, next_day, next_day, description,
+                   recurrence, recurrence_day
+            FROM (
+                SELECT *, {NEXT_DUE_DAY_SQL} AS next_day
+                FROM debts
+                WHERE id = ? AND user_id = ? AND rolled_over = FALSE
+                  AND recurrence IN ('weekly', 'monthly', 'yearly')
+            )
+            RETURNING due_day
+        ''', (debt_id, user_id))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute('''
+            UPDATE debts SET rolled_over = TRUE WHERE id = ? AND user_id = ?
+        ''', (debt_id, user_id))
+        return row[0]
+
+    def roll_over_debts(self, today: Optional[str] = None) -> int:
+        """Create next occurrences for every recurring debt whose due day has passed.
+
+        Works set-based in a single transaction: each step inserts the next
+        occurrence of all lapsed, not yet rolled-over debts with one
+        INSERT ... SELECT and flags their sources with one UPDATE. Steps repeat
+        while new occurrences are themselves lapsed, so a series that fell
+        several periods behind catches up in one call. Returns the number of
+        debts created.
+        """
+        created = 0
+        lapsed = '''
+            rolled_over = FALSE AND recurrence IN ('weekly', 'monthly', 'yearly')
+            AND due_day < date(COALESCE(?, 'now')) AND id <= ?
+        '''
+        with self._cursor() as cursor:
+            for _ in range(MAX_ROLLOVER_STEPS):
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM debts')
+                max_id = cursor.fetchone()[0]
+                cursor.execute(f'''
+                    INSERT INTO debts (user_id, category, amount, due_date, due_day, description,
+                                       recurrence, recurrence_day)
+                    SELECT user_id, category, amount, next_day, next_day, description,
+                           recurrence, recurrence_day
+                    FROM (
+                        SELECT *, {NEXT_DUE_DAY_SQL} AS next_day
+                        FROM debts
+                        WHERE {lapsed}
+                    )
+                ''', (today, max_id))
+                if cursor.rowcount == 0:
+                    break
+                created += cursor.rowcount
+                cursor.execute(f'UPDATE debts SET rolled_over = TRUE WHERE {lapsed}', (today, max_id))
+        return created
+
     def get_debt_by_id(self, debt_id: int, user_id: int) -> Optional[Dict[str, Any]]:
         """Get a specific debt by ID"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 SELECT id, category, amount, due_date, description, recurrence, is_paid
                 FROM debts
@@ -130,16 +505,18 @@ class Database:
                 }
             return None
 
-    def get_upcoming_debts(self, days_ahead: int = 7) -> List[Dict[str, Any]]:
-        """Get debts that are due within the specified number of days"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    def get_upcoming_debts(self, days_ahead: int = 7, today: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get debts that are due within the specified number of days.
+
+        `today` (YYYY-MM-DD) defaults to SQLite's current UTC date.
+        """
+        with self._cursor() as cursor:
             cursor.execute('''
                 SELECT id, user_id, category, amount, due_date, description
                 FROM debts
-                WHERE is_paid = FALSE AND date(due_date) <= date('now', '+{} days')
-                ORDER BY due_date ASC
-            '''.format(days_ahead), ())
+                WHERE is_paid = FALSE AND due_day <= date(COALESCE(?, 'now'), ?)
+                ORDER BY due_day ASC
+            ''', (today, f'+{int(days_ahead)} days'))
             rows = cursor.fetchall()
 
             debts = []
@@ -154,27 +531,154 @@ class Database:
                 })
             return debts
 
+    @staticmethod
+    def _shard_condition(shards: Optional[ShardFilter]) -> Tuple[str, Tuple]:
+        """SQL fragment and parameters limiting rows to the given user shards"""
+        if shards is None:
+            return '', ()
+        shard_count, selected = shards
+        placeholders = ', '.join('?' * len(selected)) or 'NULL'
+        return f'AND abs(user_id) % ? IN ({placeholders})', (shard_count, *selected)
+
+    def _iter_user_groups(self, query: str, params: Tuple, columns: List[str],
+                          page_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Stream `query` page by page and yield (user_id, rows) groups.
+
+        The query must select user_id, a day column and id first, order by
+        them, and end with a row-value keyset condition and a LIMIT as its
+        last four parameters. Each page is read in its own short transaction
+        so the lock is never held between pages, and memory stays bounded by
+        one page plus the current user's rows.
+        """
+        last = (-2 ** 63, '', -1)
+        user_id, group = None, []
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute(query, (*params, *last, page_size))
+                rows = cursor.fetchmany(page_size)
+            for row in rows:
+                if row[0] != user_id:
+                    if group:
+                        yield user_id, group
+                    user_id, group = row[0], []
+                group.append(dict(zip(columns, row)))
+            if len(rows) < page_size:
+                break
+            last = rows[-1][:3]
+        if group:
+            yield user_id, group
+
+    def iter_upcoming_debts_by_user(self, days_ahead: int = 7, today: Optional[str] = None,
+                                    page_size: int = STREAM_PAGE_SIZE,
+                                    shards: Optional[ShardFilter] = None
+                                    ) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Yield (user_id, debts) for debts due within `days_ahead`, ordered by user"""
+        shard_sql, shard_params = self._shard_condition(shards)
+        return self._iter_user_groups(f'''
+            SELECT user_id, due_day, id, category, amount, due_date, description
+            FROM debts
+            WHERE is_paid = FALSE AND due_day <= date(COALESCE(?, 'now'), ?) {shard_sql}
+              AND (user_id, due_day, id) > (?, ?, ?)
+            ORDER BY user_id, due_day, id
+            LIMIT ?
+        ''', (today, f'+{int(days_ahead)} days', *shard_params),
+            ['user_id', 'due_day', 'id', 'category', 'amount', 'due_date', 'description'],
+            page_size)
+
+    def iter_due_keys(self, page_size: int = STREAM_PAGE_SIZE) -> Iterator[Tuple[str, int, int]]:
+        """Stream (due_day, user_id, id) of every unpaid debt in (due_day, id) order"""
+        last: Tuple[str, int] = ('', -1)
+        while True:
+            with self._cursor() as cursor:
+                cursor.execute('''
+                    SELECT due_day, user_id, id FROM debts
+                    WHERE is_paid = FALSE AND due_day IS NOT NULL AND (due_day, id) > (?, ?)
+                    ORDER BY due_day, id
+                    LIMIT ?
+                ''', (*last, page_size))
+                rows = cursor.fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                break
+            last = (rows[-1][0], rows[-1][2])
+
+    def get_due_keys_after(self, after_id: int) -> List[Tuple[str, int, int]]:
+        """(due_day, user_id, id) of unpaid debts with an id above `after_id`, in id order"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT due_day, user_id, id FROM debts
+                WHERE id > ? AND is_paid = FALSE AND due_day IS NOT NULL
+                ORDER BY id
+            ''', (after_id,))
+            return cursor.fetchall()
+
+    def get_due_days(self, user_id: int, debt_ids: Sequence[int]) -> Dict[int, str]:
+        """Due day of each of a user's debts among `debt_ids`, paid or not"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, due_day FROM debts
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?)) AND due_day IS NOT NULL
+            ''', (user_id, json.dumps(list(debt_ids))))
+            return dict(cursor.fetchall())
+
+    def get_max_debt_id(self) -> int:
+        """Highest id in the debts table (0 when empty)"""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM debts')
+            return cursor.fetchone()[0]
+
+    def get_unpaid_debts(self, debt_ids: Sequence[int], last_day: str) -> List[Dict[str, Any]]:
+        """Those of `debt_ids` that are still unpaid and due by `last_day`, ordered by user"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT user_id, due_day, id, category, amount, due_date, description
+                FROM debts
+                WHERE id IN (SELECT value FROM json_each(?)) AND is_paid = FALSE AND due_day <= ?
+                ORDER BY user_id, due_day, id
+            ''', (json.dumps(list(debt_ids)), last_day))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
     def add_reminder(self, user_id: int, title: str, reminder_date: str,
                      description: str = "") -> int:
         """Add a custom reminder"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
-                INSERT INTO reminders (user_id, title, reminder_date, description)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, title, reminder_date, description))
-            conn.commit()
+                INSERT INTO reminders (user_id, title, reminder_date, description, reminder_day)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, title, reminder_date, description, stored_day(reminder_date)))
             return cursor.lastrowid
 
+    def add_reminders(self, user_id: int, reminders: Iterable[Tuple[str, str, str, bool]]) -> int:
+        """Insert (title, reminder_date, description, is_active) rows in one transaction"""
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO reminders (user_id, title, reminder_date, description, is_active, reminder_day)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(user_id, title, reminder_date, description, is_active, stored_day(reminder_date))
+                  for title, reminder_date, description, is_active in reminders])
+            return cursor.rowcount
+
+    def iter_user_reminders(self, user_id: int, page_size: int = STREAM_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Stream all of a user's custom reminders, archived and inactive first, each in date order"""
+        query = '''
+            SELECT is_active, reminder_day, id, title, reminder_date, description
+            FROM {table}
+            WHERE user_id = ? AND (is_active, reminder_day, id) > (?, ?, ?)
+            ORDER BY is_active, reminder_day, id
+            LIMIT ?
+        '''
+        return itertools.chain(*(self._iter_keyset(query.format(table=table), (user_id,), page_size)
+                                 for table in ('reminders_history', 'reminders')))
+
     def get_active_reminders(self, user_id: int) -> List[Dict[str, Any]]:
         """Get all active reminders for a user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 SELECT id, title, description, reminder_date
                 FROM reminders
                 WHERE user_id = ? AND is_active = TRUE
-                ORDER BY reminder_date ASC
+                ORDER BY reminder_day ASC, id ASC
             ''', (user_id,))
             rows = cursor.fetchall()
 
@@ -188,16 +692,18 @@ class Database:
                 })
             return reminders
 
-    def get_upcoming_reminders(self, days_ahead: int = 7) -> List[Dict[str, Any]]:
-        """Get reminders that are due within the specified number of days"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    def get_upcoming_reminders(self, days_ahead: int = 7, today: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get reminders that are due within the specified number of days.
+
+        `today` (YYYY-MM-DD) defaults to SQLite's current UTC date.
+        """
+        with self._cursor() as cursor:
             cursor.execute('''
-                SELECT id, user_id, title, description, reminder_date
+                SELECT id, user_id, title, description, reminder_date, reminder_day
                 FROM reminders
-                WHERE is_active = TRUE AND date(reminder_date) <= date('now', '+{} days')
-                ORDER BY reminder_date ASC
-            '''.format(days_ahead), ())
+                WHERE is_active = TRUE AND reminder_day <= date(COALESCE(?, 'now'), ?)
+                ORDER BY reminder_day ASC
+            ''', (today, f'+{int(days_ahead)} days'))
             rows = cursor.fetchall()
 
             reminders = []
@@ -207,18 +713,286 @@ class Database:
                     'user_id': row[1],
                     'title': row[2],
                     'description': row[3],
-                    'reminder_date': row[4]
+                    'reminder_date': row[4],
+                    'reminder_day': row[5]
                 })
             return reminders
 
+    def iter_upcoming_reminders_by_user(self, days_ahead: int = 7, today: Optional[str] = None,
+                                        page_size: int = STREAM_PAGE_SIZE,
+                                        shards: Optional[ShardFilter] = None
+                                        ) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Yield (user_id, reminders) for reminders due within `days_ahead`, ordered by user"""
+        shard_sql, shard_params = self._shard_condition(shards)
+        return self._iter_user_groups(f'''
+            SELECT user_id, reminder_day, id, title, description, reminder_date
+            FROM reminders
+            WHERE is_active = TRUE AND reminder_day <= date(COALESCE(?, 'now'), ?) {shard_sql}
+              AND (user_id, reminder_day, id) > (?, ?, ?)
+            ORDER BY user_id, reminder_day, id
+            LIMIT ?
+        ''', (today, f'+{int(days_ahead)} days', *shard_params),
+            ['user_id', 'reminder_day', 'id', 'title', 'description', 'reminder_date'],
+            page_size)
+
+    def get_next_reminder_day(self) -> Optional[str]:
+        """Get the earliest day (YYYY-MM-DD) any active reminder is set for"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT MIN(reminder_day)
+                FROM reminders
+                WHERE is_active = TRUE
+            ''')
+            return cursor.fetchone()[0]
+
     def deactivate_reminder(self, reminder_id: int, user_id: int) -> bool:
         """Deactivate a reminder"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute('''
                 UPDATE reminders
                 SET is_active = FALSE
                 WHERE id = ? AND user_id = ?
             ''', (reminder_id, user_id))
-            conn.commit()
             return cursor.rowcount > 0
+
+    def archive_debts(self, before_day: str, limit: int) -> int:
+        """Move up to `limit` debts due and paid before `before_day` into debts_history.
+
+        Recurring debts only move once their next occurrence exists. The
+        copy and the delete share one IMMEDIATE transaction; returns the
+        number of debts moved.
+        """
+        archived_at = datetime.now(self.tehran_tz).isoformat()
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM debts
+                WHERE is_paid = TRUE AND due_day < ? AND COALESCE(paid_at, '') < ?
+                  AND (rolled_over = TRUE OR recurrence NOT IN ('weekly', 'monthly', 'yearly'))
+                LIMIT ?
+            ''', (before_day, before_day, limit))
+            debt_ids = json.dumps([row[0] for row in cursor.fetchall()])
+            cursor.execute(f'''
+                INSERT INTO debts_history ({DEBT_COLUMNS}, archived_at)
+                SELECT {DEBT_COLUMNS}, ? FROM debts
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (archived_at, debt_ids))
+            cursor.execute('DELETE FROM debts WHERE id IN (SELECT value FROM json_each(?))', (debt_ids,))
+            return cursor.rowcount
+
+    def archive_reminders(self, before_day: str, limit: int) -> int:
+        """Move up to `limit` inactive reminders set before `before_day` into reminders_history"""
+        archived_at = datetime.now(self.tehran_tz).isoformat()
+        with self._cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT id FROM reminders
+                WHERE is_active = FALSE AND reminder_day < ?
+                LIMIT ?
+            ''', (before_day, limit))
+            reminder_ids = json.dumps([row[0] for row in cursor.fetchall()])
+            cursor.execute(f'''
+                INSERT INTO reminders_history ({REMINDER_COLUMNS}, archived_at)
+                SELECT {REMINDER_COLUMNS}, ? FROM reminders
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (archived_at, reminder_ids))
+            cursor.execute('DELETE FROM reminders WHERE id IN (SELECT value FROM json_each(?))',
+                           (reminder_ids,))
+            return cursor.rowcount
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Hand up to `pages` free pages back to the filesystem and return how many were freed.
+
+        Has no effect unless the file is in auto_vacuum = INCREMENTAL mode
+        (new databases, or old ones after enable_incremental_vacuum).
+        """
+        with self._lock:
+            conn = self.conn
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    def enable_incremental_vacuum(self) -> bool:
+        """Switch an existing file to auto_vacuum = INCREMENTAL with a full VACUUM.
+
+        VACUUM rewrites the whole file and blocks all writers meanwhile, so
+        this is meant for maintenance windows. Returns False if the mode
+        was already set.
+        """
+        with self._lock:
+            conn = self.conn
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                return False
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            return True
+
+    def claim_deliveries(self, items: Iterable[Tuple[str, str, str, int]],
+                         lease_seconds: float) -> Set[DeliveryKey]:
+        """Claim (target, occurrence_day, stage, user_id) deliveries before sending.
+
+        Everything is claimed in one transaction. A key is returned only if
+        it was unclaimed, or if an earlier claim was never marked sent and
+        its lease has expired (the sender crashed mid-run). Keys that are
+        already sent or held by a live claim are left out.
+        """
+        items = list(items)
+        if not items:
+            return set()
+        claim_id = uuid.uuid4().hex
+        now = time.time()
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO reminder_deliveries
+                    (target, occurrence_day, stage, user_id, claim_id, claimed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(target, day, stage, user_id, claim_id, now)
+                  for target, day, stage, user_id in items])
+            cursor.executemany('''
+                UPDATE reminder_deliveries
+                SET claim_id = ?, claimed_at = ?
+                WHERE target = ? AND occurrence_day = ? AND stage = ?
+                  AND status = 'claimed' AND claimed_at < ?
+            ''', [(claim_id, now, target, day, stage, now - lease_seconds)
+                  for target, day, stage, _ in items])
+            cursor.execute('''
+                SELECT target, occurrence_day, stage
+                FROM reminder_deliveries
+                WHERE claim_id = ? AND status = 'claimed'
+            ''', (claim_id,))
+            return set(cursor.fetchall())
+
+    def complete_deliveries(self, sent: Iterable[DeliveryKey],
+                            failed: Iterable[DeliveryKey] = (),
+                            reminders: Iterable[Tuple[int, int]] = ()):
+        """Record a batch of delivery outcomes in one transaction.
+
+        Sent keys are marked done, failed keys are released so a later run
+        can retry them, and delivered custom reminders (reminder_id, user_id)
+        are deactivated alongside.
+        """
+        now = time.time()
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                UPDATE reminder_deliveries
+                SET status = 'sent', sent_at = ?
+                WHERE target = ? AND occurrence_day = ? AND stage = ?
+            ''', [(now, *key) for key in sent])
+            cursor.executemany('''
+                DELETE FROM reminder_deliveries
+                WHERE target = ? AND occurrence_day = ? AND stage = ? AND status = 'claimed'
+            ''', list(failed))
+            cursor.executemany('''
+                UPDATE reminders
+                SET is_active = FALSE
+                WHERE id = ? AND user_id = ?
+            ''', list(reminders))
+
+    def purge_deliveries(self, before_day: str, limit: int) -> int:
+        """Delete up to `limit` ledger rows whose occurrence day is before `before_day`"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                DELETE FROM reminder_deliveries
+                WHERE (target, occurrence_day, stage) IN (
+                    SELECT target, occurrence_day, stage FROM reminder_deliveries
+                    WHERE occurrence_day < ?
+                    LIMIT ?
+                )
+            ''', (before_day, limit))
+            return cursor.rowcount
+
+    def acquire_shards(self, owner: str, shard_count: int, lease_seconds: float) -> List[int]:
+        """Renew `owner`'s shard leases and claim at most one more shard.
+
+        A worker that holds no shard may take any free or expired shard at
+        once. A worker that already holds shards only takes one that has
+        been free for a whole extra lease period, which leaves room for
+        idle workers to pick shards up first. Returns the shards now held.
+        """
+        now = time.time()
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO shard_leases (shard, owner, expires_at)
+                VALUES (?, NULL, ?)
+            ''', [(shard, now) for shard in range(shard_count)])
+            cursor.execute('''
+                UPDATE shard_leases
+                SET expires_at = ?
+                WHERE owner = ? AND shard < ?
+            ''', (now + lease_seconds, owner, shard_count))
+            held = cursor.rowcount
+            cursor.execute('''
+                UPDATE shard_leases
+                SET owner = ?, expires_at = ?
+                WHERE shard = (
+                    SELECT shard FROM shard_leases
+                    WHERE shard < ? AND expires_at <= ?
+                    ORDER BY expires_at
+                    LIMIT 1
+                )
+            ''', (owner, now + lease_seconds, shard_count,
+                  now - (lease_seconds if held else 0)))
+            cursor.execute('''
+                SELECT shard FROM shard_leases
+                WHERE owner = ? AND shard < ?
+                ORDER BY shard
+            ''', (owner, shard_count))
+            return [row[0] for row in cursor.fetchall()]
+
+    def release_shards(self, owner: str):
+        """Give up every shard held by `owner` so other workers can take them"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                UPDATE shard_leases
+                SET owner = NULL, expires_at = ?
+                WHERE owner = ?
+            ''', (time.time(), owner))
+
+    def load_user_data(self, since: float, limit: int) -> List[Tuple[int, str, float]]:
+        """Return the `limit` most recently updated (user_id, data, updated_at) rows newer than `since`"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT user_id, data, updated_at FROM persisted_user_data
+                WHERE updated_at >= ?
+                ORDER BY updated_at DESC
+                LIMIT ?
+            ''', (since, limit))
+            return cursor.fetchall()
+
+    def load_conversations(self, name: str, since: float) -> List[Tuple[str, str]]:
+        """Return the (key, state) rows of a conversation updated since `since`"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT key, state FROM persisted_conversations
+                WHERE name = ? AND updated_at >= ?
+            ''', (name, since))
+            return cursor.fetchall()
+
+    def save_persisted_state(self, user_data: Iterable[Tuple[int, Optional[str]]],
+                             conversations: Iterable[Tuple[str, str, Optional[str]]], now: float):
+        """Write batched user data and conversation changes in one transaction.
+
+        A None value deletes the row (dropped user data, ended conversation).
+        """
+        user_data, conversations = list(user_data), list(conversations)
+        with self._cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO persisted_user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            ''', [(user_id, data, now) for user_id, data in user_data if data is not None])
+            cursor.executemany('DELETE FROM persisted_user_data WHERE user_id = ?',
+                               [(user_id,) for user_id, data in user_data if data is None])
+            cursor.executemany('''
+                INSERT INTO persisted_conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            ''', [(name, key, state, now) for name, key, state in conversations if state is not None])
+            cursor.executemany('DELETE FROM persisted_conversations WHERE name = ? AND key = ?',
+                               [(name, key) for name, key, state in conversations if state is None])
+
+    def purge_persisted_state(self, before: float) -> int:
+        """Delete user data and conversation states last updated before `before`"""
+        with self._cursor() as cursor:
+            cursor.execute('DELETE FROM persisted_user_data WHERE updated_at < ?', (before,))
+            purged = cursor.rowcount
+            cursor.execute('DELETE FROM persisted_conversations WHERE updated_at < ?', (before,))
+            return purged + cursor.rowcount
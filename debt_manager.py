@@ -1,30 +1,59 @@
-from typing import Dict, Any, List
-from datetime import datetime, timedelta
+import itertools
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date, datetime, timedelta
 import pytz
-from database import Database
+import jalali
+from cache import LRUCache
+from database import Database, DebtCursor, DEBT_PAID, DEBT_ALREADY_PAID, DEBT_NOT_FOUND
+from due_index import DueIndex
+
+# Debts shown per /list_debts page
+DEBTS_PAGE_SIZE = 10
+# Most ids one /pay_debt or /delete_debt command may name
+MAX_BULK_IDS = 100
+
+# Debt list pages kept in memory, and for how long (seconds). The TTL
+# bounds staleness from writers in other processes (worker.py).
+DEBT_CACHE_SIZE = 1024
+DEBT_CACHE_TTL = 60.0
+# Months around the current one listed by /summary
+SUMMARY_MONTHS_BEFORE = 2
+SUMMARY_MONTHS_AFTER = 3
+
+def _shift_month(key: str, months: int) -> str:
+    """Move a YYYY/MM (or YYYY-MM) month key by `months`"""
+    separator = key[4:5] or '/'
+    try:
+        index = int(key[:4]) * 12 + int(key[5:7]) - 1 + months
+    except ValueError:
+        return key
+    return f"{index // 12:04d}{separator}{index % 12 + 1:02d}"
 
 class DebtManager:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, cache: Optional[LRUCache] = None):
         self.db = db
         self.tehran_tz = pytz.timezone('Asia/Tehran')
+        # (user_id, generation, cursor, backward) -> rendered debt list page
+        self.cache = cache if cache is not None else LRUCache(DEBT_CACHE_SIZE, DEBT_CACHE_TTL)
+        # Set to a fresh number on every write so a user's cached pages stop
+        # matching. Only as many users as the cache holds are remembered;
+        # forgotten users fall back to the highest generation forgotten so
+        # far, which no page cached before their last write can carry.
+        self._generations: "OrderedDict[int, int]" = OrderedDict()
+        self._generation_floor = 0
+        self._next_generation = itertools.count(1)
+        # Reminder due index kept current by every write; attached by
+        # ReminderService once it has been loaded
+        self.due_index: Optional[DueIndex] = None
 
     def format_amount(self, amount: int) -> str:
         """Format amount in Iranian Rial with proper separators"""
         return f"{amount:,}"
 
     def format_date(self, date_str: str) -> str:
-        """Format date for display in Persian"""
-        try:
-            date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            if date_obj.tzinfo is None:
-                date_obj = self.tehran_tz.localize(date_obj)
-            else:
-                date_obj = date_obj.astimezone(self.tehran_tz)
-
-            # Persian date format: YYYY/MM/DD
-            return date_obj.strftime('%Y/%m/%d')
-        except:
-            return date_str
+        """Format date for display in the Persian (Jalali) calendar"""
+        return jalali.format_date(date_str)
 
     def validate_debt_data(self, category: str, amount: int, due_date: str,
                           description: str = "", recurrence: str = "one-time") -> str:
@@ -50,21 +79,95 @@ class DebtManager:
     def add_debt(self, user_id: int, category: str, amount: int, due_date: str,
                  description: str = "", recurrence: str = "one-time") -> str:
         """Add a new debt and return success/error message"""
+        return self.create_debt(user_id, category, amount, due_date, description, recurrence)[0]
+
+    def create_debt(self, user_id: int, category: str, amount: int, due_date: str,
+                    description: str = "", recurrence: str = "one-time") -> Tuple[str, Optional[int]]:
+        """Add a new debt and return the message plus its id (None if it was not added)"""
         error = self.validate_debt_data(category, amount, due_date, description, recurrence)
         if error:
-            return f"خطا: {error}"
+            return f"خطا: {error}", None
 
         try:
             debt_id = self.db.add_debt(user_id, category.strip(), amount, due_date,
                                      description.strip(), recurrence)
-            return f"✅ بدهی جدید با موفقیت اضافه شد.\nشناسه: {debt_id}"
+            self._invalidate(user_id)
+            self._index_new_debts()
+            return f"✅ بدهی جدید با موفقیت اضافه شد.\nشناسه: {debt_id}", debt_id
         except Exception as e:
-            return f"خطا در ذخیره بدهی: {str(e)}"
+            return f"خطا در ذخیره بدهی: {str(e)}", None
+
+    def import_debts(self, user_id: int, debts: List[tuple]) -> int:
+        """Insert a chunk of already validated debts in one transaction"""
+        count = self.db.add_debts(user_id, debts)
+        self._invalidate(user_id)
+        self._index_new_debts()
+        return count
 
     def get_debts_text(self, user_id: int) -> str:
         """Get formatted text of all active debts"""
-        debts = self.db.get_active_debts(user_id)
+        return self.render_debts_text(self.db.get_active_debts(user_id))
+
+    def get_debts_page(self, user_id: int, cursor: Optional[DebtCursor] = None,
+                       backward: bool = False) -> Dict[str, Any]:
+        """Get one page of a user's active debts, served from the cache.
+
+        Returns the page's debts and text plus the cursors for the previous
+        and next pages (None at either end of the list).
+        """
+        key = (user_id, self._generations.get(user_id, self._generation_floor), cursor, backward)
+        return self.cache.get_or_load(key, lambda: self._load_debts_page(user_id, cursor, backward))
 
+    def _load_debts_page(self, user_id: int, cursor: Optional[DebtCursor],
+                         backward: bool) -> Dict[str, Any]:
+        # One extra row tells whether another page follows
+        debts = self.db.get_debts_page(user_id, DEBTS_PAGE_SIZE + 1, cursor, backward)
+        more = len(debts) > DEBTS_PAGE_SIZE
+        if cursor is not None and (not debts or (backward and not more)):
+            # Paging back reached the start, or the debts around the cursor
+            # were paid or deleted meanwhile: show the first page
+            return self._load_debts_page(user_id, None, False)
+
+        if backward:
+            debts = debts[1:]
+            has_prev, has_next = more, True
+        else:
+            debts = debts[:DEBTS_PAGE_SIZE]
+            has_prev, has_next = cursor is not None, more
+        return {
+            'debts': debts,
+            'text': self.render_debts_text(debts),
+            'prev': (debts[0]['due_day'], debts[0]['id']) if has_prev else None,
+            'next': (debts[-1]['due_day'], debts[-1]['id']) if has_next else None,
+        }
+
+    def _invalidate(self, user_id: int):
+        """Make every cached page of the user stale; old entries age out of the LRU"""
+        self._generations[user_id] = next(self._next_generation)
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > self.cache.max_entries:
+            _, generation = self._generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, generation)
+
+    def _index_new_debts(self):
+        """Add the debts created since the due index last caught up (this write's included)"""
+        if self.due_index is not None:
+            self.due_index.add_many(self.db.get_due_keys_after(self.due_index.max_id))
+
+    def _due_days(self, user_id: int, debt_ids: List[int]) -> Dict[int, str]:
+        """Due days of debts about to leave the due index ({} while none is attached)"""
+        if self.due_index is None or not debt_ids:
+            return {}
+        return self.db.get_due_days(user_id, debt_ids)
+
+    def _unindex_debts(self, due_days: Dict[int, str], debt_ids: List[int]):
+        """Drop paid or deleted debts from the due index"""
+        for debt_id in debt_ids:
+            if debt_id in due_days:
+                self.due_index.discard(date.fromisoformat(due_days[debt_id]).toordinal(), debt_id)
+
+    def render_debts_text(self, debts: List[Dict[str, Any]]) -> str:
+        """Format a list of debts for display"""
         if not debts:
             return "📝 هیچ بدهی فعالی ندارید."
 
@@ -82,6 +185,62 @@ class DebtManager:
 
         return text
 
+    def get_summary_text(self, user_id: int, today: Optional[date] = None) -> str:
+        """Totals owed, paid and overdue for this Jalali month by category and for nearby months.
+
+        Built from the per-month totals table plus the unpaid debts due
+        earlier this month, so it never reads a user's whole debt list.
+        """
+        today = today or datetime.now(self.tehran_tz).date()
+        totals = self.db.get_debt_totals(user_id)
+        if not totals:
+            return "📝 هنوز بدهی‌ای ثبت نکرده‌اید."
+
+        current = jalali.month_key(today) or today.strftime('%Y-%m')
+        first_day = jalali.month_start(today) or today.replace(day=1)
+        overdue_now = {row['category']: row for row in
+                       self.db.get_unpaid_totals(user_id, first_day.isoformat(), today.isoformat())}
+
+        months: Dict[str, Dict[str, int]] = {}
+        overdue_count = overdue_amount = unpaid_amount = 0
+        for row in totals:
+            month = months.setdefault(row['month'], {'unpaid': 0, 'paid': 0})
+            month['unpaid'] += row['unpaid_amount']
+            month['paid'] += row['paid_amount']
+            unpaid_amount += row['unpaid_amount']
+            # Everything still unpaid from an earlier month is overdue
+            if row['month'] and row['month'] < current:
+                overdue_count += row['unpaid_count']
+                overdue_amount += row['unpaid_amount']
+        overdue_count += sum(row['count'] for row in overdue_now.values())
+        overdue_amount += sum(row['amount'] for row in overdue_now.values())
+
+        text = f"📊 خلاصه بدهی‌ها\n\n📅 {jalali.month_label(current)}:\n"
+        this_month = [row for row in totals if row['month'] == current]
+        if not this_month:
+            text += "بدهی‌ای در این ماه ندارید.\n"
+        for row in this_month:
+            overdue = overdue_now.get(row['category'])
+            text += (f"📂 {row['category']}: بدهی {self.format_amount(row['unpaid_amount'])}"
+                     f" • پرداخت‌شده {self.format_amount(row['paid_amount'])}")
+            if overdue:
+                text += f" • معوق {self.format_amount(overdue['amount'])}"
+            text += "\n"
+
+        first, last = _shift_month(current, -SUMMARY_MONTHS_BEFORE), _shift_month(current, SUMMARY_MONTHS_AFTER)
+        nearby = [(key, month) for key, month in sorted(months.items()) if first <= key <= last]
+        if nearby:
+            text += "\n🗓 ماه به ماه:\n"
+            for key, month in nearby:
+                text += (f"• {jalali.month_label(key)}: بدهی {self.format_amount(month['unpaid'])}"
+                         f" • پرداخت‌شده {self.format_amount(month['paid'])}\n")
+
+        text += f"\n💰 کل بدهی پرداخت‌نشده: {self.format_amount(unpaid_amount)} تومان\n"
+        if overdue_count:
+            text += f"⚠️ معوق: {self.format_amount(overdue_amount)} تومان ({overdue_count} مورد)\n"
+        text += "\n(مبالغ به تومان)"
+        return text
+
     def get_recurrence_text(self, recurrence: str) -> str:
         """Convert recurrence to Persian text"""
         recurrence_map = {
@@ -94,34 +253,126 @@ class DebtManager:
 
     def mark_paid(self, debt_id: int, user_id: int) -> str:
         """Mark a debt as paid"""
-        debt = self.db.get_debt_by_id(debt_id, user_id)
-        if not debt:
+        status, next_day = self.db.pay_debt(debt_id, user_id)
+        if status == DEBT_NOT_FOUND:
             return "❌ بدهی یافت نشد."
 
-        if debt['is_paid']:
+        if status == DEBT_ALREADY_PAID:
             return "✅ این بدهی قبلاً پرداخت شده است."
 
-        success = self.db.mark_debt_paid(debt_id, user_id)
-        if success:
-            return f"✅ بدهی {debt_id} به عنوان پرداخت شده علامت‌گذاری شد."
-        else:
-            return "❌ خطا در بروزرسانی وضعیت بدهی."
+        self._invalidate(user_id)
+        self._unindex_debts(self._due_days(user_id, [debt_id]), [debt_id])
+        if next_day:
+            self._index_new_debts()
+        message = f"✅ بدهی {debt_id} به عنوان پرداخت شده علامت‌گذاری شد."
+        if next_day:
+            message += f"\n🔄 سررسید بعدی: {self.format_date(next_day)}"
+        return message
+
+    def parse_debt_ids(self, args: List[str]) -> Tuple[List[int], str]:
+        """Parse ids like "3 5 8-12" (commas also separate) and return (ids, error message)"""
+        ids: List[int] = []
+        for token in " ".join(args).replace(",", " ").replace("،", " ").split():
+            try:
+                if "-" in token:
+                    first, last = (int(part) for part in token.split("-", 1))
+                    if last < first:
+                        first, last = last, first
+                    if last - first >= MAX_BULK_IDS:
+                        return [], f"حداکثر {MAX_BULK_IDS} شناسه در هر دستور مجاز است."
+                    ids.extend(range(first, last + 1))
+                else:
+                    ids.append(int(token))
+            except ValueError:
+                return [], "شناسه بدهی باید عدد باشد."
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return [], "لطفاً شناسه بدهی را وارد کنید."
+        if len(ids) > MAX_BULK_IDS:
+            return [], f"حداکثر {MAX_BULK_IDS} شناسه در هر دستور مجاز است."
+        return ids, ""
+
+    def mark_paid_many(self, debt_ids: List[int], user_id: int) -> str:
+        """Mark several debts as paid in one transaction"""
+        if len(debt_ids) == 1:
+            return self.mark_paid(debt_ids[0], user_id)
+        return self._pay_summary(self.db.pay_debts(user_id, debt_ids), user_id)
+
+    def pay_this_month(self, user_id: int) -> str:
+        """Pay every unpaid debt due by the end of the current Jalali month"""
+        today = datetime.now(self.tehran_tz).date()
+        last_day = jalali.month_end(today) or today
+        outcomes = self.db.pay_debts_due_by(user_id, last_day.isoformat())
+        if not outcomes:
+            return "📝 بدهی پرداخت‌نشده‌ای تا پایان این ماه ندارید."
+        return self._pay_summary(outcomes, user_id)
+
+    def _pay_summary(self, outcomes: Dict[int, Tuple[str, Optional[str]]], user_id: int) -> str:
+        paid = [debt_id for debt_id, (status, _) in outcomes.items() if status == DEBT_PAID]
+        already_paid = [debt_id for debt_id, (status, _) in outcomes.items() if status == DEBT_ALREADY_PAID]
+        missing = [debt_id for debt_id, (status, _) in outcomes.items() if status == DEBT_NOT_FOUND]
+        if paid:
+            self._invalidate(user_id)
+            self._unindex_debts(self._due_days(user_id, paid), paid)
+        if any(next_day for _, next_day in outcomes.values()):
+            self._index_new_debts()
+
+        lines = []
+        if paid:
+            lines.append(f"✅ پرداخت شد ({len(paid)}): {self._join_ids(paid)}")
+        if already_paid:
+            lines.append(f"☑️ قبلاً پرداخت شده: {self._join_ids(already_paid)}")
+        if missing:
+            lines.append(f"❌ یافت نشد: {self._join_ids(missing)}")
+        for debt_id, (status, next_day) in outcomes.items():
+            if next_day:
+                lines.append(f"🔄 سررسید بعدی {debt_id}: {self.format_date(next_day)}")
+        return "\n".join(lines)
+
+    def delete_many(self, debt_ids: List[int], user_id: int) -> str:
+        """Delete several debts in one transaction"""
+        if len(debt_ids) == 1:
+            return self.delete_debt(debt_ids[0], user_id)
+        due_days = self._due_days(user_id, debt_ids)
+        outcomes = self.db.delete_debts(user_id, debt_ids)
+        deleted = [debt_id for debt_id, found in outcomes.items() if found]
+        missing = [debt_id for debt_id, found in outcomes.items() if not found]
+        if deleted:
+            self._invalidate(user_id)
+            self._unindex_debts(due_days, deleted)
+
+        lines = []
+        if deleted:
+            lines.append(f"🗑️ حذف شد ({len(deleted)}): {self._join_ids(deleted)}")
+        if missing:
+            lines.append(f"❌ یافت نشد: {self._join_ids(missing)}")
+        return "\n".join(lines)
+
+    def _join_ids(self, debt_ids: List[int]) -> str:
+        return "، ".join(str(debt_id) for debt_id in debt_ids)
+
+    def roll_over_recurring(self, today: Optional[str] = None) -> int:
+        """Create the next occurrence of every recurring debt whose due date has passed"""
+        created = self.db.roll_over_debts(today)
+        if created:
+            # New occurrences can belong to any user
+            self.cache.clear()
+            self._index_new_debts()
+        return created
 
     def delete_debt(self, debt_id: int, user_id: int) -> str:
         """Delete a debt"""
-        debt = self.db.get_debt_by_id(debt_id, user_id)
-        if not debt:
+        due_days = self._due_days(user_id, [debt_id])
+        if not self.db.delete_debt(debt_id, user_id):
             return "❌ بدهی یافت نشد."
 
-        success = self.db.delete_debt(debt_id, user_id)
-        if success:
-            return f"🗑️ بدهی {debt_id} حذف شد."
-        else:
-            return "❌ خطا در حذف بدهی."
+        self._invalidate(user_id)
+        self._unindex_debts(due_days, [debt_id])
+        return f"🗑️ بدهی {debt_id} حذف شد."
 
-    def get_upcoming_reminders(self, days_ahead: int = 7) -> List[Dict[str, Any]]:
+    def get_upcoming_reminders(self, days_ahead: int = 7, today: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get debts that need reminders"""
-        return self.db.get_upcoming_debts(days_ahead)
+        return self.db.get_upcoming_debts(days_ahead, today)
 
     def get_reminder_message(self, debt: Dict[str, Any], days_until_due: int) -> str:
         """Generate reminder message based on days until due"""
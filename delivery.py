@@ -0,0 +1,168 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+# Telegram allows about 30 messages per second overall and one per second
+# to the same chat before flood control kicks in.
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+DEFAULT_WORKERS = 8
+MAX_QUEUE_SIZE = 10000
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0      # seconds, doubled on every retry
+BACKOFF_MAX = 60.0
+# Per-chat buckets idle this long are dropped so memory stays bounded
+CHAT_BUCKET_IDLE = 60.0
+
+class TokenBucket:
+    """Token bucket rate limiter that can also be paused (for RetryAfter)"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class DeliveryQueue:
+    """Bounded, rate-limited outbound message queue in front of the bot.
+
+    A fixed pool of workers drains the queue. Every send takes a token from
+    the global bucket and from the recipient chat's bucket. RetryAfter
+    pauses the global bucket for the requested time, transient network
+    errors are retried with exponential backoff, and permanent errors
+    (blocked bot, bad chat) fail the message straight away.
+    """
+
+    def __init__(self, bot, workers: int = DEFAULT_WORKERS, global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, max_attempts: int = MAX_ATTEMPTS,
+                 max_queue_size: int = MAX_QUEUE_SIZE):
+        self.bot = bot
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self.max_queue_size = max_queue_size
+        self.global_bucket = TokenBucket(global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._stats = {'enqueued': 0, 'sent': 0, 'failed': 0, 'retries': 0,
+                       'retry_after': 0, 'max_queue_depth': 0}
+        self._started_at = None
+
+    def start(self):
+        """Spawn the worker tasks (done lazily on the first submit)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Queue a message and return a future that resolves to True once sent.
+
+        Waits while the queue is full, which applies back-pressure to the
+        producer instead of buffering without limit.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((chat_id, text, kwargs, future))
+        self._stats['enqueued'] += 1
+        self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+        return future
+
+    async def join(self):
+        """Wait until every queued message has been sent or given up on"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus current queue depth and send throughput (msg/s)"""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize() if self._queue else 0
+        stats['throughput'] = round(stats['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+        return stats
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_queue_size:
+                cutoff = time.monotonic() - CHAT_BUCKET_IDLE
+                self._chat_buckets = {cid: b for cid, b in self._chat_buckets.items()
+                                      if b.updated > cutoff}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, future = await self._queue.get()
+            try:
+                delivered = await self._deliver(chat_id, text, kwargs)
+                if not future.done():
+                    future.set_result(delivered)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.set_result(False)
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id: int, text: str, kwargs: Dict[str, Any]) -> bool:
+        attempt = 0
+        while True:
+            # Wait on the chat first so a slow chat does not hold a global token
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self._stats['sent'] += 1
+                return True
+            except RetryAfter as e:
+                # Flood control applies to the whole bot; does not use up an attempt
+                self._stats['retry_after'] += 1
+                self.global_bucket.pause(float(e.retry_after))
+                continue
+            except BadRequest as e:
+                error = e
+            except NetworkError as e:
+                attempt += 1
+                if attempt < self.max_attempts:
+                    self._stats['retries'] += 1
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                    continue
+                error = e
+            except Exception as e:
+                # Forbidden (bot blocked), ChatMigrated and anything unexpected
+                error = e
+            self._stats['failed'] += 1
+            print(f"Error sending message to {chat_id}: {error}")
+            return False
@@ -0,0 +1,99 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Iterable, List, Tuple
+
+# Bytes one indexed debt takes: a 4-byte day number plus 8-byte user and debt ids
+ENTRY_BYTES = 4 + 8 + 8
+# Above this many new debts one merge pass beats inserting them one by one
+MERGE_THRESHOLD = 64
+
+class DueIndex:
+    """Unpaid debts as parallel arrays of (due day number, user_id, debt id), sorted by day.
+
+    Day numbers are date ordinals. Each debt costs ENTRY_BYTES (20) bytes,
+    about 19 MiB per million debts plus the slack arrays keep for growth,
+    instead of a dict per row. Finding everything due by a day is a bisect
+    and a slice.
+
+    The owner keeps it current: DebtManager adds and removes debts as it
+    writes them, and debts written by other processes are picked up by id,
+    as everything above max_id has not been indexed yet. Debts those
+    processes pay or delete stay until a reader finds them gone.
+    """
+
+    def __init__(self):
+        self.days = array('i')
+        self.users = array('q')
+        self.ids = array('q')
+        # Highest debt id already covered by the index
+        self.max_id = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the arrays, including their spare capacity"""
+        return sum(column.buffer_info()[1] * column.itemsize for column in (self.days, self.users, self.ids))
+
+    def load(self, rows: Iterable[Tuple[str, int, int]], max_id: int):
+        """Replace the contents with (due_day, user_id, id) rows already in due day order.
+
+        Rows above `max_id` are skipped; the next catch-up by id adds them.
+        """
+        days, users, ids = array('i'), array('q'), array('q')
+        for due_day, user_id, debt_id in rows:
+            if debt_id <= max_id:
+                days.append(date.fromisoformat(due_day).toordinal())
+                users.append(user_id)
+                ids.append(debt_id)
+        self.days, self.users, self.ids = days, users, ids
+        self.max_id = max_id
+
+    def add(self, due_day: str, user_id: int, debt_id: int):
+        """Insert one debt at its place in day order"""
+        day = date.fromisoformat(due_day).toordinal()
+        position = bisect_right(self.days, day)
+        self.days.insert(position, day)
+        self.users.insert(position, user_id)
+        self.ids.insert(position, debt_id)
+        self.max_id = max(self.max_id, debt_id)
+
+    def add_many(self, rows: List[Tuple[str, int, int]]):
+        """Insert (due_day, user_id, id) rows, merging them in one pass when there are many"""
+        if len(rows) <= MERGE_THRESHOLD:
+            for due_day, user_id, debt_id in rows:
+                self.add(due_day, user_id, debt_id)
+            return
+        new = sorted((date.fromisoformat(due_day).toordinal(), user_id, debt_id)
+                     for due_day, user_id, debt_id in rows)
+        days, users, ids = array('i'), array('q'), array('q')
+        position = 0
+        for day, user_id, debt_id in new:
+            end = bisect_right(self.days, day, position)
+            days.extend(self.days[position:end])
+            users.extend(self.users[position:end])
+            ids.extend(self.ids[position:end])
+            position = end
+            days.append(day)
+            users.append(user_id)
+            ids.append(debt_id)
+        days.extend(self.days[position:])
+        users.extend(self.users[position:])
+        ids.extend(self.ids[position:])
+        self.days, self.users, self.ids = days, users, ids
+        self.max_id = max(self.max_id, max(debt_id for _, _, debt_id in new))
+
+    def discard(self, day: int, debt_id: int) -> bool:
+        """Remove a debt given its day number; returns False if it was not indexed"""
+        for position in range(bisect_left(self.days, day), bisect_right(self.days, day)):
+            if self.ids[position] == debt_id:
+                del self.days[position], self.users[position], self.ids[position]
+                return True
+        return False
+
+    def due_by(self, last_day: date) -> Tuple[array, array, array]:
+        """(days, user_ids, debt_ids) of every debt due on or before `last_day`"""
+        end = bisect_right(self.days, last_day.toordinal())
+        return self.days[:end], self.users[:end], self.ids[:end]
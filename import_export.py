@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Tuple
+from debt_manager import DebtManager
+
+# File formats: CSV, or JSON Lines (one JSON object per line) which can be
+# read and written a row at a time
+FORMATS = {'csv': 'csv', 'json': 'jsonl', 'jsonl': 'jsonl'}
+# Columns of an exported file; debts and reminders share one table
+FIELDS = ['kind', 'category', 'amount', 'due_date', 'description', 'recurrence', 'is_paid',
+          'title', 'reminder_date', 'is_active']
+# Rows validated and inserted per transaction during an import
+IMPORT_CHUNK_SIZE = 1000
+# Row errors listed in the import report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Telegram bots cannot download larger files
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+# Largest amount SQLite can store as an integer
+MAX_AMOUNT = 2 ** 63 - 1
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'بله'}
+
+def _text(value: Any) -> str:
+    return '' if value is None else str(value).strip()
+
+def _flag(value: Any, default: bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    value = _text(value).lower()
+    return default if not value else value in TRUE_VALUES
+
+class DebtTransfer:
+    """Streams a user's debts and reminders to and from CSV / JSON Lines files.
+
+    Exports read the database page by page and imports insert in chunks of
+    IMPORT_CHUNK_SIZE rows, so memory stays bounded whatever the file size.
+    Both block and are meant to run on the database thread.
+    """
+
+    def __init__(self, debt_manager: DebtManager):
+        self.debt_manager = debt_manager
+        self.db = debt_manager.db
+
+    def export(self, user_id: int, out: BinaryIO, fmt: str = 'csv') -> int:
+        """Write all of a user's debts and reminders to `out` and return the row count"""
+        # The BOM lets spreadsheet programs detect UTF-8 (and show Persian text)
+        text = io.TextIOWrapper(out, encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='')
+        if fmt == 'csv':
+            writer = csv.DictWriter(text, fieldnames=FIELDS)
+            writer.writeheader()
+            write: Callable[[Dict[str, Any]], Any] = writer.writerow
+        else:
+            write = lambda row: text.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+        count = 0
+        for debt in self.db.iter_user_debts(user_id):
+            write({
+                'kind': 'debt',
+                'category': debt['category'],
+                'amount': debt['amount'],
+                'due_date': debt['due_date'],
+                'description': debt['description'] or '',
+                'recurrence': debt['recurrence'],
+                'is_paid': bool(debt['is_paid']),
+            })
+            count += 1
+        for reminder in self.db.iter_user_reminders(user_id):
+            write({
+                'kind': 'reminder',
+                'title': reminder['title'],
+                'reminder_date': reminder['reminder_date'],
+                'description': reminder['description'] or '',
+                'is_active': bool(reminder['is_active']),
+            })
+            count += 1
+        text.flush()
+        text.detach()
+        return count
+
+    def import_file(self, user_id: int, data: BinaryIO, fmt: str = 'csv') -> Dict[str, Any]:
+        """Validate and insert the rows of an uploaded file.
+
+        Invalid rows are skipped and reported by line number. Returns the
+        counts of imported debts and reminders, the errors and the earliest
+        imported active reminder date.
+        """
+        text = io.TextIOWrapper(data, encoding='utf-8-sig', newline='')
+        rows = self._csv_rows(text) if fmt == 'csv' else self._jsonl_rows(text)
+        result = {'debts': 0, 'reminders': 0, 'errors': [], 'error_count': 0,
+                  'next_reminder_date': None}
+        debts, reminders = [], []
+
+        try:
+            for line, row in rows:
+                try:
+                    kind, values = self._parse_row(row)
+                except ValueError as e:
+                    result['error_count'] += 1
+                    if len(result['errors']) < MAX_REPORTED_ERRORS:
+                        result['errors'].append((line, str(e)))
+                    continue
+
+                if kind == 'debt':
+                    debts.append(values)
+                    if len(debts) >= IMPORT_CHUNK_SIZE:
+                        result['debts'] += self.debt_manager.import_debts(user_id, debts)
+                        debts = []
+                else:
+                    reminders.append(values)
+                    title, reminder_date, description, is_active = values
+                    if is_active and (result['next_reminder_date'] is None
+                                      or reminder_date < result['next_reminder_date']):
+                        result['next_reminder_date'] = reminder_date
+                    if len(reminders) >= IMPORT_CHUNK_SIZE:
+                        result['reminders'] += self.db.add_reminders(user_id, reminders)
+                        reminders = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            result['error_count'] += 1
+            result['errors'].append((None, f"فایل قابل خواندن نیست: {e}"))
+
+        if debts:
+            result['debts'] += self.debt_manager.import_debts(user_id, debts)
+        if reminders:
+            result['reminders'] += self.db.add_reminders(user_id, reminders)
+        text.detach()
+        return result
+
+    def _csv_rows(self, text: io.TextIOWrapper) -> Iterator[Tuple[int, Any]]:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+    def _jsonl_rows(self, text: io.TextIOWrapper) -> Iterator[Tuple[int, Any]]:
+        for line, raw in enumerate(text, start=1):
+            if not raw.strip():
+                continue
+            try:
+                yield line, json.loads(raw)
+            except json.JSONDecodeError:
+                yield line, None
+
+    def _parse_row(self, row: Any) -> Tuple[str, tuple]:
+        """Turn one file row into ('debt' | 'reminder', insert values); raises ValueError"""
+        if not isinstance(row, dict):
+            raise ValueError("ردیف نامعتبر است.")
+
+        kind = _text(row.get('kind')).lower() or 'debt'
+        if kind == 'reminder':
+            title = _text(row.get('title'))
+            reminder_date = _text(row.get('reminder_date'))
+            if not title:
+                raise ValueError("عنوان یادآور نمی‌تواند خالی باشد.")
+            try:
+                datetime.fromisoformat(reminder_date)
+            except ValueError:
+                raise ValueError("فرمت تاریخ یادآور نامعتبر است.")
+            return kind, (title, reminder_date, _text(row.get('description')),
+                          _flag(row.get('is_active'), True))
+
+        if kind != 'debt':
+            raise ValueError(f"نوع ردیف نامعتبر است: {kind}")
+        category = _text(row.get('category'))
+        due_date = _text(row.get('due_date'))
+        description = _text(row.get('description'))
+        recurrence = _text(row.get('recurrence')) or 'one-time'
+        try:
+            amount = int(_text(row.get('amount')).replace(',', '').replace('،', ''))
+        except ValueError:
+            raise ValueError("مبلغ باید عدد باشد.")
+        if amount > MAX_AMOUNT:
+            raise ValueError("مبلغ بیش از حد بزرگ است.")
+        error = self.debt_manager.validate_debt_data(category, amount, due_date, description, recurrence)
+        if error:
+            raise ValueError(error)
+        return kind, (category, amount, due_date, description, recurrence,
+                      _flag(row.get('is_paid'), False))
+
+def render_import_report(result: Dict[str, Any]) -> str:
+    """Persian summary of an import_file result"""
+    text = (
+        "📥 درون‌ریزی انجام شد.\n"
+        f"✅ بدهی‌ها: {result['debts']:,}\n"
+        f"🔔 یادآورها: {result['reminders']:,}"
+    )
+    if result['error_count']:
+        text += f"\n\n⚠️ {result['error_count']:,} ردیف نامعتبر رد شد:"
+        for line, error in result['errors']:
+            text += f"\n• ردیف {line}: {error}" if line else f"\n• {error}"
+        if result['error_count'] > len(result['errors']):
+            text += "\n• ..."
+    return text
@@ -0,0 +1,124 @@
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+import pytz
+
+TEHRAN_TZ = pytz.timezone('Asia/Tehran')
+
+# Jalali years covered by the lookup table (1921-03-21 .. 2122-03-20)
+FIRST_YEAR = 1300
+LAST_YEAR = 1500
+# Distinct stored date strings remembered by the formatters
+CACHE_SIZE = 4096
+
+MONTH_NAMES = ['فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+               'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند']
+
+# Years in which the 33-year leap cycle is reset (Borkowski's algorithm)
+_BREAKS = [-61, 9, 38, 199, 426, 686, 756, 818, 1111, 1181, 1210, 1635, 2060, 2097,
+           2192, 2262, 2324, 2394, 2456, 3178]
+
+def _nowruz(jy: int) -> date:
+    """Gregorian date of 1 Farvardin of Jalali year `jy`"""
+    gy = jy + 621
+    leap_j = -14
+    jp = _BREAKS[0]
+    for jm in _BREAKS[1:]:
+        jump = jm - jp
+        if jy < jm:
+            break
+        leap_j += jump // 33 * 8 + jump % 33 // 4
+        jp = jm
+    n = jy - jp
+    leap_j += n // 33 * 8 + (n % 33 + 3) // 4
+    if jump % 33 == 4 and jump - n == 4:
+        leap_j += 1
+    leap_g = gy // 4 - (gy // 100 + 1) * 3 // 4 - 150
+    return date(gy, 3, 20 + leap_j - leap_g)
+
+# Day ordinal of every Nowruz from FIRST_YEAR through LAST_YEAR + 1
+_YEAR_STARTS: List[int] = [_nowruz(jy).toordinal() for jy in range(FIRST_YEAR, LAST_YEAR + 2)]
+# First Gregorian day after the table
+TABLE_END = date.fromordinal(_YEAR_STARTS[-1])
+
+def to_jalali(day: date) -> Optional[Tuple[int, int, int]]:
+    """Convert a Gregorian date to (year, month, day), or None outside the table"""
+    ordinal = day.toordinal()
+    index = bisect_right(_YEAR_STARTS, ordinal) - 1
+    if index < 0 or index > LAST_YEAR - FIRST_YEAR:
+        return None
+    day_of_year = ordinal - _YEAR_STARTS[index]
+    # Farvardin..Shahrivar have 31 days, Mehr..Bahman 30, Esfand 29 or 30
+    if day_of_year < 186:
+        return FIRST_YEAR + index, day_of_year // 31 + 1, day_of_year % 31 + 1
+    day_of_year -= 186
+    return FIRST_YEAR + index, day_of_year // 30 + 7, day_of_year % 30 + 1
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_day(date_str: str) -> Optional[date]:
+    """Tehran calendar day of a stored ISO date/datetime string, or None if invalid"""
+    try:
+        if len(date_str) == 10:
+            return date.fromisoformat(date_str)
+        moment = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(TEHRAN_TZ)
+        return moment.date()
+    except (TypeError, ValueError):
+        return None
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_date(date_str: str) -> str:
+    """Format a stored date as Jalali YYYY/MM/DD, falling back to the input"""
+    day = parse_day(date_str)
+    if day is None:
+        return date_str
+    jalali = to_jalali(day)
+    if jalali is None:
+        return day.strftime('%Y/%m/%d')
+    return '%04d/%02d/%02d' % jalali
+
+def month_end(day: date) -> Optional[date]:
+    """Gregorian date of the last day of the Jalali month containing `day`"""
+    jalali = to_jalali(day)
+    if jalali is None:
+        return None
+    year, month, day_of_month = jalali
+    if month <= 6:
+        length = 31
+    elif month <= 11:
+        length = 30
+    else:
+        index = year - FIRST_YEAR
+        length = _YEAR_STARTS[index + 1] - _YEAR_STARTS[index] - 336
+    return day + timedelta(days=length - day_of_month)
+
+def month_start(day: date) -> Optional[date]:
+    """Gregorian date of the first day of the Jalali month containing `day`"""
+    jalali = to_jalali(day)
+    if jalali is None:
+        return None
+    return day - timedelta(days=jalali[2] - 1)
+
+def month_key(day: date) -> Optional[str]:
+    """Jalali YYYY/MM of `day`, the month key used by the debt totals"""
+    jalali = to_jalali(day)
+    if jalali is None:
+        return None
+    return '%04d/%02d' % jalali[:2]
+
+def month_label(key: str) -> str:
+    """Persian month name and year of a YYYY/MM month key, e.g. 'مهر 1405'"""
+    try:
+        year, month = key.split('/')
+        return f"{MONTH_NAMES[int(month) - 1]} {int(year)}"
+    except (ValueError, IndexError):
+        return key
+
+def month_starts() -> Iterator[Tuple[date, str]]:
+    """(first Gregorian day, YYYY/MM) of every Jalali month in the table"""
+    for index, ordinal in enumerate(_YEAR_STARTS[:-1]):
+        for month in range(12):
+            offset = month * 31 if month < 6 else 186 + (month - 6) * 30
+            yield date.fromordinal(ordinal + offset), '%04d/%02d' % (FIRST_YEAR + index, month + 1)
@@ -5,8 +5,44 @@ A Persian Telegram bot for managing debts and reminders
 """
 
 import os
+import sys
 import asyncio
-from bot_handler import BotHandler
+import argparse
+import secrets
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# bot_handler pulls in the whole telegram.ext/httpx stack, so it is only
+# imported once there is a token to run with
+
+DEFAULT_WEBHOOK_PORT = 8443
+
+def webhook_config():
+    """Webhook settings from the environment, or None to use long-polling.
+
+    WEBHOOK_URL is the public HTTPS address Telegram posts updates to; the
+    bot listens on WEBHOOK_LISTEN:WEBHOOK_PORT under the same path (put a
+    TLS-terminating proxy or load balancer in front). Every instance behind
+    one URL must share WEBHOOK_SECRET.
+    """
+    url = os.getenv('WEBHOOK_URL')
+    if not url:
+        return None
+
+    secret = os.getenv('WEBHOOK_SECRET')
+    if not secret:
+        secret = secrets.token_urlsafe(32)
+        print("⚠️ WEBHOOK_SECRET تنظیم نشده است؛ یک کلید موقت ساخته شد (برای چند نمونه کافی نیست).")
+    return {
+        'listen': os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        'port': int(os.getenv('WEBHOOK_PORT', DEFAULT_WEBHOOK_PORT)),
+        'url_path': urlparse(url).path.lstrip('/'),
+        'webhook_url': url,
+        'secret_token': secret,
+    }
 
 async def main():
     """Main function to run the bot"""
@@ -20,16 +56,88 @@ async def main():
         print("export TELEGRAM_BOT_TOKEN='your_bot_token_here'")
         return
 
+    # Reminders can be handed off to separate worker.py processes
+    run_scheduler = os.getenv('REMINDER_SCHEDULER', '1').lower() not in ('0', 'false', 'no', 'off')
+    # Keep an in-memory index of due debts instead of querying for them
+    due_index = os.getenv('REMINDER_DUE_INDEX', '0').lower() in ('1', 'true', 'yes', 'on')
+
+    from bot_handler import BotHandler
+    from metrics import exporter_config
+    from archive import archive_config
+
     # Create bot handler
     bot_handler = BotHandler()
 
     try:
         # Run the bot
-        await bot_handler.run_bot(token)
+        await bot_handler.run_bot(token, run_scheduler, webhook_config(), exporter_config(),
+                                   archive_config(), due_index)
     except Exception as e:
         print(f"❌ خطا در اجرای ربات: {e}")
 
+class StartupProfile:
+    """Wall-clock time of each named startup phase"""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def render(self) -> str:
+        width = max(len(name) for name, _ in self.phases)
+        lines = [f"  {name:<{width}}  {seconds * 1000:>8.1f} ms" for name, seconds in self.phases]
+        total = sum(seconds for _, seconds in self.phases)
+        lines.append(f"  {'total':<{width}}  {total * 1000:>8.1f} ms")
+        return "\n".join(lines)
+
+def profile_startup(db_path: Optional[str] = None) -> StartupProfile:
+    """Time imports and initialization phase by phase without connecting to Telegram.
+
+    Without `db_path` the database is created in a temporary directory, so
+    the schema phase covers every migration and the bot's own database is
+    never opened. Pass a copy of a real database to time the usual
+    up-to-date schema check instead.
+    """
+    if db_path is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            return profile_startup(os.path.join(tmp, 'debts.db'))
+    profile = StartupProfile()
+    with profile.phase('import telegram.ext'):
+        import telegram.ext  # noqa: F401
+    with profile.phase('import bot_handler'):
+        from bot_handler import BotHandler
+        from database import Database
+    with profile.phase('Database() + schema check'):
+        db = Database(db_path)
+    with profile.phase('BotHandler()'):
+        bot_handler = BotHandler(db)
+    with profile.phase('build_application()'):
+        # The token is not checked until the bot connects
+        bot_handler.build_application(os.getenv('TELEGRAM_BOT_TOKEN') or '0:profile')
+    with profile.phase('close'):
+        bot_handler.async_db.close()
+    return profile
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report import and init time per startup phase, then exit')
+    parser.add_argument('--db', metavar='PATH',
+                        help='database to open with --profile-startup (default: a fresh temporary one)')
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.profile_startup:
+        print("⏱ زمان راه‌اندازی:")
+        print(profile_startup(args.db).render())
+        sys.exit(0)
     try:
         asyncio.run(main())
     except RuntimeError as e:
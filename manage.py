@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+ابزار نگهداری - Maintenance commands
+Offline tasks run against the bot's SQLite database.
+
+    python manage.py rebuild-summary --check
+    python manage.py archive --days 90
+"""
+
+import argparse
+import asyncio
+import sys
+from database import Database
+from async_database import AsyncDatabase
+from archive import Archiver, ARCHIVE_AFTER_DAYS
+
+def rebuild_summary(db: Database, args: argparse.Namespace) -> int:
+    """Compare debt_totals with the debts table and rebuild it when they differ"""
+    differences = db.rebuild_debt_totals(check_only=args.check)
+    if not differences:
+        print("✅ جدول خلاصه بدهی‌ها با جدول بدهی‌ها سازگار است.")
+        return 0
+    if args.check:
+        print(f"⚠️ {differences} ردیف از جدول خلاصه بدهی‌ها ناسازگار است.")
+        return 1
+    print(f"🔧 جدول خلاصه بدهی‌ها بازسازی شد ({differences} ردیف ناسازگار بود).")
+    return 0
+
+def archive(db: Database, args: argparse.Namespace) -> int:
+    """Move old paid debts and inactive reminders into the history tables now"""
+    async_db = AsyncDatabase(db)
+    try:
+        result = asyncio.run(Archiver(async_db, args.days).run())
+    finally:
+        async_db.close()
+    print(f"📦 {result['debts']} بدهی و {result['reminders']} یادآور بایگانی شد "
+          f"({result['pages']} صفحه آزاد شد).")
+    return 0
+
+def vacuum(db: Database, args: argparse.Namespace) -> int:
+    """Switch the file to incremental vacuum, rewriting it once"""
+    if db.enable_incremental_vacuum():
+        print("✅ پایگاه داده بازسازی شد و از این پس فضای آزاد به تدریج برگردانده می‌شود.")
+    else:
+        print("✅ حالت incremental vacuum از قبل فعال است.")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--db', default='data/debts.db', help='SQLite file (default: data/debts.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = commands.add_parser('rebuild-summary', help='check or rebuild the /summary totals')
+    rebuild.add_argument('--check', action='store_true',
+                         help='only report differences, exit with 1 if there are any')
+    rebuild.set_defaults(func=rebuild_summary)
+
+    archive_parser = commands.add_parser('archive', help='archive paid debts and spent reminders')
+    archive_parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                                help=f'minimum age in days (default: {ARCHIVE_AFTER_DAYS})')
+    archive_parser.set_defaults(func=archive)
+
+    vacuum_parser = commands.add_parser('vacuum', help='enable incremental vacuum (rewrites the file)')
+    vacuum_parser.set_defaults(func=vacuum)
+
+    args = parser.parse_args()
+    db = Database(args.db)
+    try:
+        return args.func(db, args)
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import abc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Reminder runs take minutes for large user bases
+RUN_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+# Database calls made while handling one update
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+# Prometheus endpoint; METRICS_PORT=0 turns it off
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_METRICS_PORT = 9464
+# Seconds between summaries printed to the log; 0 turns them off
+DEFAULT_LOG_INTERVAL = 300
+# Slowest entries listed per section of the log summary
+SUMMARY_TOP = 5
+
+HANDLER_SECONDS = 'debtbot_handler_seconds'
+HANDLER_ERRORS = 'debtbot_handler_errors_total'
+HANDLER_DB_CALLS = 'debtbot_handler_db_calls'
+DB_SECONDS = 'debtbot_db_seconds'
+DB_ERRORS = 'debtbot_db_errors_total'
+REMINDER_RUN_SECONDS = 'debtbot_reminder_run_seconds'
+REMINDER_RUN_ERRORS = 'debtbot_reminder_run_errors_total'
+REMINDER_MESSAGES_SENT = 'debtbot_reminder_messages_sent_total'
+REMINDER_MESSAGES_FAILED = 'debtbot_reminder_messages_failed_total'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class Metrics:
+    """Thread-safe registry of counters and histograms with Prometheus text output.
+
+    Metrics are created on first use; describe() only adds their type,
+    help text and buckets. Observations come from the event loop and from
+    the database thread, so every update takes a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.started_at = time.time()
+
+    def describe(self, name: str, kind: str, help_text: str,
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._families[name] = (kind, help_text, buckets)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                buckets = self._families.get(name, ('', '', LATENCY_BUCKETS))[2]
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms)):
+                kind, help_text, _ = self._families.get(name, ('untyped', '', ()))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{_labels(key)} {_number(value)}")
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key, le=_number(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """Short human-readable digest of the slowest handlers and queries and of reminder runs"""
+        with self._lock:
+            handlers = self._histograms.get(HANDLER_SECONDS, {})
+            queries = self._histograms.get(DB_SECONDS, {})
+            runs = self._histograms.get(REMINDER_RUN_SECONDS, {})
+            handler_errors = self._counters.get(HANDLER_ERRORS, {})
+            sent = self._counters.get(REMINDER_MESSAGES_SENT, {})
+            failed = self._counters.get(REMINDER_MESSAGES_FAILED, {})
+
+            lines = [f"📊 Metrics ({int(time.time() - self.started_at)}s):"]
+            for title, series, errors in (('handlers', handlers, handler_errors),
+                                          ('db', queries, self._counters.get(DB_ERRORS, {}))):
+                top = sorted(series.items(), key=lambda item: -item[1].sum)[:SUMMARY_TOP]
+                for key, histogram in top:
+                    lines.append(
+                        f"  {title} {key[0][1]}: {histogram.count} calls, "
+                        f"{int(errors.get(key, 0))} errors, "
+                        f"mean {histogram.sum / histogram.count * 1000:.1f} ms, "
+                        f"p95 <= {histogram.quantile(0.95) * 1000:g} ms")
+            for key, histogram in sorted(runs.items()):
+                lines.append(
+                    f"  reminders {key[0][1]}: {histogram.count} runs, "
+                    f"mean {histogram.sum / histogram.count:.1f} s, "
+                    f"{int(sent.get(key, 0))} sent, {int(failed.get(key, 0))} failed")
+        return '\n'.join(lines)
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+# Process-wide registry
+METRICS = Metrics()
+METRICS.describe(HANDLER_SECONDS, 'histogram', 'Time spent in a bot handler callback.')
+METRICS.describe(HANDLER_ERRORS, 'counter', 'Handler callbacks that raised.')
+METRICS.describe(HANDLER_DB_CALLS, 'histogram', 'Database calls made while handling one update.',
+                 DB_CALL_BUCKETS)
+METRICS.describe(DB_SECONDS, 'histogram', 'Time spent in a Database method on the DB thread.')
+METRICS.describe(DB_ERRORS, 'counter', 'Database methods that raised.')
+METRICS.describe(REMINDER_RUN_SECONDS, 'histogram', 'Duration of a reminder run.', RUN_BUCKETS)
+METRICS.describe(REMINDER_RUN_ERRORS, 'counter', 'Reminder runs that failed.')
+METRICS.describe(REMINDER_MESSAGES_SENT, 'counter', 'Reminder messages delivered.')
+METRICS.describe(REMINDER_MESSAGES_FAILED, 'counter', 'Reminder messages given up on.')
+
+# Database calls of the update being handled in the current task
+_db_calls: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar('db_calls', default=None)
+
+def count_db_call():
+    """Attribute one database call to the update being handled (if any)"""
+    calls = _db_calls.get()
+    if calls is not None:
+        calls[0] += 1
+
+def instrument_handler(callback: Callable, name: Optional[str] = None,
+                       registry: Metrics = METRICS) -> Callable:
+    """Wrap an async handler callback to record its latency, errors and DB calls"""
+    if getattr(callback, '__instrumented__', False):
+        return callback
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        calls = [0]
+        token = _db_calls.set(calls)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            registry.inc(HANDLER_ERRORS, handler=name)
+            raise
+        finally:
+            registry.observe(HANDLER_SECONDS, time.perf_counter() - start, handler=name)
+            registry.observe(HANDLER_DB_CALLS, calls[0], handler=name)
+            _db_calls.reset(token)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def instrument_handlers(application, registry: Metrics = METRICS):
+    """Instrument the callbacks of every handler registered on a PTB Application"""
+    from telegram.ext import ConversationHandler
+
+    def wrap(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points + handler.fallbacks:
+                wrap(inner)
+            for state_handlers in handler.states.values():
+                for inner in state_handlers:
+                    wrap(inner)
+        else:
+            handler.callback = instrument_handler(handler.callback, registry=registry)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            wrap(handler)
+
+def _timed_iterator(iterator: Iterator, name: str, registry: Metrics, elapsed: float = 0.0) -> Iterator:
+    """Yield from `iterator`, observing the time spent producing rows once it is drained or closed"""
+    # Only the time spent producing rows counts, not the consumer's
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                registry.inc(DB_ERRORS, method=name)
+                raise
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+        registry.observe(DB_SECONDS, elapsed, method=name)
+
+def _instrument_method(method: Callable, name: str, registry: Metrics) -> Callable:
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            return (yield from _timed_iterator(method(*args, **kwargs), name, registry))
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            registry.inc(DB_ERRORS, method=name)
+            registry.observe(DB_SECONDS, time.perf_counter() - start, method=name)
+            raise
+        elapsed = time.perf_counter() - start
+        if isinstance(result, abc.Iterator):
+            # Streaming methods build their generators lazily; time the rows as they are read
+            return _timed_iterator(result, name, registry, elapsed)
+        registry.observe(DB_SECONDS, elapsed, method=name)
+        return result
+    return wrapper
+
+def instrument_database(db, registry: Metrics = METRICS):
+    """Time every public method of a Database instance (in place)"""
+    for name, _ in inspect.getmembers(type(db), inspect.isfunction):
+        if not name.startswith('_') and not getattr(db.__dict__.get(name), '__instrumented__', False):
+            wrapper = _instrument_method(getattr(db, name), name, registry)
+            wrapper.__instrumented__ = True
+            setattr(db, name, wrapper)
+    return db
+
+@contextmanager
+def reminder_run(kind: str, delivery, registry: Metrics = METRICS) -> Iterator[None]:
+    """Record the duration of a reminder run and the messages it sent or failed"""
+    before = delivery.stats()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc(REMINDER_RUN_ERRORS, run=kind)
+        raise
+    finally:
+        after = delivery.stats()
+        registry.observe(REMINDER_RUN_SECONDS, time.perf_counter() - start, run=kind)
+        registry.inc(REMINDER_MESSAGES_SENT, after['sent'] - before['sent'], run=kind)
+        registry.inc(REMINDER_MESSAGES_FAILED, after['failed'] - before['failed'], run=kind)
+
+def exporter_config() -> Dict[str, Any]:
+    """Exporter settings from METRICS_HOST, METRICS_PORT and METRICS_LOG_INTERVAL"""
+    return {
+        'host': os.getenv('METRICS_HOST', DEFAULT_METRICS_HOST),
+        'port': int(os.getenv('METRICS_PORT', DEFAULT_METRICS_PORT)),
+        'log_interval': float(os.getenv('METRICS_LOG_INTERVAL', DEFAULT_LOG_INTERVAL)),
+    }
+
+class MetricsExporter:
+    """Serves GET /metrics over plain HTTP and prints a summary periodically"""
+
+    def __init__(self, registry: Metrics = METRICS, host: str = DEFAULT_METRICS_HOST,
+                 port: int = DEFAULT_METRICS_PORT, log_interval: float = DEFAULT_LOG_INTERVAL):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._log_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.port:
+            try:
+                self._server = await asyncio.start_server(self._serve, self.host, self.port)
+                print(f"📊 Metrics on http://{self.host}:{self.port}/metrics")
+            except OSError as e:
+                print(f"Error starting metrics endpoint: {e}")
+        if self.log_interval > 0:
+            self._log_task = asyncio.create_task(self._log_loop())
+
+    async def stop(self):
+        if self._log_task is not None:
+            self._log_task.cancel()
+            self._log_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            print(self.registry.summary())
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the headers; requests have no body
+            while await asyncio.wait_for(reader.readline(), 5) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
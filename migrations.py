@@ -0,0 +1,351 @@
+import sqlite3
+from typing import Callable, List
+import jalali
+
+# Each migration upgrades the schema by exactly one version. The version a
+# database is at is stored in PRAGMA user_version, so migrations are only
+# ever appended to this list, never edited or reordered.
+
+# Jalali YYYY/MM month of a YYYY-MM-DD day expression, looked up in
+# jalali_months; days outside the table fall back to the Gregorian YYYY-MM
+DEBT_MONTH_SQL = '''COALESCE(NULLIF((
+    SELECT month FROM jalali_months WHERE start_day <= {day} ORDER BY start_day DESC LIMIT 1
+), ''), substr({day}, 1, 7), '')'''
+
+# Shape every stored due_day / reminder_day must have
+DAY_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+
+def _totals_add(row: str) -> str:
+    """Trigger statement adding debt `row` (NEW/OLD) to debt_totals"""
+    return f'''
+        INSERT INTO debt_totals (user_id, month, category, unpaid_count, unpaid_amount,
+                                 paid_count, paid_amount)
+        VALUES ({row}.user_id, {DEBT_MONTH_SQL.format(day=row + '.due_day')}, {row}.category,
+                CASE WHEN {row}.is_paid THEN 0 ELSE 1 END,
+                CASE WHEN {row}.is_paid THEN 0 ELSE {row}.amount END,
+                CASE WHEN {row}.is_paid THEN 1 ELSE 0 END,
+                CASE WHEN {row}.is_paid THEN {row}.amount ELSE 0 END)
+        ON CONFLICT (user_id, month, category) DO UPDATE SET
+            unpaid_count = unpaid_count + excluded.unpaid_count,
+            unpaid_amount = unpaid_amount + excluded.unpaid_amount,
+            paid_count = paid_count + excluded.paid_count,
+            paid_amount = paid_amount + excluded.paid_amount;
+    '''
+
+def _totals_subtract(row: str) -> str:
+    """Trigger statements removing debt `row` (NEW/OLD) from debt_totals"""
+    key = (f"user_id = {row}.user_id AND category = {row}.category "
+           f"AND month = {DEBT_MONTH_SQL.format(day=row + '.due_day')}")
+    return f'''
+        UPDATE debt_totals SET
+            unpaid_count = unpaid_count - CASE WHEN {row}.is_paid THEN 0 ELSE 1 END,
+            unpaid_amount = unpaid_amount - CASE WHEN {row}.is_paid THEN 0 ELSE {row}.amount END,
+            paid_count = paid_count - CASE WHEN {row}.is_paid THEN 1 ELSE 0 END,
+            paid_amount = paid_amount - CASE WHEN {row}.is_paid THEN {row}.amount ELSE 0 END
+        WHERE {key};
+        DELETE FROM debt_totals WHERE {key} AND unpaid_count = 0 AND paid_count = 0;
+    '''
+
+def _initial_schema(cursor: sqlite3.Cursor):
+    """Version 1: the original debts and reminders tables"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS debts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            description TEXT,
+            recurrence TEXT DEFAULT 'one-time',
+            is_paid BOOLEAN DEFAULT FALSE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            paid_at TEXT
+        )
+    ''')
+
+    # Custom reminders for non-debt events
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            reminder_date TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _due_day_columns(cursor: sqlite3.Cursor):
+    """Version 2: normalized YYYY-MM-DD day columns and their indexes.
+
+    Filtering on date(due_date) cannot use an index, so the day is stored
+    once at write time and queried directly.
+    """
+    cursor.execute('ALTER TABLE debts ADD COLUMN due_day TEXT')
+    cursor.execute('UPDATE debts SET due_day = date(due_date)')
+    cursor.execute('ALTER TABLE reminders ADD COLUMN reminder_day TEXT')
+    cursor.execute('UPDATE reminders SET reminder_day = date(reminder_date)')
+
+    cursor.execute('CREATE INDEX idx_debts_paid_due ON debts (is_paid, due_day)')
+    cursor.execute('CREATE INDEX idx_debts_user_paid_due ON debts (user_id, is_paid, due_day)')
+    cursor.execute('CREATE INDEX idx_reminders_active_day ON reminders (is_active, reminder_day)')
+    cursor.execute('CREATE INDEX idx_reminders_user_active_day ON reminders (user_id, is_active, reminder_day)')
+
+def _delivery_ledger(cursor: sqlite3.Cursor):
+    """Version 3: ledger of claimed and sent reminder deliveries.
+
+    target is 'debt:<id>' or 'reminder:<id>'; occurrence_day is the run day
+    for debt reminders and the reminder day for custom reminders.
+    """
+    cursor.execute('''
+        CREATE TABLE reminder_deliveries (
+            target TEXT NOT NULL,
+            occurrence_day TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'claimed',
+            claim_id TEXT NOT NULL,
+            claimed_at REAL NOT NULL,
+            sent_at REAL,
+            PRIMARY KEY (target, occurrence_day, stage)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX idx_deliveries_claim ON reminder_deliveries (claim_id)')
+
+def _user_ordered_indexes(cursor: sqlite3.Cursor):
+    """Version 4: indexes for streaming upcoming rows in (user_id, day, id) order"""
+    cursor.execute('CREATE INDEX idx_debts_paid_user_due ON debts (is_paid, user_id, due_day)')
+    cursor.execute('CREATE INDEX idx_reminders_active_user_day ON reminders (is_active, user_id, reminder_day)')
+
+def _shard_leases(cursor: sqlite3.Cursor):
+    """Version 5: leases through which reminder workers split users into shards.
+
+    expires_at is when the current owner's lease runs out, or the time the
+    shard became free if it has no owner.
+    """
+    cursor.execute('''
+        CREATE TABLE shard_leases (
+            shard INTEGER PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+def _recurrence_rollover(cursor: sqlite3.Cursor):
+    """Version 6: bookkeeping for rolling recurring debts forward.
+
+    recurrence_day is the day of month the series is anchored to, so a debt
+    clamped to a short month returns to its original day afterwards.
+    rolled_over marks debts whose next occurrence already exists; debts
+    paid before this version never had one created and are marked as done.
+    """
+    cursor.execute('ALTER TABLE debts ADD COLUMN recurrence_day INTEGER')
+    cursor.execute('ALTER TABLE debts ADD COLUMN rolled_over BOOLEAN DEFAULT FALSE')
+    cursor.execute("UPDATE debts SET recurrence_day = CAST(strftime('%d', due_day) AS INTEGER)")
+    cursor.execute('UPDATE debts SET rolled_over = is_paid')
+    cursor.execute('''
+        CREATE INDEX idx_debts_rollover ON debts (due_day)
+        WHERE rolled_over = FALSE AND recurrence IN ('weekly', 'monthly', 'yearly')
+    ''')
+
+def _conversation_state(cursor: sqlite3.Cursor):
+    """Version 7: persisted per-user data and ConversationHandler states.
+
+    Values are JSON; conversation keys are JSON arrays. updated_at (unix
+    time) drives TTL eviction of abandoned flows.
+    """
+    cursor.execute('''
+        CREATE TABLE persisted_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE persisted_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX idx_persisted_user_data_updated ON persisted_user_data (updated_at)')
+    cursor.execute('CREATE INDEX idx_persisted_conversations_updated ON persisted_conversations (updated_at)')
+
+def _debt_totals(cursor: sqlite3.Cursor):
+    """Version 8: per user, Jalali month and category totals of owed and paid debts.
+
+    Triggers on debts keep debt_totals in step with every insert, update
+    and delete inside the writing transaction, so summaries never scan the
+    debts themselves. Rows whose counts drop to zero are removed.
+    """
+    cursor.execute('''
+        CREATE TABLE jalali_months (
+            start_day TEXT PRIMARY KEY,
+            month TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    months = [(start.isoformat(), key) for start, key in jalali.month_starts()]
+    # Days from the end of the table on have no Jalali month
+    months.append((jalali.TABLE_END.isoformat(), ''))
+    cursor.executemany('INSERT INTO jalali_months (start_day, month) VALUES (?, ?)', months)
+
+    cursor.execute('''
+        CREATE TABLE debt_totals (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            unpaid_count INTEGER NOT NULL DEFAULT 0,
+            unpaid_amount INTEGER NOT NULL DEFAULT 0,
+            paid_count INTEGER NOT NULL DEFAULT 0,
+            paid_amount INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(f'CREATE TRIGGER debt_totals_insert AFTER INSERT ON debts BEGIN {_totals_add("NEW")} END')
+    cursor.execute(f'CREATE TRIGGER debt_totals_delete AFTER DELETE ON debts BEGIN {_totals_subtract("OLD")} END')
+    # Only changes to the columns the totals depend on (not rolled_over, paid_at, ...)
+    cursor.execute(f'''
+        CREATE TRIGGER debt_totals_update
+        AFTER UPDATE OF user_id, category, amount, due_day, is_paid ON debts
+        BEGIN {_totals_subtract("OLD")} {_totals_add("NEW")} END
+    ''')
+
+    cursor.execute(f'''
+        INSERT INTO debt_totals (user_id, month, category, unpaid_count, unpaid_amount,
+                                 paid_count, paid_amount)
+        SELECT user_id, {DEBT_MONTH_SQL.format(day='due_day')} AS month, category,
+               SUM(CASE WHEN is_paid THEN 0 ELSE 1 END), SUM(CASE WHEN is_paid THEN 0 ELSE amount END),
+               SUM(CASE WHEN is_paid THEN 1 ELSE 0 END), SUM(CASE WHEN is_paid THEN amount ELSE 0 END)
+        FROM debts
+        GROUP BY user_id, month, category
+    ''')
+
+def _history_tables(cursor: sqlite3.Cursor):
+    """Version 9: history tables for archived paid debts and spent reminders.
+
+    Rows keep their ids and columns and gain archived_at. Moving a debt
+    into debts_history must not take it out of debt_totals, so the delete
+    trigger skips debts that already have a history row.
+    """
+    cursor.execute('''
+        CREATE TABLE debts_history (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            description TEXT,
+            recurrence TEXT,
+            is_paid BOOLEAN,
+            created_at TEXT,
+            paid_at TEXT,
+            due_day TEXT,
+            recurrence_day INTEGER,
+            rolled_over BOOLEAN,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE reminders_history (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            reminder_date TEXT NOT NULL,
+            is_active BOOLEAN,
+            created_at TEXT,
+            reminder_day TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_debts_history_user_due ON debts_history (user_id, is_paid, due_day)')
+    cursor.execute('CREATE INDEX idx_reminders_history_user_day ON reminders_history (user_id, is_active, reminder_day)')
+
+    cursor.execute('DROP TRIGGER debt_totals_delete')
+    cursor.execute(f'''
+        CREATE TRIGGER debt_totals_delete AFTER DELETE ON debts
+        WHEN NOT EXISTS (SELECT 1 FROM debts_history WHERE id = OLD.id)
+        BEGIN {_totals_subtract("OLD")} END
+    ''')
+
+def _delivery_day_index(cursor: sqlite3.Cursor):
+    """Version 10: index for purging delivery ledger rows by occurrence day"""
+    cursor.execute('CREATE INDEX idx_deliveries_day ON reminder_deliveries (occurrence_day)')
+
+def _required_days(cursor: sqlite3.Cursor):
+    """Version 11: due_day and reminder_day must hold a YYYY-MM-DD day.
+
+    date() left them NULL for dates SQLite does not parse (e.g. 20241225),
+    which hid those rows from every reminder query. Such rows are filled in
+    from their date strings, and triggers reject NULL or malformed days
+    from now on (SQLite cannot add a CHECK to an existing column).
+    """
+    for table, source, column in (('debts', 'due_date', 'due_day'),
+                                  ('reminders', 'reminder_date', 'reminder_day')):
+        cursor.execute(f'SELECT id, {source} FROM {table} WHERE {column} IS NULL')
+        days = [(day.isoformat(), row_id) for row_id, value in cursor.fetchall()
+                for day in (jalali.parse_day(value),) if day is not None]
+        cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', days)
+        malformed = f"NEW.{column} IS NULL OR NEW.{column} NOT GLOB '{DAY_GLOB}'"
+        for event in ('INSERT', f'UPDATE OF {column}'):
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_{column}_{event.split()[0].lower()}_check
+                BEFORE {event} ON {table} WHEN {malformed}
+                BEGIN SELECT RAISE(ABORT, '{table}.{column} must be a YYYY-MM-DD day'); END
+            ''')
+    cursor.execute('''
+        UPDATE debts SET recurrence_day = CAST(strftime('%d', due_day) AS INTEGER)
+        WHERE recurrence_day IS NULL
+    ''')
+
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _initial_schema,
+    _due_day_columns,
+    _delivery_ledger,
+    _user_ordered_indexes,
+    _shard_leases,
+    _recurrence_rollover,
+    _conversation_state,
+    _debt_totals,
+    _history_tables,
+    _delivery_day_index,
+    _required_days,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database file"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply all pending migrations and return the resulting version.
+
+    Every migration runs in its own IMMEDIATE transaction together with the
+    user_version bump, so a failed upgrade leaves the previous version
+    intact and two processes starting at once cannot both apply it.
+    """
+    version = get_version(conn)
+    while version < SCHEMA_VERSION:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            # Another process may have migrated while we waited for the lock
+            version = get_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.commit()
+                break
+            MIGRATIONS[version](cursor)
+            version += 1
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return version
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from telegram.ext import Application, BasePersistence, PersistenceInput
+from async_database import AsyncDatabase
+
+# Seconds between the Application handing changed data to the persistence
+PERSISTENCE_INTERVAL = 10
+# Conversations and user data untouched this long count as abandoned
+CONVERSATION_TTL = 30 * 60
+# Most users whose data is kept in memory; the least recently active go first
+MAX_USER_DATA_ENTRIES = 10000
+# Seconds between eviction sweeps
+EVICTION_INTERVAL = 5 * 60
+# Failed writes are retried after this many seconds, doubled each time up to
+# WRITE_RETRY_MAX; after WRITE_ATTEMPTS the changes wait for the next write
+WRITE_RETRY_BASE = 1.0
+WRITE_RETRY_MAX = 60.0
+WRITE_ATTEMPTS = 5
+
+logger = logging.getLogger(__name__)
+
+class SQLitePersistence(BasePersistence):
+    """Keeps user_data and ConversationHandler states in the bot's SQLite database.
+
+    Changes handed over by the Application are buffered and written in a
+    single transaction per batch (write-behind). At startup only data
+    newer than `ttl` is loaded, for at most `max_entries` users, and
+    evict() drops abandoned or excess user data while the bot runs.
+    """
+
+    def __init__(self, async_db: AsyncDatabase, ttl: float = CONVERSATION_TTL,
+                 max_entries: int = MAX_USER_DATA_ENTRIES,
+                 update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True,
+                                        callback_data=False),
+            update_interval=update_interval,
+        )
+        self.async_db = async_db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Changes not yet written; None means delete
+        self._pending_users: Dict[int, Optional[str]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        # Last time each in-memory user's data changed (unix time)
+        self._touched: Dict[int, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stats = {'batches': 0, 'rows_written': 0, 'write_errors': 0,
+                       'evicted': 0, 'purged': 0}
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self.async_db.run(self.async_db.db.load_user_data,
+                                       time.time() - self.ttl, self.max_entries)
+        user_data = {}
+        for user_id, data, updated_at in rows:
+            user_data[user_id] = json.loads(data)
+            self._touched[user_id] = updated_at
+        return user_data
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        rows = await self.async_db.run(self.async_db.db.load_conversations, name,
+                                       time.time() - self.ttl)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        state = None if new_state is None else json.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_write()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]):
+        self._touched[user_id] = time.time()
+        # Finished flows clear user_data; there is nothing left to keep
+        self._pending_users[user_id] = json.dumps(data, ensure_ascii=False) if data else None
+        self._schedule_write()
+
+    async def drop_user_data(self, user_id: int):
+        self._touched.pop(user_id, None)
+        self._pending_users[user_id] = None
+        self._schedule_write()
+
+    async def flush(self):
+        """Write everything still buffered (called by the Application on shutdown)"""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_pending()
+
+    def _schedule_write(self):
+        # The Application hands over all changes of one run back to back,
+        # so a task started now writes them together once they are queued
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        failures = 0
+        while self._pending_users or self._pending_conversations:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            try:
+                await self.async_db.run(
+                    self.async_db.db.save_persisted_state,
+                    list(users.items()),
+                    [(name, key, state) for (name, key), state in conversations.items()],
+                    time.time(),
+                )
+                self._stats['batches'] += 1
+                self._stats['rows_written'] += len(users) + len(conversations)
+                failures = 0
+            except Exception:
+                # Put the batch back; changes queued since are newer and win
+                self._pending_users = {**users, **self._pending_users}
+                self._pending_conversations = {**conversations, **self._pending_conversations}
+                failures += 1
+                self._stats['write_errors'] += 1
+                if failures >= WRITE_ATTEMPTS:
+                    logger.exception("Saving conversation state failed %d times; keeping %d changes "
+                                     "for the next write", failures, len(users) + len(conversations))
+                    return
+                delay = min(WRITE_RETRY_MAX, WRITE_RETRY_BASE * 2 ** (failures - 1))
+                logger.warning("Saving conversation state failed, retrying in %.1fs", delay, exc_info=True)
+                await asyncio.sleep(delay)
+
+    async def evict(self, application: Application) -> int:
+        """Drop in-memory user data that is older than the TTL or beyond max_entries.
+
+        Also purges abandoned rows from the database. Returns the number
+        of users evicted from memory.
+        """
+        now = time.time()
+        cutoff = now - self.ttl
+        # Users seen for the first time count as active now
+        touched = {user_id: self._touched.setdefault(user_id, now) for user_id in application.user_data}
+        evicted = [user_id for user_id, at in touched.items() if at < cutoff]
+        remaining = len(touched) - len(evicted)
+        if remaining > self.max_entries:
+            active = sorted((at, user_id) for user_id, at in touched.items() if at >= cutoff)
+            evicted.extend(user_id for _, user_id in active[:remaining - self.max_entries])
+
+        for user_id in evicted:
+            application.drop_user_data(user_id)
+            self._touched.pop(user_id, None)
+        self._stats['evicted'] += len(evicted)
+        self._stats['purged'] += await self.async_db.run(self.async_db.db.purge_persisted_state, cutoff)
+        return len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['pending'] = len(self._pending_users) + len(self._pending_conversations)
+        stats['tracked_users'] = len(self._touched)
+        return stats
+
+    # Chat data, bot data and callback data are not persisted
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Any):
+        pass
+
+    async def update_bot_data(self, data: Any):
+        pass
+
+    async def update_callback_data(self, data: Any):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any):
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any):
+        pass
@@ -1,117 +1,399 @@
 import asyncio
-from datetime import datetime, timedelta
+import itertools
+from datetime import datetime, date, time, timedelta
 import pytz
-from typing import Dict, Any, List
-from database import Database
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from async_database import AsyncDatabase
+from database import DeliveryKey, ShardFilter, STREAM_PAGE_SIZE
 from debt_manager import DebtManager
+from scheduler import Clock, Scheduler
+from telegram.constants import MessageLimit
+from delivery import DeliveryQueue
+from due_index import DueIndex
+import jalali
+import metrics
+
+# Local (Tehran) hour at which the daily reminder run fires
+DAILY_REMINDER_HOUR = 9
+# Local time at which lapsed recurring debts get their next occurrence
+ROLLOVER_TIME = time(0, 5)
+# Delay before re-checking custom reminders that could not be delivered
+CUSTOM_RETRY_INTERVAL = timedelta(hours=1)
+# How long a delivery claim stays valid before another run may take it over
+CLAIM_LEASE = timedelta(minutes=10)
+# Number of digests whose outcome is written to the ledger in one transaction
+DELIVERY_BATCH_SIZE = 500
+# Days ahead the daily digest covers for debts (overdue debts are always included)
+DEBT_REMINDER_DAYS = 7
+# Delivery ledger rows are purged once their occurrence day is this many days old
+DELIVERY_RETENTION_DAYS = DEBT_REMINDER_DAYS
+# Ledger rows deleted per transaction when purging
+DELIVERY_PURGE_BATCH_SIZE = 5000
+DIGEST_HEADER = "📬 یادآورهای شما:"
+DIGEST_SEPARATOR = "\n\n"
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
 
 class ReminderService:
-    def __init__(self, bot, db: Database, debt_manager: DebtManager):
+    def __init__(self, bot, async_db: AsyncDatabase, debt_manager: DebtManager,
+                 clock: Optional[Clock] = None, shard_count: Optional[int] = None,
+                 due_index: bool = False):
         self.bot = bot
-        self.db = db
+        self.async_db = async_db
         self.debt_manager = debt_manager
+        # In worker mode only users in the shards this process holds are served
+        self.shard_count = shard_count
+        self.shards: List[int] = []
         self.tehran_tz = pytz.timezone('Asia/Tehran')
-        self._reminder_task = None
+        self.scheduler = Scheduler(clock or Clock(self.tehran_tz))
+        self.delivery = DeliveryQueue(bot)
+        # Optional in-memory index of unpaid debts by due day, loaded on first use
+        self.due_index: Optional[DueIndex] = DueIndex() if due_index else None
+        self._due_index_loaded = False
         self._running = False
 
     def start_scheduler(self):
         """Start the reminder scheduler"""
         if not self._running:
             self._running = True
-            self._reminder_task = asyncio.create_task(self._reminder_loop())
+            now = self.now()
+            # If today's run time has passed this resumes it right away; the
+            # delivery ledger makes sure only the unsent part goes out
+            self.scheduler.schedule('daily', self._at_reminder_hour(now.date()), self._daily_job)
+            # Recurring debts roll over shortly after midnight (idempotent, so
+            # a missed rollover simply runs at startup)
+            self.scheduler.schedule('rollover', self._at_local_time(now.date(), ROLLOVER_TIME),
+                                    self._rollover_job)
+            # Deliver anything already due, then re-arm for the next reminder
+            self.scheduler.schedule('custom', now, self._custom_job)
+            self.scheduler.start()
 
-    async def _reminder_loop(self):
-        """Main reminder loop that runs continuously"""
-        while self._running:
-            try:
-                # Check if it's 9 AM Tehran time
-                now = datetime.now(self.tehran_tz)
-                if now.hour == 9 and now.minute == 0:
-                    await self.send_daily_reminders()
-                    # Wait a bit to avoid sending multiple times in the same minute
-                    await asyncio.sleep(60)
+    def set_shards(self, shards: List[int]):
+        """Update the held shards; newly gained shards are caught up immediately"""
+        gained = set(shards) - set(self.shards)
+        self.shards = list(shards)
+        if gained and self._running and self.now() >= self._at_reminder_hour(self.now().date()):
+            self.scheduler.schedule('daily-sweep', self.now(), self.send_daily_reminders)
 
-                # Check for custom reminders every hour
-                await self.send_custom_reminders()
+    def _shard_filter(self) -> Optional[ShardFilter]:
+        if self.shard_count is None:
+            return None
+        return (self.shard_count, self.shards)
 
-                # Sleep for 1 hour before next check
-                await asyncio.sleep(3600)  # 1 hour
+    def now(self) -> datetime:
+        """Current time in Tehran according to the scheduler clock"""
+        return self.scheduler.clock.now().astimezone(self.tehran_tz)
 
-            except Exception as e:
-                print(f"Error in reminder loop: {e}")
-                await asyncio.sleep(60)  # Wait 1 minute before retrying
+    def pending_schedule(self) -> List[Tuple[datetime, str]]:
+        """Pending (fire time, job key) pairs, earliest first"""
+        return self.scheduler.pending()
 
+    def _at_local_time(self, day: date, at: time) -> datetime:
+        return self.tehran_tz.localize(datetime.combine(day, at))
 
+    def _at_reminder_hour(self, day: date) -> datetime:
+        return self._at_local_time(day, time(DAILY_REMINDER_HOUR))
 
-    async def send_daily_reminders(self):
-        """Send reminders for upcoming debts"""
+    def _next_daily_run(self, after: datetime) -> datetime:
+        run = self._at_reminder_hour(after.date())
+        if run <= after:
+            run = self._at_reminder_hour(after.date() + timedelta(days=1))
+        return run
+
+    def _custom_fire_time(self, reminder_day: str) -> datetime:
+        """Custom reminders go out at the reminder hour one day ahead"""
+        day = date.fromisoformat(reminder_day)
+        return self._at_reminder_hour(day - timedelta(days=1))
+
+    async def _rollover_job(self):
         try:
-            # Get debts due in the next 7 days
-            upcoming_debts = self.debt_manager.get_upcoming_reminders(7)
+            today = self.now().date()
+            created = await self.async_db.run(self.debt_manager.roll_over_recurring, today.isoformat())
+            print(f"Recurring debts rolled over: {created} created")
+        except Exception as e:
+            print(f"Error rolling over recurring debts: {e}")
+        finally:
+            tomorrow = self.now().date() + timedelta(days=1)
+            self.scheduler.schedule('rollover', self._at_local_time(tomorrow, ROLLOVER_TIME),
+                                    self._rollover_job)
 
-            # Group debts by user
-            user_debts = {}
-            for debt in upcoming_debts:
-                user_id = debt['user_id']
-                if user_id not in user_debts:
-                    user_debts[user_id] = []
-                user_debts[user_id].append(debt)
+    async def _daily_job(self):
+        try:
+            await self.send_daily_reminders()
+        finally:
+            now = self.now()
+            self.scheduler.schedule('daily', self._next_daily_run(now), self._daily_job)
+            # Once claims left behind by a crashed sender have expired, sweep
+            # again to deliver them (and retry failures)
+            self.scheduler.schedule('daily-sweep', now + CLAIM_LEASE, self.send_daily_reminders)
 
-            # Send reminders to each user
-            for user_id, debts in user_debts.items():
-                await self.send_user_reminders(user_id, debts)
+    async def _custom_job(self):
+        try:
+            await self.send_custom_reminders()
+        finally:
+            await self._schedule_next_custom()
+
+    async def _schedule_next_custom(self):
+        next_day = await self.async_db.get_next_reminder_day()
+        if next_day is None:
+            return
+        # Reminders still active after a run failed to send; back off
+        fire_time = max(self._custom_fire_time(next_day), self.now() + CUSTOM_RETRY_INTERVAL)
+        self.scheduler.schedule('custom', fire_time, self._custom_job, only_if_sooner=True)
 
+    def notify_debt_added(self, user_id: int, debt_id: int, due_date: str):
+        """Remind about a new debt that falls due before the next daily run"""
+        if not self._running:
+            return
+        now = self.now()
+        days_to_next_run = (self._next_daily_run(now).date() - now.date()).days
+        if self.calculate_days_until_due(due_date) < days_to_next_run:
+            self.scheduler.schedule(f"debt:{debt_id}", now, lambda: self._send_new_debt(user_id, debt_id))
+
+    async def _send_new_debt(self, user_id: int, debt_id: int):
+        """Deliver one new debt through the ledger, like a digest of the daily run"""
+        try:
+            today = self.now().date()
+            last_day = (today + timedelta(days=DEBT_REMINDER_DAYS)).isoformat()
+            # Re-read it: the debt may have been paid or deleted meanwhile
+            debts = await self.async_db.run(self.async_db.db.get_unpaid_debts, [debt_id], last_day)
+            if debts:
+                await self._send_digests(iter([(user_id, debts, [])]), today.isoformat())
         except Exception as e:
-            print(f"Error sending daily reminders: {e}")
+            print(f"Error sending reminder for new debt {debt_id}: {e}")
 
-    async def send_user_reminders(self, user_id: int, debts: List[Dict[str, Any]]):
-        """Send reminders to a specific user"""
+    def notify_reminder_added(self, reminder_date: str):
+        """Wake the scheduler early if a new reminder is due before the current deadline"""
+        if not self._running:
+            return
         try:
-            for debt in debts:
-                days_until_due = self.calculate_days_until_due(debt['due_date'])
+            fire_time = max(self._custom_fire_time(reminder_date[:10]), self.now())
+        except ValueError:
+            return
+        self.scheduler.schedule('custom', fire_time, self._custom_job, only_if_sooner=True)
 
-                # Only send reminders for debts due within 7 days, 3 days, 1 day, or today
-                if days_until_due <= 7:
-                    message = self.debt_manager.get_reminder_message(debt, days_until_due)
-                    await self.bot.send_message(chat_id=user_id, text=message)
+    async def send_daily_reminders(self):
+        """Send each user one digest of upcoming debts and custom reminders"""
+        try:
+            with metrics.reminder_run('daily', self.delivery):
+                today = self.now().date().isoformat()
+                db = self.async_db.db
+                shards = self._shard_filter()
+                # Debts due in the next 7 days and reminders due by tomorrow,
+                # streamed and merged per user so memory stays bounded
+                if self.due_index is not None:
+                    debts = await self._indexed_debts_by_user(self.now().date())
+                else:
+                    debts = db.iter_upcoming_debts_by_user(DEBT_REMINDER_DAYS, today, shards=shards)
+                users = self._merge_by_user(debts, db.iter_upcoming_reminders_by_user(1, today, shards=shards))
+                await self._send_digests(users, today)
+                await self.purge_deliveries(self.now().date())
+            print(f"Daily reminders delivered: {self.delivery.stats()}")
 
         except Exception as e:
-            print(f"Error sending reminder to user {user_id}: {e}")
+            print(f"Error sending daily reminders: {e}")
 
-    def calculate_days_until_due(self, due_date_str: str) -> int:
-        """Calculate days until due date"""
-        try:
-            due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-            if due_date.tzinfo is None:
-                due_date = self.tehran_tz.localize(due_date)
+    async def purge_deliveries(self, today: date) -> int:
+        """Delete ledger rows older than DELIVERY_RETENTION_DAYS, a batch at a time"""
+        before_day = (today - timedelta(days=DELIVERY_RETENTION_DAYS)).isoformat()
+        purged = 0
+        while True:
+            batch = await self.async_db.run(self.async_db.db.purge_deliveries, before_day,
+                                            DELIVERY_PURGE_BATCH_SIZE)
+            purged += batch
+            if batch < DELIVERY_PURGE_BATCH_SIZE:
+                return purged
+
+    async def sync_due_index(self):
+        """Load the due index on first use, afterwards add debts other processes created since"""
+        await self.async_db.run(self._sync_due_index)
+
+    def _sync_due_index(self):
+        # The index is only touched on the database thread, where the
+        # DebtManager writes that keep it current also run
+        db = self.async_db.db
+        if not self._due_index_loaded:
+            max_id = db.get_max_debt_id()
+            self.due_index.load(db.iter_due_keys(), max_id)
+            self.debt_manager.due_index = self.due_index
+            self._due_index_loaded = True
+        self.due_index.add_many(db.get_due_keys_after(self.due_index.max_id))
+
+    async def _indexed_debts_by_user(self, today: date) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Debts due within DEBT_REMINDER_DAYS per user, with candidates taken from the due index"""
+        await self.sync_due_index()
+        last_day = today + timedelta(days=DEBT_REMINDER_DAYS)
+        candidates = await self.async_db.run(self._due_candidates, last_day)
+        return self._read_candidates(candidates, last_day.isoformat())
+
+    def _due_candidates(self, last_day: date) -> List[Tuple[int, int, int]]:
+        """(user_id, id, day) of the indexed debts due by `last_day` in the held shards, by user"""
+        days, users, ids = self.due_index.due_by(last_day)
+        candidates = sorted(zip(users, ids, days))
+        if self.shard_count is not None:
+            shards = set(self.shards)
+            candidates = [item for item in candidates if abs(item[0]) % self.shard_count in shards]
+        return candidates
+
+    def _read_candidates(self, candidates: List[Tuple[int, int, int]],
+                         last_day: str) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Re-read candidates from the database a page of users at a time.
+
+        Runs on the database thread. Debts another process paid or deleted
+        since they were indexed drop out here and leave the index.
+        """
+        db = self.async_db.db
+        start = 0
+        while start < len(candidates):
+            # Pages end on a user boundary so each user's debts arrive together
+            end = min(start + STREAM_PAGE_SIZE, len(candidates))
+            while end < len(candidates) and candidates[end][0] == candidates[end - 1][0]:
+                end += 1
+            page = candidates[start:end]
+            rows = db.get_unpaid_debts([debt_id for _, debt_id, _ in page], last_day)
+            found = {row['id'] for row in rows}
+            for _, debt_id, day in page:
+                if debt_id not in found:
+                    self.due_index.discard(day, debt_id)
+            for user_id, group in itertools.groupby(rows, key=lambda row: row['user_id']):
+                yield user_id, list(group)
+            start = end
+
+    @staticmethod
+    def _merge_by_user(debt_groups: Iterator[Tuple[int, List[Dict[str, Any]]]],
+                       reminder_groups: Iterator[Tuple[int, List[Dict[str, Any]]]]
+                       ) -> Iterator[Tuple[int, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """Merge two user-ordered group streams into (user_id, debts, reminders)"""
+        debt_group = next(debt_groups, None)
+        reminder_group = next(reminder_groups, None)
+        while debt_group or reminder_group:
+            if reminder_group is None or (debt_group and debt_group[0] < reminder_group[0]):
+                yield debt_group[0], debt_group[1], []
+                debt_group = next(debt_groups, None)
+            elif debt_group is None or reminder_group[0] < debt_group[0]:
+                yield reminder_group[0], [], reminder_group[1]
+                reminder_group = next(reminder_groups, None)
             else:
-                due_date = due_date.astimezone(self.tehran_tz)
+                yield debt_group[0], debt_group[1], reminder_group[1]
+                debt_group = next(debt_groups, None)
+                reminder_group = next(reminder_groups, None)
 
-            now = datetime.now(self.tehran_tz)
-            days_diff = (due_date.date() - now.date()).days
-            return max(0, days_diff)  # Return 0 if already due or overdue
-        except:
-            return 999  # If date parsing fails, don't send reminder
+    def _debt_delivery(self, debt: Dict[str, Any], today: str) -> DeliveryKey:
+        return (f"debt:{debt['id']}", today, 'daily')
 
-    async def send_custom_reminders(self):
-        """Send custom reminders"""
+    def _reminder_delivery(self, reminder: Dict[str, Any]) -> DeliveryKey:
+        return (f"reminder:{reminder['id']}", reminder['reminder_day'], 'custom')
+
+    async def _send_digests(self, users: Iterator[Tuple[int, List[Dict[str, Any]], List[Dict[str, Any]]]],
+                            today: str):
+        """Claim, queue and record one digest per user, a batch of users at a time.
+
+        Every delivery in a batch is claimed in the ledger before anything is
+        sent, so items already delivered (or being delivered by another run)
+        are skipped. Each batch's outcome is written back before the next
+        batch starts, which lets an interrupted run resume where it stopped.
+        """
+        async for batch in self.async_db.iterate(users, DELIVERY_BATCH_SIZE):
+            items = []
+            for user_id, debts, reminders in batch:
+                items += [(*self._debt_delivery(debt, today), user_id) for debt in debts]
+                items += [(*self._reminder_delivery(reminder), user_id) for reminder in reminders]
+            claimed = await self.async_db.claim_deliveries(items, CLAIM_LEASE.total_seconds())
+
+            pending = []
+            for user_id, debts, reminders in batch:
+                debts = [debt for debt in debts if self._debt_delivery(debt, today) in claimed]
+                reminders = [reminder for reminder in reminders
+                             if self._reminder_delivery(reminder) in claimed]
+                if not debts and not reminders:
+                    continue
+                keys = ([self._debt_delivery(debt, today) for debt in debts] +
+                        [self._reminder_delivery(reminder) for reminder in reminders])
+                futures = await self.send_user_reminders(user_id, debts, reminders)
+                pending.append((keys, reminders, futures))
+            await self._record_deliveries(pending)
+
+    async def _record_deliveries(self, pending: List[Tuple[List[DeliveryKey], List[Dict[str, Any]],
+                                                             List[asyncio.Future]]]):
+        """Wait for a batch of digests and write their outcomes to the ledger at once.
+
+        A digest counts as sent only if all of its messages were delivered;
+        otherwise its claims are released for a later retry. Delivered
+        custom reminders are deactivated in the same transaction.
+        """
+        sent, failed, delivered_reminders = [], [], []
+        for keys, reminders, futures in pending:
+            if futures and all(await asyncio.gather(*futures)):
+                sent += keys
+                delivered_reminders += [(reminder['id'], reminder['user_id']) for reminder in reminders]
+            else:
+                failed += keys
+        if sent or failed:
+            await self.async_db.complete_deliveries(sent, failed, delivered_reminders)
+
+    async def send_user_reminders(self, user_id: int, debts: List[Dict[str, Any]],
+                                  reminders: Optional[List[Dict[str, Any]]] = None) -> List[asyncio.Future]:
+        """Queue a user's digest and return one delivery future per message"""
+        futures = []
         try:
-            # Get reminders due today or in the next few days
-            upcoming_reminders = self.db.get_upcoming_reminders(1)  # Next 24 hours
+            for text in self.render_digest(debts, reminders or []):
+                futures.append(await self.delivery.submit(user_id, text))
+        except Exception as e:
+            print(f"Error sending reminder to user {user_id}: {e}")
+        return futures
+
+    def render_digest(self, debts: List[Dict[str, Any]],
+                      reminders: List[Dict[str, Any]]) -> List[str]:
+        """Render debts and custom reminders into as few messages as fit Telegram's limit"""
+        entries = []
+        today = self.now().date()
+        for debt in debts:
+            days_until_due = self.calculate_days_until_due(debt['due_date'], today)
+
+            # Only remind about debts due within 7 days, 3 days, 1 day, or today
+            if days_until_due <= 7:
+                entries.append(self.debt_manager.get_reminder_message(debt, days_until_due))
 
-            for reminder in upcoming_reminders:
-                user_id = reminder['user_id']
-                title = reminder['title']
-                description = reminder['description']
+        for reminder in reminders:
+            entry = f"🔔 یادآور سفارشی:\n📌 {reminder['title']}"
+            if reminder['description']:
+                entry += f"\n📝 {reminder['description']}"
+            entries.append(entry)
 
-                message = f"🔔 یادآور سفارشی:\n📌 {title}"
-                if description:
-                    message += f"\n📝 {description}"
+        if not entries:
+            return []
 
-                await self.bot.send_message(chat_id=user_id, text=message)
+        messages = []
+        current = DIGEST_HEADER
+        for entry in entries:
+            if len(current) + len(DIGEST_SEPARATOR) + len(entry) <= MAX_MESSAGE_LENGTH:
+                current += DIGEST_SEPARATOR + entry
+                continue
+            messages.append(current)
+            # An entry longer than a whole message is hard-split
+            while len(entry) > MAX_MESSAGE_LENGTH:
+                messages.append(entry[:MAX_MESSAGE_LENGTH])
+                entry = entry[MAX_MESSAGE_LENGTH:]
+            current = entry
+        messages.append(current)
+        return messages
 
-                # Deactivate the reminder after sending
-                self.db.deactivate_reminder(reminder['id'], user_id)
+    def calculate_days_until_due(self, due_date_str: str, today: Optional[date] = None) -> int:
+        """Calculate days until due date"""
+        due_day = jalali.parse_day(due_date_str)
+        if due_day is None:
+            return 999  # If date parsing fails, don't send reminder
+        days_diff = (due_day - (today or self.now().date())).days
+        return max(0, days_diff)  # Return 0 if already due or overdue
+
+    async def send_custom_reminders(self):
+        """Send custom reminders that became due since the daily run"""
+        try:
+            with metrics.reminder_run('custom', self.delivery):
+                # Reminders due today or tomorrow
+                today = self.now().date().isoformat()
+                reminders = self.async_db.db.iter_upcoming_reminders_by_user(1, today, shards=self._shard_filter())
+                users = self._merge_by_user(iter(()), reminders)
+                await self._send_digests(users, today)
 
         except Exception as e:
             print(f"Error sending custom reminders: {e}")
@@ -119,5 +401,5 @@ class ReminderService:
     def stop_scheduler(self):
         """Stop the scheduler"""
         self._running = False
-        if self._reminder_task and not self._reminder_task.done():
-            self._reminder_task.cancel()
+        self.scheduler.stop()
+        self.delivery.stop()
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import pytz
+
+Job = Callable[[], Awaitable[None]]
+
+class Clock:
+    """Wall clock used by the scheduler"""
+
+    def __init__(self, tz=pytz.utc):
+        self.tz = tz
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    async def sleep(self, seconds: Optional[float], wake: asyncio.Event):
+        """Sleep for `seconds` (forever if None), returning early once `wake` is set"""
+        try:
+            await asyncio.wait_for(wake.wait(), timeout=None if seconds is None else max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+class FakeClock(Clock):
+    """Manually driven clock for tests.
+
+    Time only moves when advance() is called, which also wakes any sleeper
+    so it can re-check its deadline.
+    """
+
+    def __init__(self, start: datetime):
+        self._now = start
+        self._sleepers = set()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+        for wake in self._sleepers:
+            wake.set()
+
+    async def sleep(self, seconds: Optional[float], wake: asyncio.Event):
+        if seconds is not None and seconds <= 0:
+            return
+        self._sleepers.add(wake)
+        try:
+            await wake.wait()
+        finally:
+            self._sleepers.discard(wake)
+
+class Scheduler:
+    """Runs keyed async jobs at their fire times.
+
+    Fire times are kept in a heap and the loop sleeps exactly until the
+    earliest one. Scheduling a job that becomes the new earliest deadline
+    wakes the loop so it can re-arm its sleep. Re-scheduling a key replaces
+    the previous entry; stale heap entries are skipped lazily.
+    """
+
+    def __init__(self, clock: Optional[Clock] = None):
+        self.clock = clock or Clock()
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._jobs: Dict[str, Tuple[datetime, int, Job]] = {}
+        self._counter = itertools.count()
+        self._wake = asyncio.Event()
+        # Set while the loop sleeps with no job due
+        self._idle = asyncio.Event()
+        self._task = None
+
+    def schedule(self, key: str, when: datetime, job: Job, only_if_sooner: bool = False) -> bool:
+        """Schedule `job` under `key` at `when`, replacing any earlier entry.
+
+        With only_if_sooner, an existing entry for the key is only replaced
+        when `when` is earlier than it. Returns True if the job was (re)scheduled.
+        """
+        current = self._jobs.get(key)
+        if current and only_if_sooner and current[0] <= when:
+            return False
+
+        seq = next(self._counter)
+        self._jobs[key] = (when, seq, job)
+        heapq.heappush(self._heap, (when, seq, key))
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._compact()
+        if self._heap[0][1] == seq:
+            self._wake.set()
+        return True
+
+    def cancel(self, key: str) -> bool:
+        """Remove a scheduled job"""
+        return self._jobs.pop(key, None) is not None
+
+    def pending(self) -> List[Tuple[datetime, str]]:
+        """Return the pending schedule as (fire time, key) pairs, earliest first"""
+        return sorted((when, key) for key, (when, _, _) in self._jobs.items())
+
+    def next_fire_time(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    @property
+    def idle(self) -> bool:
+        """True when the loop is stopped, or asleep with no job due and no wake-up pending"""
+        return self._task is None or (self._idle.is_set() and not self._wake.is_set())
+
+    async def wait_idle(self):
+        """Wait until every due job has run and the loop is back asleep"""
+        while not self.idle:
+            if self._idle.is_set():
+                # Woken but not yet resumed; let the loop take its turn
+                await asyncio.sleep(0)
+            else:
+                await self._idle.wait()
+
+    def _compact(self):
+        self._heap = [(when, seq, key) for key, (when, seq, _) in self._jobs.items()]
+        heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        while self._heap:
+            _, seq, key = self._heap[0]
+            current = self._jobs.get(key)
+            if current and current[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    async def run_pending(self) -> int:
+        """Run every job whose fire time has passed and return how many ran"""
+        ran = 0
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > self.clock.now():
+                return ran
+            _, _, key = heapq.heappop(self._heap)
+            _, _, job = self._jobs.pop(key)
+            try:
+                await job()
+            except Exception as e:
+                print(f"Error in scheduled job {key}: {e}")
+            ran += 1
+
+    async def _run(self):
+        while True:
+            await self.run_pending()
+            next_time = self.next_fire_time()
+            delay = None if next_time is None else (next_time - self.clock.now()).total_seconds()
+            self._wake.clear()
+            if delay is None or delay > 0:
+                self._idle.set()
+            try:
+                await self.clock.sleep(delay, self._wake)
+            finally:
+                self._idle.clear()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+@pytest.fixture
+def db(tmp_path):
+    """A migrated database in a temporary directory"""
+    database = Database(str(tmp_path / 'debts.db'))
+    yield database
+    database.close()
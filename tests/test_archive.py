@@ -0,0 +1,46 @@
+import csv
+import io
+from debt_manager import DebtManager
+from import_export import DebtTransfer
+
+def seed(db):
+    paid = [db.add_debt(1, 'قسط', 1000 + n, f'2026-01-{10 + n:02d}') for n in range(3)]
+    db.pay_debts(1, paid)
+    db.add_debt(1, 'قسط', 5000, '2026-02-20')
+    db.add_debt(1, 'اجاره', 7000, '2026-01-05', recurrence='monthly')
+    db.pay_debt(db.add_debt(1, 'قبض', 300, '2026-01-15', recurrence='weekly'), 1)
+    reminder = db.add_reminder(1, 'تمدید بیمه', '2026-01-20')
+    db.deactivate_reminder(reminder, 1)
+    db.add_reminder(1, 'چک', '2026-03-01')
+
+def test_archiving_keeps_totals_and_streams(db):
+    seed(db)
+    totals = db.get_debt_totals(1)
+    debts = sorted(map(repr, db.iter_user_debts(1)))
+
+    # paid_at is "now", so the cutoff has to lie after it
+    assert db.archive_debts('2099-01-01', 100) == 4
+    assert db.archive_reminders('2099-01-01', 100) == 1
+    assert db.conn.execute('SELECT COUNT(*) FROM debts_history').fetchone()[0] == 4
+
+    assert db.get_debt_totals(1) == totals
+    assert db.rebuild_debt_totals(check_only=True) == 0
+    # Paging through both tables must not skip or repeat rows
+    for page_size in (1, 2, 100):
+        assert sorted(map(repr, db.iter_user_debts(1, page_size=page_size))) == debts
+    assert [r['title'] for r in db.iter_user_reminders(1, page_size=1)] == ['تمدید بیمه', 'چک']
+
+def test_export_includes_archived_rows(db):
+    seed(db)
+    db.archive_debts('2099-01-01', 100)
+    db.archive_reminders('2099-01-01', 100)
+    out = io.BytesIO()
+
+    assert DebtTransfer(DebtManager(db)).export(1, out) == 9
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue().decode('utf-8-sig'))))
+    debts = [(row['amount'], row['is_paid']) for row in rows if row['kind'] == 'debt']
+    assert sorted(debts) == sorted([('1000', 'True'), ('1001', 'True'), ('1002', 'True'),
+                                    ('300', 'True'), ('300', 'False'),
+                                    ('5000', 'False'), ('7000', 'False')])
+    assert [row['title'] for row in rows if row['kind'] == 'reminder'] == ['تمدید بیمه', 'چک']
@@ -0,0 +1,50 @@
+import sqlite3
+import pytest
+import migrations
+from database import Database
+
+def test_compact_and_datetime_dates_get_a_due_day(db):
+    compact = db.add_debt(1, 'قسط', 1000, '20260112')
+    # 23:00 UTC is already the next day in Tehran
+    late = db.add_debt(1, 'قسط', 1000, '2026-01-12T23:00:00+00:00')
+    reminder = db.add_reminder(1, 'تمدید بیمه', '20260111')
+
+    days = dict(db.conn.execute('SELECT id, due_day FROM debts').fetchall())
+    assert days == {compact: '2026-01-12', late: '2026-01-13'}
+    assert [debt['id'] for debt in db.get_upcoming_debts(7, '2026-01-10')] == [compact, late]
+    assert [row['id'] for row in db.get_upcoming_reminders(1, '2026-01-10')] == [reminder]
+
+def test_invalid_dates_are_rejected(db):
+    with pytest.raises(ValueError):
+        db.add_debt(1, 'قسط', 1000, 'next week')
+    db.add_reminder(1, 'تمدید بیمه', '2026-01-11')
+    try:
+        with pytest.raises(sqlite3.IntegrityError):
+            db.conn.execute('''
+                INSERT INTO debts (user_id, category, amount, due_date, due_day)
+                VALUES (1, 'قسط', 1000, '2026-01-12', NULL)
+            ''')
+        with pytest.raises(sqlite3.IntegrityError):
+            db.conn.execute("UPDATE reminders SET reminder_day = '20260111'")
+    finally:
+        db.conn.rollback()
+
+def test_migration_fills_missing_days(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    for version, migration in enumerate(migrations.MIGRATIONS[:10], start=1):
+        migration(conn.cursor())
+        conn.execute(f'PRAGMA user_version = {version}')
+    conn.execute('''
+        INSERT INTO debts (user_id, category, amount, due_date, recurrence, due_day)
+        VALUES (1, 'قسط', 1000, '20260112', 'monthly', date('20260112'))
+    ''')
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    try:
+        assert db.conn.execute('SELECT due_day, recurrence_day FROM debts').fetchall() == [('2026-01-12', 12)]
+        assert db.get_debt_totals(1)[0]['month'] == '1404/10'
+    finally:
+        db.close()
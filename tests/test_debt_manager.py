@@ -0,0 +1,77 @@
+import pytest
+from cache import LRUCache
+from debt_manager import MAX_BULK_IDS, DebtManager
+
+def page_ids(manager: DebtManager, user_id: int):
+    return [debt['id'] for debt in manager.get_debts_page(user_id)['debts']]
+
+def test_write_generations_stay_bounded_and_pages_stay_fresh(db):
+    manager = DebtManager(db, LRUCache(max_entries=2, ttl=None))
+    first = db.add_debt(1, 'قسط', 1000, '2026-01-12')
+    assert page_ids(manager, 1) == [first]
+
+    manager.mark_paid(first, 1)
+    assert page_ids(manager, 1) == []
+    second = manager.create_debt(1, 'قسط', 2000, '2026-01-13')[1]
+    assert page_ids(manager, 1) == [second]
+
+    # Writes by many other users push user 1 out of the generations
+    for user_id in range(2, 10):
+        manager.add_debt(user_id, 'قسط', 1000, '2026-01-12')
+    assert len(manager._generations) == 2
+    assert page_ids(manager, 1) == [second]
+
+    manager.delete_debt(second, 1)
+    assert page_ids(manager, 1) == []
+
+@pytest.mark.parametrize('args, ids', [
+    (['3'], [3]),
+    (['3', '5', '8-12'], [3, 5, 8, 9, 10, 11, 12]),
+    (['3,5،7'], [3, 5, 7]),
+    (['12-10'], [10, 11, 12]),
+    (['5', '3-6', '5'], [5, 3, 4, 6]),
+])
+def test_parse_debt_ids(db, args, ids):
+    assert DebtManager(db).parse_debt_ids(args) == (ids, '')
+
+@pytest.mark.parametrize('args', [
+    [], [' ', ','], ['abc'], ['3', 'x'], ['1-x'], ['1-2-3'],
+    ['1-101'], [str(i) for i in range(MAX_BULK_IDS + 1)],
+])
+def test_parse_debt_ids_rejects(db, args):
+    ids, error = DebtManager(db).parse_debt_ids(args)
+    assert ids == [] and error
+
+def test_parse_debt_ids_allows_exactly_the_limit(db):
+    ids, error = DebtManager(db).parse_debt_ids([f'1-{MAX_BULK_IDS}'])
+    assert len(ids) == MAX_BULK_IDS and not error
+
+def test_mark_paid_many_reports_each_outcome(db):
+    manager = DebtManager(db)
+    paid_before = db.add_debt(1, 'قسط', 1000, '2026-01-12')
+    unpaid = db.add_debt(1, 'قسط', 1000, '2026-01-13')
+    monthly = db.add_debt(1, 'اجاره', 1000, '2026-01-31', recurrence='monthly')
+    other_user = db.add_debt(2, 'قسط', 1000, '2026-01-12')
+    db.pay_debt(paid_before, 1)
+
+    result = manager.mark_paid_many([unpaid, paid_before, other_user, 999, monthly], 1)
+
+    assert f"✅ پرداخت شد (2): {unpaid}، {monthly}" in result
+    assert f"☑️ قبلاً پرداخت شده: {paid_before}" in result
+    assert f"❌ یافت نشد: {other_user}، 999" in result
+    assert f"🔄 سررسید بعدی {monthly}:" in result
+    # Another user's debt is untouched
+    assert db.get_debt_by_id(other_user, 2)['is_paid'] == 0
+    assert [debt['due_date'] for debt in db.get_active_debts(1)] == ['2026-02-28']
+
+def test_delete_many_only_deletes_the_users_own_debts(db):
+    manager = DebtManager(db)
+    own = [db.add_debt(1, 'قسط', 1000, '2026-01-12') for _ in range(2)]
+    other_user = db.add_debt(2, 'قسط', 1000, '2026-01-12')
+
+    result = manager.delete_many([*own, other_user, 999], 1)
+
+    assert result == f"🗑️ حذف شد (2): {own[0]}، {own[1]}\n❌ یافت نشد: {other_user}، 999"
+    assert db.get_active_debts(1) == []
+    assert len(db.get_active_debts(2)) == 1
+    assert manager.delete_many(own[:1], 1) == "❌ بدهی یافت نشد."
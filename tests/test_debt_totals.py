@@ -0,0 +1,43 @@
+def totals(db, user_id: int = 1):
+    return {(row['month'], row['category']): (row['unpaid_count'], row['unpaid_amount'],
+                                              row['paid_count'], row['paid_amount'])
+            for row in db.get_debt_totals(user_id)}
+
+def test_triggers_keep_totals_matching_a_rebuild(db):
+    rent = db.add_debt(1, 'اجاره', 5000, '2026-01-31', recurrence='monthly')
+    loan = db.add_debt(1, 'قسط', 1000, '2026-02-10')
+    db.add_debts(1, [('قسط', 2000, '2026-02-11', '', 'one-time', True),
+                     ('قبض', 300, '2026-02-12', '', 'weekly', False)])
+    db.add_debt(2, 'قسط', 700, '2026-02-10')
+    assert db.rebuild_debt_totals(check_only=True) == 0
+
+    db.pay_debt(rent, 1)
+    db.pay_debts(1, [loan])
+    db.delete_debts(2, [db.add_debt(2, 'قسط', 900, '2026-03-01')])
+    assert db.rebuild_debt_totals(check_only=True) == 0
+
+    db.roll_over_debts('2026-03-15')
+    assert db.rebuild_debt_totals(check_only=True) == 0
+
+    before = totals(db)
+    assert db.archive_debts('2026-12-01', 100) == 3
+    assert db.rebuild_debt_totals(check_only=True) == 0
+    assert totals(db) == before
+
+    # Rent (monthly) moved on to March; 1404/11 is January 21 - February 19, 2026
+    assert before[('1404/11', 'اجاره')] == (0, 0, 1, 5000)
+    assert before[('1404/11', 'قسط')] == (0, 0, 2, 3000)
+
+def test_rebuild_repairs_drifted_totals(db):
+    db.add_debt(1, 'قسط', 1000, '2026-02-10')
+    expected = totals(db)
+    db.conn.execute('UPDATE debt_totals SET unpaid_amount = 1')
+    db.conn.execute("INSERT INTO debt_totals (user_id, month, category) VALUES (9, '1404/01', 'x')")
+    db.conn.commit()
+
+    # The changed row differs from both sides, the orphan from one
+    assert db.rebuild_debt_totals(check_only=True) == 3
+    assert db.rebuild_debt_totals() == 3
+    assert db.rebuild_debt_totals(check_only=True) == 0
+    assert totals(db) == expected
+    assert db.get_debt_totals(9) == []
@@ -0,0 +1,32 @@
+import asyncio
+from datetime import date
+from async_database import AsyncDatabase
+from debt_manager import DebtManager
+from reminder_service import ReminderService
+
+def ledger_days(db):
+    return [row[0] for row in db.conn.execute(
+        'SELECT occurrence_day FROM reminder_deliveries ORDER BY occurrence_day')]
+
+def test_claimed_deliveries_are_sent_once(db):
+    items = [('debt:1', '2026-01-10', 'daily', 1), ('debt:2', '2026-01-10', 'daily', 1)]
+    claimed = db.claim_deliveries(items, 600)
+    assert claimed == {item[:3] for item in items}
+    db.complete_deliveries([items[0][:3]], failed=[items[1][:3]])
+
+    # The sent key stays taken, the failed one can be claimed again
+    assert db.claim_deliveries(items, 600) == {items[1][:3]}
+
+def test_daily_run_purges_ledger_rows_past_the_window(db):
+    days = ['2025-12-20', '2026-01-02', '2026-01-03', '2026-01-09', '2026-01-10']
+    keys = [(f'debt:{number}', day, 'daily') for number, day in enumerate(days)]
+    db.claim_deliveries([(*key, 1) for key in keys], 600)
+    db.complete_deliveries(keys)
+    async_db = AsyncDatabase(db)
+    service = ReminderService(None, async_db, DebtManager(db))
+
+    purged = asyncio.run(service.purge_deliveries(date(2026, 1, 10)))
+    async_db.close()
+
+    assert purged == 2
+    assert ledger_days(db) == ['2026-01-03', '2026-01-09', '2026-01-10']
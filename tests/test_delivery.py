@@ -0,0 +1,122 @@
+import asyncio
+import heapq
+import itertools
+from typing import List
+import pytest
+from telegram.error import Forbidden, NetworkError, RetryAfter
+import delivery
+from delivery import DeliveryQueue
+
+class VirtualTime:
+    """Monotonic clock and sleep for the delivery module that only move when the loop is idle"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers = []
+        self._counter = itertools.count()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        wake = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + seconds, next(self._counter), wake))
+        await wake
+
+    async def run_until_done(self, futures: List[asyncio.Future]):
+        """Let the workers run, jumping to the next wake-up whenever they are all waiting"""
+        for _ in range(10000):
+            for _ in range(20):
+                await asyncio.sleep(0)
+            if all(future.done() for future in futures):
+                return
+            when, _, wake = heapq.heappop(self._sleepers)
+            self.now = max(self.now, when)
+            wake.set_result(None)
+        raise AssertionError('deliveries did not finish')
+
+class AsyncioWithVirtualSleep:
+    def __init__(self, clock: VirtualTime):
+        self.sleep = clock.sleep
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+class TimeWithVirtualClock:
+    def __init__(self, clock: VirtualTime):
+        self.monotonic = clock.monotonic
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = VirtualTime()
+    monkeypatch.setattr(delivery, 'asyncio', AsyncioWithVirtualSleep(clock))
+    monkeypatch.setattr(delivery, 'time', TimeWithVirtualClock(clock))
+    return clock
+
+class Bot:
+    """Records (time, chat_id) of every send; `errors` are raised by the first sends"""
+
+    def __init__(self, clock: VirtualTime, errors=()):
+        self.clock = clock
+        self.errors = list(errors)
+        self.attempts = 0
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((self.clock.now, chat_id))
+
+def deliver(clock: VirtualTime, queue: DeliveryQueue, chat_ids: List[int]) -> List[bool]:
+    async def scenario():
+        futures = [await queue.submit(chat_id, 'یادآور') for chat_id in chat_ids]
+        await clock.run_until_done(futures)
+        queue.stop()
+        return [future.result() for future in futures]
+    return asyncio.run(scenario())
+
+def test_messages_to_one_chat_are_spaced_by_the_per_chat_rate(clock):
+    bot = Bot(clock)
+    queue = DeliveryQueue(bot, global_rate=100, per_chat_rate=1)
+
+    assert deliver(clock, queue, [1, 1, 1, 2]) == [True] * 4
+    assert sorted(bot.sent) == [(0.0, 1), (0.0, 2), (1.0, 1), (2.0, 1)]
+
+def test_global_rate_limits_sends_across_chats(clock):
+    bot = Bot(clock)
+    queue = DeliveryQueue(bot, global_rate=2, per_chat_rate=1)
+
+    assert deliver(clock, queue, [1, 2, 3, 4, 5, 6]) == [True] * 6
+    times = [at for at, _ in bot.sent]
+    # A burst of two, then one every half second
+    assert times == [0.0, 0.0, 0.5, 1.0, 1.5, 2.0]
+
+def test_retry_after_pauses_sending_without_using_an_attempt(clock):
+    bot = Bot(clock, [RetryAfter(5)] * 2)
+    queue = DeliveryQueue(bot, global_rate=100, per_chat_rate=100, max_attempts=1)
+
+    assert deliver(clock, queue, [1]) == [True]
+    assert bot.sent == [(10.0, 1)]
+    assert queue.stats()['retry_after'] == 2
+
+def test_network_errors_give_up_after_max_attempts(clock):
+    bot = Bot(clock, [NetworkError('connection reset')] * 10)
+    queue = DeliveryQueue(bot, global_rate=100, per_chat_rate=100, max_attempts=3)
+
+    assert deliver(clock, queue, [1]) == [False]
+    assert bot.attempts == 3
+    stats = queue.stats()
+    assert (stats['retries'], stats['failed'], stats['sent']) == (2, 1, 0)
+    # Backoff of about 1s then 2s (with jitter) between the attempts
+    assert 1.5 <= clock.now <= 4.5
+
+def test_permanent_errors_are_not_retried(clock):
+    bot = Bot(clock, [Forbidden('bot was blocked by the user')])
+    queue = DeliveryQueue(bot)
+
+    assert deliver(clock, queue, [1, 2]) == [False, True]
+    assert bot.attempts == 2
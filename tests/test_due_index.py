@@ -0,0 +1,73 @@
+import asyncio
+from datetime import date, datetime
+import pytz
+from async_database import AsyncDatabase
+from debt_manager import DebtManager
+from delivery import DeliveryQueue
+from due_index import DueIndex
+from reminder_service import ReminderService
+from scheduler import FakeClock
+
+LAST_DAY = date(2026, 12, 31)
+
+class Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent.append(chat_id)
+
+def indexed_ids(index: DueIndex):
+    return sorted(index.due_by(LAST_DAY)[2])
+
+def attach(db):
+    manager = DebtManager(db)
+    manager.due_index = DueIndex()
+    manager.due_index.load(db.iter_due_keys(), db.get_max_debt_id())
+    return manager
+
+def test_debt_manager_writes_keep_the_index_current(db):
+    manager = attach(db)
+    manager.add_debt(1, 'قسط', 1000, '2026-01-12')
+    manager.add_debt(1, 'اجاره', 2000, '2026-01-15', recurrence='monthly')
+    manager.add_debt(2, 'قسط', 3000, '2026-01-20')
+    assert indexed_ids(manager.due_index) == [1, 2, 3]
+
+    manager.mark_paid(2, 1)
+    # Paying a monthly debt creates its next occurrence
+    assert indexed_ids(manager.due_index) == [1, 3, 4]
+
+    manager.delete_debt(3, 2)
+    manager.mark_paid_many([1, 4], 1)
+    assert indexed_ids(manager.due_index) == [5]
+    assert [row[2] for row in db.iter_due_keys()] == [5]
+
+def test_debts_written_elsewhere_are_caught_up_by_id(db):
+    manager = attach(db)
+    db.add_debt(1, 'قسط', 1000, '2026-01-12')
+    manager.add_debt(1, 'قسط', 2000, '2026-01-13')
+    assert indexed_ids(manager.due_index) == [1, 2]
+
+    manager.delete_many([1, 2], 1)
+    assert len(manager.due_index) == 0
+
+def test_daily_run_drops_debts_paid_elsewhere(db):
+    for user_id in (1, 2, 3):
+        db.add_debt(user_id, 'قسط', 1000, '2026-01-12')
+    async_db = AsyncDatabase(db)
+    bot = Bot()
+    start = pytz.timezone('Asia/Tehran').localize(datetime(2026, 1, 10, 9))
+    service = ReminderService(bot, async_db, DebtManager(db), clock=FakeClock(start), due_index=True)
+    service.delivery = DeliveryQueue(bot, global_rate=1e9, per_chat_rate=1e9)
+
+    async def run():
+        await service.sync_due_index()
+        # Paid by another process: still indexed until the run re-reads it
+        db.pay_debt(2, 2)
+        await service.send_daily_reminders()
+        service.delivery.stop()
+
+    asyncio.run(run())
+    async_db.close()
+    assert sorted(bot.sent) == [1, 3]
+    assert indexed_ids(service.due_index) == [1, 3]
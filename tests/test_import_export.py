@@ -0,0 +1,17 @@
+import io
+from debt_manager import DebtManager
+from import_export import MAX_AMOUNT, DebtTransfer
+
+def test_oversized_amount_is_a_row_error(db):
+    data = io.BytesIO(
+        "kind,category,amount,due_date\n"
+        "debt,قسط,1000,2026-01-12\n"
+        f"debt,قسط,{MAX_AMOUNT + 1},2026-01-13\n"
+        "debt,قسط,2000,2026-01-14\n".encode())
+
+    result = DebtTransfer(DebtManager(db)).import_file(1, data)
+
+    assert result['debts'] == 2
+    assert result['error_count'] == 1
+    assert result['errors'][0][0] == 3
+    assert [debt['amount'] for debt in db.get_active_debts(1)] == [1000, 2000]
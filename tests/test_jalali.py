@@ -0,0 +1,37 @@
+from datetime import date
+import pytest
+import jalali
+
+# Known Gregorian -> Jalali conversions, around Nowruz and in leap years
+CONVERSIONS = [
+    (date(1979, 2, 11), (1357, 11, 22)),
+    (date(2020, 3, 20), (1399, 1, 1)),
+    (date(2021, 3, 20), (1399, 12, 30)),   # 1399 is a leap year
+    (date(2021, 3, 21), (1400, 1, 1)),
+    (date(2023, 3, 21), (1402, 1, 1)),
+    (date(2024, 3, 19), (1402, 12, 29)),   # 1402 is not
+    (date(2024, 3, 20), (1403, 1, 1)),
+    (date(2025, 3, 20), (1403, 12, 30)),   # 1403 is a leap year
+    (date(2025, 3, 21), (1404, 1, 1)),
+    (date(2025, 9, 22), (1404, 6, 31)),
+    (date(2025, 9, 23), (1404, 7, 1)),
+    (date(2026, 1, 12), (1404, 10, 22)),
+    (date(2030, 3, 20), (1408, 12, 30)),   # 1408 is a leap year
+]
+
+@pytest.mark.parametrize('day, expected', CONVERSIONS)
+def test_to_jalali(day, expected):
+    assert jalali.to_jalali(day) == expected
+    assert jalali.format_date(day.isoformat()) == '%04d/%02d/%02d' % expected
+    assert jalali.month_key(day) == '%04d/%02d' % expected[:2]
+
+@pytest.mark.parametrize('year, leap', [(1399, True), (1400, False), (1402, False),
+                                        (1403, True), (1404, False), (1408, True)])
+def test_esfand_length(year, leap):
+    last_of_esfand = jalali.month_end(jalali.month_start(date(year + 622, 3, 1)))
+    assert jalali.to_jalali(last_of_esfand) == (year, 12, 30 if leap else 29)
+
+def test_outside_the_table():
+    assert jalali.to_jalali(jalali.TABLE_END) is None
+    assert jalali.format_date('1900-01-01') == '1900/01/01'
+    assert jalali.format_date('not a date') == 'not a date'
@@ -0,0 +1,59 @@
+import time
+from metrics import DB_SECONDS, Metrics, instrument_database
+
+TODAY = '2026-01-10'
+
+def add_debts(db, users: int, per_user: int):
+    for user_id in range(1, users + 1):
+        db.add_debts(user_id, [('قسط', 1000, '2026-01-12', '', 'one-time', False)] * per_user)
+
+def drain(iterator) -> float:
+    start = time.perf_counter()
+    for _ in iterator:
+        pass
+    return time.perf_counter() - start
+
+def test_streaming_method_times_the_rows_it_yields(db):
+    add_debts(db, users=200, per_user=50)
+    registry = Metrics()
+    instrument_database(db, registry)
+
+    took = drain(db.iter_upcoming_debts_by_user(7, TODAY, page_size=500))
+
+    histogram = registry.histogram(DB_SECONDS, method='iter_upcoming_debts_by_user')
+    assert histogram.count == 1
+    # Reading 10k rows takes milliseconds; constructing the generator alone takes microseconds
+    assert histogram.sum > took / 10
+    assert histogram.sum <= took
+
+def test_chained_iterator_is_timed_once_drained(db):
+    add_debts(db, users=1, per_user=5000)
+    registry = Metrics()
+    instrument_database(db, registry)
+
+    rows = db.iter_user_debts(1, page_size=500)
+    assert registry.histogram(DB_SECONDS, method='iter_user_debts') is None
+    took = drain(rows)
+
+    histogram = registry.histogram(DB_SECONDS, method='iter_user_debts')
+    assert histogram.count == 1
+    assert took / 10 < histogram.sum <= took
+
+def test_closing_an_iterator_early_still_observes(db):
+    add_debts(db, users=3, per_user=10)
+    registry = Metrics()
+    instrument_database(db, registry)
+
+    groups = db.iter_upcoming_debts_by_user(7, TODAY)
+    next(groups)
+    groups.close()
+
+    assert registry.histogram(DB_SECONDS, method='iter_upcoming_debts_by_user').count == 1
+
+def test_plain_methods_are_timed_per_call(db):
+    add_debts(db, users=1, per_user=3)
+    registry = Metrics()
+    instrument_database(db, registry)
+
+    assert len(db.get_active_debts(1)) == 3
+    assert registry.histogram(DB_SECONDS, method='get_active_debts').count == 1
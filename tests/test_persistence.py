@@ -0,0 +1,60 @@
+import asyncio
+import json
+import sqlite3
+import persistence
+from async_database import AsyncDatabase
+from persistence import SQLitePersistence
+
+def test_failed_write_is_retried_without_losing_state(db, monkeypatch):
+    monkeypatch.setattr(persistence, 'WRITE_RETRY_BASE', 0)
+    async_db = AsyncDatabase(db)
+    store = SQLitePersistence(async_db)
+    save = db.save_persisted_state
+    calls = []
+
+    def save_once_failing(user_data, conversations, now):
+        calls.append((list(user_data), list(conversations)))
+        if len(calls) == 1:
+            # A newer change arrives while the failing write is in flight
+            store._pending_users[2] = json.dumps({'debt_category': 'قسط'})
+            raise sqlite3.OperationalError('database is locked')
+        return save(user_data, conversations, now)
+
+    monkeypatch.setattr(db, 'save_persisted_state', save_once_failing)
+
+    async def scenario():
+        await store.update_user_data(1, {'debt_category': 'اجاره'})
+        await store.update_user_data(2, {'debt_category': 'اجاره'})
+        await store.update_conversation('add_debt', (1, 1), 2)
+        await store.flush()
+
+    asyncio.run(scenario())
+    async_db.close()
+
+    assert len(calls) == 2
+    stats = store.stats()
+    assert stats['write_errors'] == 1
+    assert stats['pending'] == 0
+    saved = {user_id: json.loads(data) for user_id, data, _ in db.load_user_data(0, 10)}
+    assert saved == {1: {'debt_category': 'اجاره'}, 2: {'debt_category': 'قسط'}}
+    assert db.load_conversations('add_debt', 0) == [(json.dumps([1, 1]), '2')]
+
+def test_writes_give_up_after_the_last_attempt_but_keep_the_changes(db, monkeypatch):
+    monkeypatch.setattr(persistence, 'WRITE_RETRY_BASE', 0)
+    async_db = AsyncDatabase(db)
+    store = SQLitePersistence(async_db)
+
+    def always_failing(user_data, conversations, now):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(db, 'save_persisted_state', always_failing)
+
+    async def scenario():
+        await store.update_user_data(1, {'debt_category': 'اجاره'})
+        await store.flush()
+
+    asyncio.run(scenario())
+    async_db.close()
+
+    assert store.stats()['write_errors'] == 2 * persistence.WRITE_ATTEMPTS
+    assert store.stats()['pending'] == 1
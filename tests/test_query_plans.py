@@ -0,0 +1,34 @@
+import re
+from typing import Callable, List
+import pytest
+
+TODAY = '2026-01-10'
+
+def query_plans(db, call: Callable) -> List[str]:
+    """EXPLAIN QUERY PLAN details of every SELECT the call runs, with its parameters bound"""
+    statements: List[str] = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        db.conn.set_trace_callback(None)
+    plans = []
+    for statement in statements:
+        if statement.lstrip().upper().startswith('SELECT'):
+            plans += [row[3] for row in db.conn.execute(f'EXPLAIN QUERY PLAN {statement}')]
+    return plans
+
+@pytest.mark.parametrize('table, call', [
+    ('debts', lambda db: db.get_upcoming_debts(7, TODAY)),
+    ('reminders', lambda db: db.get_upcoming_reminders(1, TODAY)),
+    ('debts', lambda db: db.get_active_debts(1)),
+])
+def test_reminder_and_listing_queries_use_an_index(db, table, call):
+    db.add_debts(1, [('قسط', 1000, '2026-01-12', '', 'monthly', False)] * 20)
+    db.add_reminders(1, [('تمدید بیمه', '2026-01-11', '', True)] * 20)
+
+    plans = query_plans(db, lambda: call(db))
+
+    assert plans
+    assert any(re.match(rf'SEARCH {table} USING (COVERING )?INDEX idx_', plan) for plan in plans), plans
+    assert not any(plan.startswith(f'SCAN {table}') for plan in plans), plans
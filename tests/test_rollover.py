@@ -0,0 +1,48 @@
+import database
+
+def due_days(db, user_id: int = 1):
+    return [row[0] for row in db.conn.execute(
+        'SELECT due_day FROM debts WHERE user_id = ? ORDER BY due_day', (user_id,))]
+
+def test_monthly_debt_on_the_31st_is_clamped_and_returns_to_its_day(db):
+    db.add_debt(1, 'اجاره', 1000, '2024-01-31', recurrence='monthly')
+
+    assert db.roll_over_debts('2024-05-01') == 4
+    assert due_days(db) == ['2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30', '2024-05-31']
+
+def test_february_clamp_outside_leap_years(db):
+    db.add_debt(1, 'اجاره', 1000, '2025-01-30', recurrence='monthly')
+
+    assert db.roll_over_debts('2025-03-01') == 2
+    assert due_days(db) == ['2025-01-30', '2025-02-28', '2025-03-30']
+
+def test_paying_uses_the_same_clamping(db):
+    debt_id = db.add_debt(1, 'اجاره', 1000, '2024-01-31', recurrence='monthly')
+
+    assert db.pay_debt(debt_id, 1) == (database.DEBT_PAID, '2024-02-29')
+
+def test_yearly_debt_on_february_29th(db):
+    db.add_debt(1, 'بیمه', 1000, '2024-02-29', recurrence='yearly')
+
+    assert db.roll_over_debts('2028-01-01') == 4
+    assert due_days(db) == ['2024-02-29', '2025-02-28', '2026-02-28', '2027-02-28', '2028-02-29']
+
+def test_weekly_debt_catches_up_over_several_periods_in_one_call(db):
+    db.add_debt(1, 'قسط', 1000, '2026-01-01', recurrence='weekly')
+    db.add_debt(1, 'قسط', 1000, '2026-01-01')
+
+    assert db.roll_over_debts('2026-02-01') == 5
+    assert due_days(db) == ['2026-01-01', '2026-01-01', '2026-01-08', '2026-01-15', '2026-01-22',
+                            '2026-01-29', '2026-02-05']
+    # Only the newest occurrence is left to roll over
+    assert db.roll_over_debts('2026-02-01') == 0
+
+def test_rollover_stops_after_max_steps_and_resumes(db, monkeypatch):
+    monkeypatch.setattr(database, 'MAX_ROLLOVER_STEPS', 3)
+    db.add_debt(1, 'قسط', 1000, '2026-01-01', recurrence='weekly')
+
+    assert db.roll_over_debts('2026-03-01') == 3
+    assert due_days(db)[-1] == '2026-01-22'
+    assert db.roll_over_debts('2026-03-01') == 3
+    assert db.roll_over_debts('2026-03-01') == 3
+    assert due_days(db)[-1] == '2026-03-05'
@@ -0,0 +1,216 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytz
+import pytest
+from telegram.error import Forbidden
+from async_database import AsyncDatabase
+from debt_manager import DebtManager
+from delivery import DeliveryQueue
+from reminder_service import ReminderService
+from scheduler import FakeClock
+
+TEHRAN = pytz.timezone('Asia/Tehran')
+
+def at(day: str, hour: int, minute: int = 0) -> datetime:
+    return TEHRAN.localize(datetime.fromisoformat(day) + timedelta(hours=hour, minutes=minute))
+
+class Bot:
+    def __init__(self):
+        self.sent = []
+        # Chats that blocked the bot
+        self.blocked = set()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden('Forbidden: bot was blocked by the user')
+        self.sent.append((chat_id, text))
+
+class Harness:
+    """A ReminderService on a FakeClock, delivering to a recording bot"""
+
+    def __init__(self, db, start: datetime):
+        self.db = db
+        self.clock = FakeClock(start)
+        self.bot = Bot()
+        self.async_db = AsyncDatabase(db)
+        self.service = ReminderService(self.bot, self.async_db, DebtManager(db), clock=self.clock)
+        self.service.delivery = DeliveryQueue(self.bot, global_rate=1e9, per_chat_rate=1e9)
+
+    async def settle(self):
+        """Run woken jobs to completion, including their database calls and deliveries"""
+        scheduler = self.service.scheduler
+        while True:
+            await scheduler.wait_idle()
+            await self.service.delivery.join()
+            if scheduler.idle:
+                return
+
+    async def advance_to(self, when: datetime):
+        """Move the clock to `when`, stopping at every fire time on the way"""
+        while self.clock.now() < when:
+            now = self.clock.now()
+            step = min([fire for fire, _ in self.service.pending_schedule() if now < fire < when] + [when])
+            self.clock.advance((step - now).total_seconds())
+            await self.settle()
+
+    def close(self):
+        self.service.stop_scheduler()
+        self.async_db.close()
+
+@pytest.fixture
+def harness(db):
+    harnesses = []
+
+    def make(start: datetime) -> Harness:
+        harnesses.append(Harness(db, start))
+        return harnesses[-1]
+
+    yield make
+    for item in harnesses:
+        item.close()
+
+def ledger(db):
+    return db.conn.execute('''
+        SELECT target, occurrence_day, status FROM reminder_deliveries ORDER BY target
+    ''').fetchall()
+
+def texts(harness: Harness):
+    return [text for _, text in harness.bot.sent]
+
+def test_daily_digest_fires_at_nine(harness):
+    h = harness(at('2026-01-10', 8))
+    h.db.add_debt(1, 'قسط', 1000, '2026-01-12')
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        assert h.bot.sent == []
+        assert (at('2026-01-10', 9), 'daily') in h.service.pending_schedule()
+
+        await h.advance_to(at('2026-01-10', 8, 59))
+        assert h.bot.sent == []
+        await h.advance_to(at('2026-01-10', 9))
+        assert [chat_id for chat_id, _ in h.bot.sent] == [1]
+        assert 'قسط' in texts(h)[0]
+
+        pending = h.service.pending_schedule()
+        assert (at('2026-01-11', 9), 'daily') in pending
+        assert (at('2026-01-10', 9, 10), 'daily-sweep') in pending
+
+    asyncio.run(scenario())
+
+def test_custom_reminder_fires_at_nine_the_day_before(harness):
+    h = harness(at('2026-01-10', 8))
+    h.db.add_reminder(1, 'تمدید بیمه', '2026-01-13')
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        assert (at('2026-01-12', 9), 'custom') in h.service.pending_schedule()
+
+        await h.advance_to(at('2026-01-12', 8, 59))
+        assert h.bot.sent == []
+        await h.advance_to(at('2026-01-12', 9))
+        assert len(h.bot.sent) == 1
+        assert 'تمدید بیمه' in texts(h)[0]
+        assert h.db.get_active_reminders(1) == []
+
+    asyncio.run(scenario())
+
+def test_debt_due_before_next_run_wakes_the_scheduler(harness):
+    # Today's run has passed; the next one is tomorrow at 09:00
+    h = harness(at('2026-01-10', 12))
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        debt_id = h.db.add_debt(1, 'اجاره', 5000, '2026-01-10')
+        h.service.notify_debt_added(1, debt_id, '2026-01-10')
+        await h.settle()
+        assert len(h.bot.sent) == 1
+        assert 'اجاره' in texts(h)[0]
+        assert ledger(h.db) == [(f'debt:{debt_id}', '2026-01-10', 'sent')]
+
+        # Due after the next run: left to the daily digest
+        h.service.notify_debt_added(1, h.db.add_debt(1, 'قسط', 1000, '2026-01-15'), '2026-01-15')
+        await h.settle()
+        assert len(h.bot.sent) == 1
+
+    asyncio.run(scenario())
+
+def test_new_debts_due_the_same_day_are_each_reminded(harness):
+    h = harness(at('2026-01-10', 12))
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        for category in ('اجاره', 'قسط'):
+            h.service.notify_debt_added(1, h.db.add_debt(1, category, 5000, '2026-01-10'), '2026-01-10')
+        await h.settle()
+        assert len(h.bot.sent) == 2
+        assert [status for _, _, status in ledger(h.db)] == ['sent', 'sent']
+
+    asyncio.run(scenario())
+
+def test_failed_new_debt_reminder_is_retried_by_the_next_sweep(harness):
+    h = harness(at('2026-01-10', 12))
+    h.bot.blocked.add(1)
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        debt_id = h.db.add_debt(1, 'اجاره', 5000, '2026-01-11')
+        h.service.notify_debt_added(1, debt_id, '2026-01-11')
+        await h.settle()
+        assert h.bot.sent == []
+        # The claim was released rather than recorded as sent
+        assert ledger(h.db) == []
+
+        # Startup ran the overdue daily job, so its sweep follows ten minutes later
+        h.bot.blocked.clear()
+        await h.advance_to(at('2026-01-10', 12, 10))
+        assert len(h.bot.sent) == 1
+        assert ledger(h.db) == [(f'debt:{debt_id}', '2026-01-10', 'sent')]
+
+    asyncio.run(scenario())
+
+def test_reminder_added_sooner_moves_the_custom_deadline(harness):
+    h = harness(at('2026-01-10', 12))
+    h.db.add_reminder(1, 'تمدید بیمه', '2026-01-20')
+
+    async def scenario():
+        h.service.start_scheduler()
+        await h.settle()
+        assert (at('2026-01-19', 9), 'custom') in h.service.pending_schedule()
+
+        # A later reminder leaves the deadline alone, a sooner one pulls it in
+        h.service.notify_reminder_added('2026-01-25')
+        assert (at('2026-01-19', 9), 'custom') in h.service.pending_schedule()
+        h.service.notify_reminder_added('2026-01-14')
+        assert (at('2026-01-13', 9), 'custom') in h.service.pending_schedule()
+
+        # Due tomorrow: fires right away without the clock moving
+        h.db.add_reminder(1, 'قبض برق', '2026-01-11')
+        h.service.notify_reminder_added('2026-01-11')
+        await h.settle()
+        assert len(h.bot.sent) == 1
+        assert 'قبض برق' in texts(h)[0]
+        # Re-armed for the remaining reminder
+        assert (at('2026-01-19', 9), 'custom') in h.service.pending_schedule()
+
+    asyncio.run(scenario())
+
+def test_pending_schedule_lists_jobs_earliest_first(harness):
+    h = harness(at('2026-01-10', 8))
+
+    async def scenario():
+        assert h.service.pending_schedule() == []
+        h.service.start_scheduler()
+        await h.settle()
+        assert h.service.pending_schedule() == [
+            (at('2026-01-10', 9), 'daily'),
+            (at('2026-01-11', 0, 5), 'rollover'),
+        ]
+        h.service.stop_scheduler()
+
+    asyncio.run(scenario())
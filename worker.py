@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+کارگر یادآور - Reminder Worker
+Runs the reminder scheduler without the Telegram polling bot.
+
+Any number of workers can share the database. Users are split into
+REMINDER_SHARDS shards by user_id and every worker serves only the shards
+it holds a lease on; a crashed worker's shards are taken over by the
+others once its leases expire.
+"""
+
+import os
+import asyncio
+import socket
+import uuid
+from typing import Any, Dict, Optional
+from telegram import Bot
+from database import Database
+from async_database import AsyncDatabase
+from debt_manager import DebtManager
+from reminder_service import ReminderService
+from metrics import MetricsExporter, exporter_config, instrument_database
+
+DEFAULT_SHARDS = 4
+LEASE_SECONDS = 60
+
+class ReminderWorker:
+    def __init__(self, token: str, shard_count: int = DEFAULT_SHARDS,
+                 lease_seconds: float = LEASE_SECONDS, metrics: Optional[Dict[str, Any]] = None,
+                 due_index: bool = False):
+        self.token = token
+        self.shard_count = shard_count
+        self.lease_seconds = lease_seconds
+        self.due_index = due_index
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.db = instrument_database(Database())
+        self.async_db = AsyncDatabase(self.db)
+        self.exporter = MetricsExporter(**(metrics or {}))
+
+    async def _acquire_shards(self):
+        return await self.async_db.run(self.db.acquire_shards, self.owner,
+                                       self.shard_count, self.lease_seconds)
+
+    async def run(self):
+        """Hold shard leases and serve reminders for them until cancelled"""
+        async with Bot(self.token) as bot:
+            service = ReminderService(bot, self.async_db, DebtManager(self.db),
+                                      shard_count=self.shard_count, due_index=self.due_index)
+            service.set_shards(await self._acquire_shards())
+            service.start_scheduler()
+            await self.exporter.start()
+            print(f"🔔 کارگر یادآور {self.owner} شروع به کار کرد (shards: {service.shards})")
+            try:
+                while True:
+                    # Renew well before the lease runs out
+                    await asyncio.sleep(self.lease_seconds / 3)
+                    shards = await self._acquire_shards()
+                    if shards != service.shards:
+                        print(f"Worker {self.owner} now holds shards {shards}")
+                    service.set_shards(shards)
+            finally:
+                service.stop_scheduler()
+                await self.exporter.stop()
+                await self.async_db.run(self.db.release_shards, self.owner)
+                self.async_db.close()
+
+async def main():
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        print("❌ خطا: متغیر محیطی TELEGRAM_BOT_TOKEN تنظیم نشده است.")
+        return
+
+    shard_count = int(os.getenv('REMINDER_SHARDS', DEFAULT_SHARDS))
+    due_index = os.getenv('REMINDER_DUE_INDEX', '0').lower() in ('1', 'true', 'yes', 'on')
+    await ReminderWorker(token, shard_count, metrics=exporter_config(), due_index=due_index).run()
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n🛑 کارگر یادآور متوقف شد.")